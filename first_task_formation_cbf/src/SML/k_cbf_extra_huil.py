@@ -28,7 +28,8 @@ from tf.transformations import euler_from_quaternion
 from std_msgs.msg import Float64
 
 import numpy as np
-from scipy.optimize import minimize, LinearConstraint
+
+from qp_solver import AnytimeQPSolver
 
 
 class KCBFExtraHuIL():
@@ -238,6 +239,10 @@ class KCBFExtraHuIL():
         loop_frequency = 50
         r = rospy.Rate(loop_frequency)
 
+        #CBF-QP solver with a time budget of half a loop period, it always returns
+        #a feasible (possibly suboptimal) command by then
+        cbf_qp = AnytimeQPSolver(time_budget=0.5/loop_frequency)
+
         rospy.sleep(1)
 
         rospy.loginfo("CBF-Formation controller Centralized Initialized for nexus"+str(robots_number)+
@@ -333,13 +338,15 @@ class KCBFExtraHuIL():
                     cbf_cm_pub[i].publish(cbf_cm_msg)
                     cbf_oa_pub[i].publish(cbf_oa_msg)
 
-                    grad_h_value_cm = np.transpose(self.cbf_gradh(p[aux_i], p[aux_j], 1))
-                    grad_h_value_oa = np.transpose(self.cbf_gradh(p[aux_i], p[aux_j], -1))
-
-                    A_cm[i, 2*aux_i:2*aux_i+2] = grad_h_value_cm
-                    A_cm[i, 2*aux_j:2*aux_j+2] = -grad_h_value_cm
-                    A_oa[i, 2*aux_i:2*aux_i+2] = grad_h_value_oa
-                    A_oa[i, 2*aux_j:2*aux_j+2] = -grad_h_value_oa
+                    #Gradient rows only for the active families
+                    if cbf_cm:
+                        grad_h_value_cm = np.transpose(self.cbf_gradh(p[aux_i], p[aux_j], 1))
+                        A_cm[i, 2*aux_i:2*aux_i+2] = grad_h_value_cm
+                        A_cm[i, 2*aux_j:2*aux_j+2] = -grad_h_value_cm
+                    if cbf_oa:
+                        grad_h_value_oa = np.transpose(self.cbf_gradh(p[aux_i], p[aux_j], -1))
+                        A_oa[i, 2*aux_i:2*aux_i+2] = grad_h_value_oa
+                        A_oa[i, 2*aux_j:2*aux_j+2] = -grad_h_value_oa
 
                 A_obstacle = np.zeros((number_robots, number_robots*n))
                 b_obstacle = np.zeros((number_robots))
@@ -370,24 +377,24 @@ class KCBFExtraHuIL():
                 #----------------------------
                 # Solve minimization problem
                 #----------------------------
-                #Define linear constraints
-                constraint_cm = LinearConstraint(A_cm*cbf_cm, lb=-b_cm*cbf_cm, ub=np.inf)
-                constraint_oa = LinearConstraint(A_oa*cbf_oa, lb=-b_oa*cbf_oa, ub=np.inf)
-                constraint_arena = LinearConstraint(A_arena, lb=-b_arena, ub=np.inf)
-                constraint_obstacle = LinearConstraint(A_obstacle, lb=-b_obstacle, ub=np.inf)
-                constraint_extra = LinearConstraint(A_extra, lb=-b_extra, ub=np.inf)
+                #Stack linear constraints of the active families as A u >= -b
+                #(the disabled CM/OA rows are left out instead of zeroed)
+                A_families = []
+                b_families = []
+                if cbf_cm:
+                    A_families.append(A_cm)
+                    b_families.append(b_cm)
+                if cbf_oa:
+                    A_families.append(A_oa)
+                    b_families.append(b_oa)
+                A = np.vstack(A_families + [A_arena, A_obstacle, A_extra])
+                b = np.concatenate(b_families + [b_arena, b_obstacle, b_extra])
                 
-                #Define objective function
-                def objective_function(u, u_n):
-                    return np.linalg.norm(u - u_n)**2
-                
-                #Construct the problem
-                u = minimize(
-                    objective_function,
-                    x0=u_n,
-                    args=(u_n,),
-                    constraints=[constraint_cm, constraint_oa, constraint_arena, constraint_obstacle, constraint_extra],
-                )
+                #Project the nominal controller onto the safe set within the time budget
+                u = cbf_qp.solve(u_n, A, b)
+                if not u.success:
+                    rospy.logwarn("CBF-QP: "+u.message+" after "+str(round(1000*u.solve_time, 2))+" ms, feasible command "+
+                                  str(u.feasible)+" (violation "+str(u.prim_res)+", stationarity "+str(u.dual_res)+")")
 
                 #-------------
                 # Send output
@@ -448,6 +455,11 @@ class KCBFExtraHuIL():
             #---------------------------------
             r.sleep()
 
+        qp_stats = cbf_qp.stats()
+        rospy.loginfo("CBF-QP reached the time limit in "+str(qp_stats["timeouts"])+" of "+str(qp_stats["solves"])+" solves ("+
+                      str(qp_stats["unsafe"])+" without a feasible command), "+str(round(1000*qp_stats["mean_solve_time"], 2))+
+                      " ms per solve, "+str(round(1000*qp_stats["max_solve_time"], 2))+" ms at most")
+
     #=====================================
     #          Callback function 
     #      for robot pose feedback
@@ -75,6 +75,8 @@ class KCBFExtraHuILDist():
             for j in neighbours[i]:
                 if (i+1,j) not in edges and (j,i+1) not in edges:
                     edges.append((i+1,j))
+        edge_i = np.array([edge[0]-1 for edge in edges], dtype=int)
+        edge_j = np.array([edge[1]-1 for edge in edges], dtype=int)
 
         #Get the ideal positions of the formation
         formation_positions = rospy.get_param('/formation_positions')
@@ -324,53 +326,55 @@ class KCBFExtraHuILDist():
                 #Compute CBF constrained controller - Distributed
                 u = np.zeros((dim*number_robots, 1))
                 c = np.zeros((number_robots, 1))
-                a = np.zeros((dim*number_robots, 1))
-                b = np.zeros((number_robots, 1))
+                #Collective constraints, evaluated once per edge and added to both of its
+                #robots through the signed incidence (a gets + at the tail and - at the head)
+                rel = x[edge_i] - x[edge_j]
+                h_cm = d_cm**2 - np.sum(rel*rel, axis=1)
+                h_oa = -(d_oa**2 - np.sum(rel*rel, axis=1))
+                exp_cm = np.exp(-p*h_cm)
+                exp_oa = np.exp(-p*h_oa)
+                a_edges = (cm*np.nan_to_num((-p*exp_cm)[:, None]*(-2*rel)) +
+                    oa*np.nan_to_num((-p*exp_oa)[:, None]*(2*rel)))
+                b_edges = (cm*np.nan_to_num(-alpha/2*(1/num_constraints-exp_cm)) +
+                    oa*np.nan_to_num(-alpha/2*(1/num_constraints-exp_oa)))
+                a = np.zeros((number_robots, dim))
+                b = np.zeros(number_robots)
+                np.add.at(a, edge_i, a_edges)
+                np.add.at(a, edge_j, -a_edges)
+                np.add.at(b, edge_i, b_edges)
+                np.add.at(b, edge_j, b_edges)
+                a = a.reshape((dim*number_robots, 1))
+                b = b.reshape((number_robots, 1))
                 for i in range(number_robots):
 
-                    # Collective constraints
-                    for e in range(len(edges)):
-                        aux_i = edges[e][0]-1
-                        aux_j = edges[e][1]-1
-
-                        if i == aux_i:
-                            # CM
-                            a[2*i:2*i+2] += cm*np.nan_to_num(-p*np.exp(-p*self.cbf_h(x[aux_i], x[aux_j], d_cm, 1))*self.cbf_gradh(x[aux_i], x[aux_j], 1))
-                            b[i] += cm*np.nan_to_num(-alpha/2*(1/num_constraints-np.exp(-p*self.cbf_h(x[aux_i], x[aux_j], d_cm, 1))))
-                            # OA
-                            a[2*i:2*i+2] += oa*np.nan_to_num(-p*np.exp(-p*self.cbf_h(x[aux_i], x[aux_j], d_oa, -1))*self.cbf_gradh(x[aux_i], x[aux_j], -1))
-                            b[i] += oa*np.nan_to_num(-alpha/2*(1/num_constraints-np.exp(-p*self.cbf_h(x[aux_i], x[aux_j], d_oa, -1))))
-                        elif i == aux_j:
-                            # CM
-                            a[2*i:2*i+2] += cm*np.nan_to_num(-p*np.exp(-p*self.cbf_h(x[aux_i], x[aux_j], d_cm, 1))*self.cbf_gradh(x[aux_j], x[aux_i], 1))
-                            b[i] += cm*np.nan_to_num(-alpha/2*(1/num_constraints-np.exp(-p*self.cbf_h(x[aux_i], x[aux_j], d_cm, 1))))
-                            # OA
-                            a[2*i:2*i+2] += oa*np.nan_to_num(-p*np.exp(-p*self.cbf_h(x[aux_i], x[aux_j], d_oa, -1))*self.cbf_gradh(x[aux_j], x[aux_i], -1))
-                            b[i] += oa*np.nan_to_num(-alpha/2*(1/num_constraints-np.exp(-p*self.cbf_h(x[aux_i], x[aux_j], d_oa, -1))))
-                        else:
-                            a[2*i:2*i+2] += np.zeros((dim, 1))
-                            b[i] += 0
+                    #CBFs of the robot, evaluated once for the constraints and the messages
+                    h_walls = [self.cbf_walls(x[i], wall) for wall in walls]
+                    h_obstacle = self.cbf_h(x[i], obstacle_x, d_obstacle, -1)
+                    h_extra = self.cbf_h(x[i], huil_x, d_extra, -1)
 
                     # Individual constraints
                     for k in range(len(walls)):
                         # Arena walls
-                        a[2*i:2*i+2] += arena*np.nan_to_num(-p*np.exp(-p*self.cbf_walls(x[i], walls[k]))*wall_grad[:,k].reshape(2, 1))
-                        b[i] += arena*np.nan_to_num(-alpha*(1/num_constraints-np.exp(-p*self.cbf_walls(x[i], walls[k]))))
+                        exp_wall = np.exp(-p*h_walls[k])
+                        a[2*i:2*i+2] += arena*np.nan_to_num(-p*exp_wall*wall_grad[:,k].reshape(2, 1))
+                        b[i] += arena*np.nan_to_num(-alpha*(1/num_constraints-exp_wall))
                     # Mid-point obstacle
-                    a[2*i:2*i+2] += obstacle*np.nan_to_num(-p*np.exp(-p*self.cbf_h(x[i], obstacle_x, d_obstacle, -1))*self.cbf_gradh(x[i], obstacle_x, -1))
-                    b[i] += obstacle*np.nan_to_num(-alpha*(1/num_constraints-np.exp(-p*self.cbf_h(x[i], obstacle_x, d_obstacle, -1))))
+                    exp_obstacle = np.exp(-p*h_obstacle)
+                    a[2*i:2*i+2] += obstacle*np.nan_to_num(-p*exp_obstacle*self.cbf_gradh(x[i], obstacle_x, -1))
+                    b[i] += obstacle*np.nan_to_num(-alpha*(1/num_constraints-exp_obstacle))
                     # Extra robot avoidance
-                    a[2*i:2*i+2] += extra*np.nan_to_num(-p*np.exp(-p*self.cbf_h(x[i], huil_x, d_extra, -1))*self.cbf_gradh(x[i], huil_x, -1))
-                    b[i] += extra*np.nan_to_num(-alpha*(1/num_constraints-np.exp(-p*self.cbf_h(x[i], huil_x, d_extra, -1))) -
-                        p*np.exp(-p*self.cbf_h(x[i], huil_x, d_extra, -1))*np.dot(np.transpose(self.cbf_gradh(huil_x, x[i], -1)),np.array([vxe,vye])))
+                    exp_extra = np.exp(-p*h_extra)
+                    a[2*i:2*i+2] += extra*np.nan_to_num(-p*exp_extra*self.cbf_gradh(x[i], huil_x, -1))
+                    b[i] += extra*np.nan_to_num(-alpha*(1/num_constraints-exp_extra) -
+                        p*exp_extra*np.dot(np.transpose(self.cbf_gradh(huil_x, x[i], -1)),np.array([vxe,vye])))
 
                     #Publish cbf arena and obstacle function message
-                    cbf_arena_top_msg = self.cbf_walls(x[i], walls[0])
-                    cbf_arena_right_msg = self.cbf_walls(x[i], walls[1])
-                    cbf_arena_bottom_msg = self.cbf_walls(x[i], walls[2])
-                    cbf_arena_left_msg = self.cbf_walls(x[i], walls[3])
-                    cbf_obstacle_msg = self.cbf_h(x[i], obstacle_x, d_obstacle, -1)
-                    cbf_extra_msg = self.cbf_h(x[i], huil_x, d_extra, -1)
+                    cbf_arena_top_msg = h_walls[0]
+                    cbf_arena_right_msg = h_walls[1]
+                    cbf_arena_bottom_msg = h_walls[2]
+                    cbf_arena_left_msg = h_walls[3]
+                    cbf_obstacle_msg = h_obstacle
+                    cbf_extra_msg = h_extra
                     cbf_arena_top_pub[i].publish(cbf_arena_top_msg)
                     cbf_arena_right_pub[i].publish(cbf_arena_right_msg)
                     cbf_arena_bottom_pub[i].publish(cbf_arena_bottom_msg)
@@ -397,11 +401,8 @@ class KCBFExtraHuILDist():
 
                 #Publish cbf CM and OA function message
                 for e in range(len(edges)):
-                    aux_i = edges[e][0]-1
-                    aux_j = edges[e][1]-1
-            
-                    cbf_cm_msg = self.cbf_h(x[aux_i], x[aux_j], d_cm, 1)
-                    cbf_oa_msg = self.cbf_h(x[aux_i], x[aux_j], d_oa, -1)
+                    cbf_cm_msg = h_cm[e]
+                    cbf_oa_msg = h_oa[e]
                     cbf_cm_pub[e].publish(cbf_cm_msg)
                     cbf_oa_pub[e].publish(cbf_oa_msg)
 
@@ -28,7 +28,8 @@ from tf.transformations import euler_from_quaternion
 from std_msgs.msg import Float64
 
 import numpy as np
-from scipy.optimize import minimize, LinearConstraint
+
+from qp_solver import solve_cbf_qp
 
 
 class CBFFormationControllerCentralized():
@@ -245,32 +246,34 @@ class CBFFormationControllerCentralized():
                     cbf_cm_pub[i].publish(cbf_cm_msg)
                     cbf_oa_pub[i].publish(cbf_oa_msg)
 
-                    grad_h_value_cm = np.transpose(self.cbf_gradh(p[aux_i], p[aux_j], 1))
-                    grad_h_value_oa = np.transpose(self.cbf_gradh(p[aux_i], p[aux_j], -1))
-
-                    A_cm[i, 2*aux_i:2*aux_i+2] = grad_h_value_cm
-                    A_cm[i, 2*aux_j:2*aux_j+2] = -grad_h_value_cm
-                    A_oa[i, 2*aux_i:2*aux_i+2] = grad_h_value_oa
-                    A_oa[i, 2*aux_j:2*aux_j+2] = -grad_h_value_oa
+                    #Gradient rows only for the active families
+                    if cbf_cm:
+                        grad_h_value_cm = np.transpose(self.cbf_gradh(p[aux_i], p[aux_j], 1))
+                        A_cm[i, 2*aux_i:2*aux_i+2] = grad_h_value_cm
+                        A_cm[i, 2*aux_j:2*aux_j+2] = -grad_h_value_cm
+                    if cbf_oa:
+                        grad_h_value_oa = np.transpose(self.cbf_gradh(p[aux_i], p[aux_j], -1))
+                        A_oa[i, 2*aux_i:2*aux_i+2] = grad_h_value_oa
+                        A_oa[i, 2*aux_j:2*aux_j+2] = -grad_h_value_oa
 
                 #----------------------------
                 # Solve minimization problem
                 #----------------------------
-                #Define linear constraints
-                constraint_cm = LinearConstraint(A_cm*cbf_cm, lb=-b_cm*cbf_cm, ub=np.inf)
-                constraint_oa = LinearConstraint(A_oa*cbf_oa, lb=-b_oa*cbf_oa, ub=np.inf)
-                
-                #Define objective function
-                def objective_function(u, u_n):
-                    return np.linalg.norm(u - u_n)**2
+                #Stack linear constraints of the active families as A u >= -b
+                #(the disabled CM/OA rows are left out instead of zeroed)
+                A_families = []
+                b_families = []
+                if cbf_cm:
+                    A_families.append(A_cm)
+                    b_families.append(b_cm)
+                if cbf_oa:
+                    A_families.append(A_oa)
+                    b_families.append(b_oa)
+                A = np.vstack(A_families) if A_families else np.zeros((0, number_robots*n))
+                b = np.concatenate(b_families) if b_families else np.zeros(0)
                 
-                #Construct the problem
-                u = minimize(
-                    objective_function,
-                    x0=u_n,
-                    args=(u_n,),
-                    constraints=[constraint_cm, constraint_oa],
-                )
+                #Project the nominal controller onto the safe set
+                u = solve_cbf_qp(u_n, A, b)
 
                 #-------------
                 # Send output
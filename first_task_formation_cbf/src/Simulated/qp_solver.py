@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+
+# To force int division to floats (for Python 2.7)
+from __future__ import division
+
+from timeit import default_timer as timer
+
+import numpy as np
+from scipy import sparse
+from scipy.optimize import OptimizeResult
+
+
+## CBF-QP solver
+
+# Every CBF controller solves
+#     min ||u - u_n||^2   s.t.   A u >= -b
+# which is the euclidean projection of u_n onto a polyhedron. Since the Hessian
+# is the identity, the dual active-set method of Goldfarb-Idnani only needs the
+# normals of the active constraints: it starts at the unconstrained minimum u_n,
+# adds the most violated constraint each iteration and drops the ones whose
+# multipliers would become negative. Every iterate is the exact projection onto
+# the current active set, so the final multipliers are the exact KKT ones.
+# A can be dense or a scipy.sparse matrix, only the active rows are densified.
+
+# Termination status (same convention as scipy.optimize)
+QP_SOLVED = 0
+QP_MAX_ITER = 1
+QP_INFEASIBLE = 2
+QP_TIMEOUT = 3
+
+QP_MESSAGES = {
+    QP_SOLVED: "Optimal solution found",
+    QP_MAX_ITER: "Iteration limit reached",
+    QP_INFEASIBLE: "Constraints are infeasible",
+    QP_TIMEOUT: "Time limit reached",
+}
+
+
+def _rows(A, idx):
+    # Dense copy of the rows idx of A
+    rows = A[idx]
+    if sparse.issparse(rows):
+        rows = rows.toarray()
+    return rows
+
+def _as_matrix(A):
+    # Sparse matrices are row sliced every iteration, so keep them as CSR
+    if sparse.issparse(A):
+        return A.tocsr()
+    return np.asarray(A, dtype=float)
+
+def _dual_active_set(u_n, A, b, u, active, lam, tol, max_iter, deadline=None):
+    # u must be the projection of u_n onto {a_k u = -b_k, k in active} with
+    # multipliers lam >= 0, i.e. u = u_n + A[active]^T lam. The iterations stop
+    # once the timer passes deadline (if given).
+    nit = 0
+    if A.shape[0] == 0:
+        return u, active, lam, nit, QP_SOLVED
+    while True:
+        # Most violated constraint
+        s = A.dot(u) + b
+        p = int(np.argmin(s))
+        if s[p] >= -tol:
+            return u, active, lam, nit, QP_SOLVED
+
+        n_p = _rows(A, [p])[0]
+        lam_p = 0.
+        while True:
+            nit += 1
+            if nit > max_iter:
+                return u, active, lam, nit, QP_MAX_ITER
+            if deadline is not None and timer() > deadline:
+                return u, active, lam, nit, QP_TIMEOUT
+
+            # Primal direction (n_p projected onto the nullspace of the active
+            # normals) and dual direction (least squares coefficients)
+            if active:
+                N = _rows(A, active)
+                r = np.linalg.solve(np.dot(N, N.T), np.dot(N, n_p))
+                z = n_p - np.dot(N.T, r)
+            else:
+                r = np.zeros(0)
+                z = n_p
+
+            # Partial step: largest step keeping the active multipliers >= 0
+            t1 = np.inf
+            k = -1
+            blocking = np.flatnonzero(r > tol)
+            if len(blocking) > 0:
+                ratios = lam[blocking]/r[blocking]
+                k = blocking[np.argmin(ratios)]
+                t1 = ratios.min()
+
+            # Full step: step that makes constraint p active
+            zz = np.dot(z, n_p)
+            t2 = np.inf
+            if zz > tol*max(1., np.dot(n_p, n_p)):
+                t2 = -(np.dot(n_p, u) + b[p])/zz
+
+            if t1 == np.inf and t2 == np.inf:
+                return u, active, lam, nit, QP_INFEASIBLE
+
+            if t2 == np.inf:
+                # Only the multipliers move, drop the blocking constraint
+                lam = lam - t1*r
+                lam_p += t1
+                lam = np.delete(lam, k)
+                del active[k]
+                continue
+
+            t = min(t1, t2)
+            u = u + t*z
+            lam = lam - t*r
+            lam_p += t
+            if t2 <= t1:
+                active.append(p)
+                lam = np.append(lam, lam_p)
+                break
+            lam = np.delete(lam, k)
+            del active[k]
+
+def _qp_result(u, u_n, active, lam, nit, status, m):
+    # Multipliers for the cost ||u - u_n||^2 (twice the ones of the 1/2 cost)
+    lam_full = np.zeros(m)
+    lam_full[active] = 2*lam
+
+    return OptimizeResult(
+        x=u,
+        fun=np.linalg.norm(u - u_n)**2,
+        lam=lam_full,
+        active=np.array(active, dtype=int),
+        nit=nit,
+        status=status,
+        success=(status == QP_SOLVED),
+        message=QP_MESSAGES[status],
+    )
+
+def solve_cbf_qp(u_n, A, b, tol=1e-9, max_iter=None):
+    # Solve min ||u - u_n||^2 s.t. A u >= -b
+    # Returns an OptimizeResult like scipy.optimize.minimize, with the extra
+    # fields lam (KKT multipliers of every row) and active (active rows)
+    u_n = np.asarray(u_n, dtype=float)
+    A = _as_matrix(A)
+    b = np.asarray(b, dtype=float)
+    m = len(b)
+    if max_iter is None:
+        max_iter = 10*(m + len(u_n)) + 10
+
+    if m == 0:
+        return _qp_result(u_n.copy(), u_n, [], np.zeros(0), 0, QP_SOLVED, m)
+
+    u, active, lam, nit, status = _dual_active_set(u_n, A, b, u_n.copy(), [], np.zeros(0), tol, max_iter)
+
+    return _qp_result(u, u_n, active, lam, nit, status, m)
+
+class CBFQPSolver():
+    # Stateful CBF-QP solver for consecutive control cycles. The active set and
+    # multipliers of the previous solve are used to start the next one, which
+    # at 50 Hz is usually already (close to) optimal.
+    def __init__(self, tol=1e-9, max_iter=None):
+        self.tol = tol
+        self.max_iter = max_iter
+        self.reset()
+
+    def reset(self):
+        # Previous solution
+        self.u = None
+        self.active = []
+        self.lam = np.zeros(0)
+        self.m = None
+
+        # Statistics
+        self.solves = 0
+        self.warm_starts = 0
+        self.warm_hits = 0
+        self.iterations = 0
+
+    def _warm_start(self, u_n, A, b):
+        # Project u_n onto the previous active set (as equalities) and drop
+        # constraints with negative multipliers until the point is dual feasible
+        active = list(self.active)
+        while active:
+            N = _rows(A, active)
+            G = np.dot(N, N.T)
+            try:
+                L = np.linalg.cholesky(G)
+            except np.linalg.LinAlgError:
+                break
+            # Rows that became (almost) linearly dependent, restart cold
+            if np.diag(L).min()**2 <= self.tol*np.diag(G).max():
+                break
+
+            lam = np.linalg.solve(G, -b[active] - np.dot(N, u_n))
+            if lam.min() >= 0:
+                return u_n + np.dot(N.T, lam), active, lam
+            del active[int(np.argmin(lam))]
+
+        return u_n.copy(), [], np.zeros(0)
+
+    def solve(self, u_n, A, b):
+        # Same interface and result as solve_cbf_qp
+        u_n = np.asarray(u_n, dtype=float)
+        A = _as_matrix(A)
+        b = np.asarray(b, dtype=float)
+        m = len(b)
+        max_iter = self.max_iter
+        if max_iter is None:
+            max_iter = 10*(m + len(u_n)) + 10
+
+        if m == 0:
+            return _qp_result(u_n.copy(), u_n, [], np.zeros(0), 0, QP_SOLVED, m)
+
+        # The active set can only be reused if the constraint rows are the same
+        if m == self.m and self.active:
+            u, active, lam = self._warm_start(u_n, A, b)
+        else:
+            u, active, lam = u_n.copy(), [], np.zeros(0)
+        warm = len(active) > 0
+
+        u, active, lam, nit, status = _dual_active_set(u_n, A, b, u, active, lam, self.tol, max_iter)
+
+        self.solves += 1
+        self.iterations += nit
+        if warm:
+            self.warm_starts += 1
+            if nit == 0:
+                self.warm_hits += 1
+
+        # Keep the solution only if it is a valid starting point
+        if status == QP_SOLVED:
+            self.u = u
+            self.active = list(active)
+            self.lam = lam
+            self.m = m
+        else:
+            self.active = []
+
+        return _qp_result(u, u_n, active, lam, nit, status, m)
+
+    def stats(self):
+        solves = max(self.solves, 1)
+        return {
+            "solves": self.solves,
+            "warm_starts": self.warm_starts,
+            "warm_hits": self.warm_hits,
+            "warm_start_rate": self.warm_starts/solves,
+            "warm_hit_rate": self.warm_hits/solves,
+            "mean_iterations": self.iterations/solves,
+        }
+
+
+## Anytime solver
+
+# In the real-time loops a slow solve must not stretch the control cycle. The
+# dual iterates are only feasible once the method has finished, so when the
+# time budget runs out the command is taken from the last feasible command (or
+# the zero command) by moving along the segment towards the current dual
+# iterate as far as every constraint allows. The partial active set is kept to
+# warm start the next cycle, which continues where this one stopped.
+
+class AnytimeQPSolver(CBFQPSolver):
+    # Warm started solver with a time budget (seconds) per solve. The result has
+    # the extra fields feasible, prim_res (largest constraint violation),
+    # dual_res (stationarity residual) and solve_time.
+    def __init__(self, time_budget=0.01, tol=1e-9, max_iter=None):
+        self.time_budget = time_budget
+        CBFQPSolver.__init__(self, tol, max_iter)
+
+    def reset(self):
+        CBFQPSolver.reset(self)
+        self.u_safe = None
+        self.timeouts = 0
+        self.fallbacks = 0
+        self.unsafe = 0
+        self.solve_time = 0.
+        self.max_solve_time = 0.
+
+    def _fallback(self, u_n, A, b, u):
+        # Best feasible point on the segments from the safe candidates to u
+        s_u = A.dot(u) + b
+        best = None
+        best_violation = np.inf
+        for c in (self.u_safe, np.zeros(len(u_n))):
+            if c is None or len(c) != len(u_n):
+                continue
+            s_c = A.dot(c) + b
+            violation = max(0., -s_c.min())
+            if violation > self.tol:
+                # Keep the least violating candidate in case none is feasible
+                if best_violation > self.tol and violation < best_violation:
+                    best, best_violation = c, violation
+                continue
+
+            # Largest step towards u keeping every row satisfied
+            d = s_u - s_c
+            blocking = d < 0
+            t = 1.
+            if blocking.any():
+                t = min(1., np.min(np.maximum(s_c[blocking], 0)/-d[blocking]))
+            x = c + t*(u - c)
+            if best_violation > self.tol or np.linalg.norm(x - u_n) < np.linalg.norm(best - u_n):
+                best, best_violation = x, 0.
+
+        return best
+
+    def solve(self, u_n, A, b, time_budget=None):
+        # Same interface and result as solve_cbf_qp, time_budget overrides the
+        # budget of this call
+        start = timer()
+        if time_budget is None:
+            time_budget = self.time_budget
+        u_n = np.asarray(u_n, dtype=float)
+        A = _as_matrix(A)
+        b = np.asarray(b, dtype=float)
+        m = len(b)
+        max_iter = self.max_iter
+        if max_iter is None:
+            max_iter = 10*(m + len(u_n)) + 10
+
+        if m == 0:
+            u, active, lam, nit, status = u_n.copy(), [], np.zeros(0), 0, QP_SOLVED
+        else:
+            if m == self.m and self.active:
+                u, active, lam = self._warm_start(u_n, A, b)
+            else:
+                u, active, lam = u_n.copy(), [], np.zeros(0)
+            warm = len(active) > 0
+
+            u, active, lam, nit, status = _dual_active_set(u_n, A, b, u, active, lam, self.tol, max_iter, start + time_budget)
+
+            self.iterations += nit
+            if warm:
+                self.warm_starts += 1
+                if nit == 0:
+                    self.warm_hits += 1
+
+        # A stopped dual iterate is still a valid warm start
+        if status in (QP_SOLVED, QP_TIMEOUT):
+            self.active = list(active)
+            self.lam = lam
+            self.m = m
+        else:
+            self.active = []
+        result = _qp_result(u, u_n, active, lam, nit, status, m)
+
+        # Unfinished solve, replace the command by a feasible one
+        if status != QP_SOLVED and m > 0:
+            if status == QP_TIMEOUT:
+                self.timeouts += 1
+            x = self._fallback(u_n, A, b, u)
+            if x is not None:
+                result.x = x
+                result.fun = np.linalg.norm(x - u_n)**2
+            self.fallbacks += 1
+
+        result.prim_res = max(0., -(A.dot(result.x) + b).min()) if m > 0 else 0.
+        result.dual_res = np.abs(result.x - u_n - (np.dot(_rows(A, active).T, lam) if active else 0.)).max()
+        result.feasible = result.prim_res <= self.tol
+        if result.feasible:
+            self.u_safe = result.x
+        else:
+            self.unsafe += 1
+
+        self.solves += 1
+        result.solve_time = timer() - start
+        self.solve_time += result.solve_time
+        self.max_solve_time = max(self.max_solve_time, result.solve_time)
+
+        return result
+
+    def stats(self):
+        stats = CBFQPSolver.stats(self)
+        solves = max(self.solves, 1)
+        stats["timeouts"] = self.timeouts
+        stats["fallbacks"] = self.fallbacks
+        stats["unsafe"] = self.unsafe
+        stats["mean_solve_time"] = self.solve_time/solves
+        stats["max_solve_time"] = self.max_solve_time
+        return stats
@@ -4,19 +4,32 @@
 from __future__ import division
 
 import numpy as np
-from scipy.optimize import minimize, LinearConstraint
+import scipy.sparse as sp
 
+from qp_solver import solve_cbf_qp
+from state import padAxes
 
-## Auxiliary functions
 
-def formationController(L_G, p, p_d):
-    # Create extended laplacian
-    I = np.identity(2)
-    L_ext = np.kron(L_G,I)
+## Auxiliary functions
 
-    # Compute formation controller
-    u = -np.dot(L_ext,p-p_d)
-    return u
+def laplacian(neighbours):
+    # Sparse (CSR) Laplacian of the graph from the neighbour lists (starting at 1)
+    rows, cols, values = [], [], []
+    for i in range(len(neighbours)):
+        rows.append(i)
+        cols.append(i)
+        values.append(len(neighbours[i]))
+        for j in neighbours[i]:
+            rows.append(i)
+            cols.append(j-1)
+            values.append(-1)
+    return sp.csr_matrix((values, (rows, cols)), shape=(len(neighbours), len(neighbours)), dtype=float)
+
+def formationController(L_G, P, P_d):
+    # Compute formation controller -L_G (P - P_d) on the (N, dim) positions,
+    # same as the extended laplacian kron(L_G, I) on the flat layout but
+    # O(edges) with a sparse L_G
+    return np.asarray(-L_G.dot(P-P_d))
 
 def huilController(u_nom, huil, human_robot, i, max_time_size, v_huil, division):
     # Leave some time at the start and the end to allow the robots to form
@@ -43,12 +56,12 @@ def huilController(u_nom, huil, human_robot, i, max_time_size, v_huil, division)
             u_huil_x = 0
             u_huil_y = 0
     
-    u_nom[2*human_robot-2] += u_huil_x
-    u_nom[2*human_robot-1] += u_huil_y
+    u_nom[human_robot-1, 0] += u_huil_x
+    u_nom[human_robot-1, 1] += u_huil_y
 
     return u_nom
 
-def extraRobotDynamics(i, max_time_size, v_huil, division):
+def extraRobotDynamics(i, max_time_size, v_huil, division, dim=2):
     # Leave some time at the start and the end to allow the robots to form
     max_time = max_time_size*(1-2/division)
     i = i - max_time_size/division
@@ -72,7 +85,7 @@ def extraRobotDynamics(i, max_time_size, v_huil, division):
         u_huil_x = 0
         u_huil_y = 0
 
-    return np.array([u_huil_x, u_huil_y])
+    return padAxes([u_huil_x, u_huil_y], dim)
 
 def cbf_h(p_i, p_j, safe_distance, dir):
     # Dir 1 corresponds to CM and -1 to OA
@@ -82,221 +95,53 @@ def cbf_gradh(p_i, p_j, dir):
     # Dir 1 corresponds to CM and -1 to OA
     return dir*(-2*np.array([[p_i[0]-p_j[0]], [p_i[1]-p_j[1]]]))
 
-def cbfController(p, u_n, cm, oa, d_cm, d_oa, number_robots, edges, n, alpha):
-    #Create CBF constraint matrices
-    A_cm = np.zeros((len(edges), number_robots*n))
-    b_cm = np.zeros((len(edges)))
-    A_oa = np.zeros((len(edges), number_robots*n))
-    b_oa = np.zeros((len(edges)))
-    for i in range(len(edges)):
-        aux_i = edges[i][0]-1
-        aux_j = edges[i][1]-1
-        p_i = np.array([p[2*aux_i],p[2*aux_i+1]])
-        p_j = np.array([p[2*aux_j],p[2*aux_j+1]])
+def edgeIndex(edges):
+    # (E, 2) array of zero based robot indices from the list of edges
+    return np.array(edges, dtype=int).reshape(-1, 2) - 1
 
-        b_cm[i] = alpha*cbf_h(p_i, p_j, d_cm, 1)
-        b_oa[i] = alpha*cbf_h(p_i, p_j, d_oa, -1)
+def edgeGeometry(state, edge_idx):
+    # Relative positions and squared distances of all edges for the positions
+    # state["P"], computed once per step and shared through the state dict
+    key = ("edges", id(edge_idx))
+    if key not in state:
+        P = state["P"]
+        diff = P[edge_idx[:, 0]] - P[edge_idx[:, 1]]
+        state[key] = (diff, np.einsum('ij,ij->i', diff, diff))
 
-        grad_h_value_cm = np.transpose(cbf_gradh(p_i, p_j, 1))
-        grad_h_value_oa = np.transpose(cbf_gradh(p_i, p_j, -1))
+    return state[key]
 
-        A_cm[i, 2*aux_i:2*aux_i+2] = grad_h_value_cm
-        A_cm[i, 2*aux_j:2*aux_j+2] = -grad_h_value_cm
-        A_oa[i, 2*aux_i:2*aux_i+2] = grad_h_value_oa
-        A_oa[i, 2*aux_j:2*aux_j+2] = -grad_h_value_oa
+def cbfArena(P, alpha, x_max, x_min, y_max, y_min):
+    # Arena CBFs of every robot, ordered as the rows of A_arena
+    return alpha*np.column_stack((x_max - P[:, 0], P[:, 0] - x_min, y_max - P[:, 1], P[:, 1] - y_min)).ravel()
 
-    #----------------------------
-    # Solve minimization problem
-    #----------------------------
-    #Define linear constraints
-    constraint_cm = LinearConstraint(A_cm*cm, lb=-b_cm*cm, ub=np.inf)
-    constraint_oa = LinearConstraint(A_oa*oa, lb=-b_oa*oa, ub=np.inf)
-    
-    #Define objective function
-    def objective_function(u, u_n):
-        return np.linalg.norm(u - u_n)**2
-    
-    #Construct the problem
-    u = minimize(
-        objective_function,
-        x0=u_n,
-        args=(u_n,),
-        constraints=[constraint_cm, constraint_oa],
-    )
-
-    return u.x, b_cm, b_oa
-
-def cbfControllerWArena(p, u_n, cm, oa, d_cm, d_oa, number_robots, edges, n, alpha, A_arena, b_arena, x_max, x_min, y_max, y_min):
-    #Create CBF constraint matrices
-    A_cm = np.zeros((len(edges), number_robots*n))
-    b_cm = np.zeros((len(edges)))
-    A_oa = np.zeros((len(edges), number_robots*n))
-    b_oa = np.zeros((len(edges)))
-    for i in range(len(edges)):
-        aux_i = edges[i][0]-1
-        aux_j = edges[i][1]-1
-        p_i = np.array([p[2*aux_i],p[2*aux_i+1]])
-        p_j = np.array([p[2*aux_j],p[2*aux_j+1]])
+def cbfWedge(P, alpha, x_max, y_max):
+    # Wedge CBFs of every robot, ordered as the rows of A_wedge
+    slope = -y_max/(2*x_max)*P[:, 0]
+    return alpha*np.column_stack((slope + y_max/2 - P[:, 1], P[:, 1] + slope + y_max/2)).ravel()
 
-        b_cm[i] = alpha*cbf_h(p_i, p_j, d_cm, 1)
-        b_oa[i] = alpha*cbf_h(p_i, p_j, d_oa, -1)
+def cbfExtraKernel(P, huil_p, d_extra, alpha, vxe, vye):
+    # Extra robot avoidance CBF for every robot (worst case extra robot speed)
+    diff = P - huil_p
+    grad_extra = 2*diff
+    b_extra = -alpha*(d_extra**2 - np.einsum('ij,ij->i', diff, diff)) - np.dot(grad_extra, padAxes([vxe, vye], P.shape[-1]))
 
-        grad_h_value_cm = np.transpose(cbf_gradh(p_i, p_j, 1))
-        grad_h_value_oa = np.transpose(cbf_gradh(p_i, p_j, -1))
+    return b_extra, grad_extra
 
-        A_cm[i, 2*aux_i:2*aux_i+2] = grad_h_value_cm
-        A_cm[i, 2*aux_j:2*aux_j+2] = -grad_h_value_cm
-        A_oa[i, 2*aux_i:2*aux_i+2] = grad_h_value_oa
-        A_oa[i, 2*aux_j:2*aux_j+2] = -grad_h_value_oa
-
-    #Calculate CBF for arena safety
-    for i in range(number_robots):
-        b_arena[4*i] = alpha*(x_max - p[2*i])
-        b_arena[4*i+1] = alpha*(p[2*i] - x_min)
-        b_arena[4*i+2] = alpha*(y_max - p[2*i+1])
-        b_arena[4*i+3] = alpha*(p[2*i+1] - y_min)
+def cbfController(p, u_n, constraints, solver=None, profiler=None, **signals):
+    #Refresh the registered CBF constraints for the current state
+    A, b = constraints.update(p, **signals)
+    if profiler is not None:
+        profiler.lap("constraints")
 
     #----------------------------
     # Solve minimization problem
     #----------------------------
-    #Define linear constraints
-    constraint_cm = LinearConstraint(A_cm*cm, lb=-b_cm*cm, ub=np.inf)
-    constraint_oa = LinearConstraint(A_oa*oa, lb=-b_oa*oa, ub=np.inf)
-    constraint_arena = LinearConstraint(A_arena, lb=-b_arena, ub=np.inf)
-    
-    #Define objective function
-    def objective_function(u, u_n):
-        return np.linalg.norm(u - u_n)**2
-    
-    #Construct the problem
-    u = minimize(
-        objective_function,
-        x0=u_n,
-        args=(u_n,),
-        constraints=[constraint_cm, constraint_oa, constraint_arena],
-    )
-
-    return u.x, b_cm, b_oa
-
-def cbfControllerWArenaWedge(p, u_n, cm, oa, d_cm, d_oa, number_robots, edges, n, alpha, A_arena, b_arena, x_max, x_min, y_max, y_min, A_wedge, b_wedge):
-    #Create CBF constraint matrices
-    A_cm = np.zeros((len(edges), number_robots*n))
-    b_cm = np.zeros((len(edges)))
-    A_oa = np.zeros((len(edges), number_robots*n))
-    b_oa = np.zeros((len(edges)))
-    for i in range(len(edges)):
-        aux_i = edges[i][0]-1
-        aux_j = edges[i][1]-1
-        p_i = np.array([p[2*aux_i],p[2*aux_i+1]])
-        p_j = np.array([p[2*aux_j],p[2*aux_j+1]])
-
-        b_cm[i] = alpha*cbf_h(p_i, p_j, d_cm, 1)
-        b_oa[i] = alpha*cbf_h(p_i, p_j, d_oa, -1)
-
-        grad_h_value_cm = np.transpose(cbf_gradh(p_i, p_j, 1))
-        grad_h_value_oa = np.transpose(cbf_gradh(p_i, p_j, -1))
-
-        A_cm[i, 2*aux_i:2*aux_i+2] = grad_h_value_cm
-        A_cm[i, 2*aux_j:2*aux_j+2] = -grad_h_value_cm
-        A_oa[i, 2*aux_i:2*aux_i+2] = grad_h_value_oa
-        A_oa[i, 2*aux_j:2*aux_j+2] = -grad_h_value_oa
-
-    #Calculate CBF for arena safety
-    for i in range(number_robots):
-        b_arena[4*i] = alpha*(x_max - p[2*i])
-        b_arena[4*i+1] = alpha*(p[2*i] - x_min)
-        b_arena[4*i+2] = alpha*(y_max - p[2*i+1])
-        b_arena[4*i+3] = alpha*(p[2*i+1] - y_min)
-
-    #Calculate CBF for wedge
-    for i in range(number_robots):
-        b_wedge[2*i] = alpha*(-y_max/(2*x_max)*p[2*i] + y_max/2 - p[2*i+1])
-        b_wedge[2*i+1] = alpha*(p[2*i+1] - y_max/(2*x_max)*p[2*i] + y_max/2)
-
-    #----------------------------
-    # Solve minimization problem
-    #----------------------------
-    #Define linear constraints
-    constraint_cm = LinearConstraint(A_cm*cm, lb=-b_cm*cm, ub=np.inf)
-    constraint_oa = LinearConstraint(A_oa*oa, lb=-b_oa*oa, ub=np.inf)
-    constraint_arena = LinearConstraint(A_arena, lb=-b_arena, ub=np.inf)
-    constraint_wedge = LinearConstraint(A_wedge, lb=-b_wedge, ub=np.inf)
-    
-    #Define objective function
-    def objective_function(u, u_n):
-        return np.linalg.norm(u - u_n)**2
-    
-    #Construct the problem
-    u = minimize(
-        objective_function,
-        x0=u_n,
-        args=(u_n,),
-        constraints=[constraint_cm, constraint_oa, constraint_arena, constraint_wedge],
-    )
-
-    return u.x, b_cm, b_oa, b_wedge
-
-def cbfControllerWArenaExtra(p, u_n, cm, oa, d_cm, d_oa, number_robots, edges, n, alpha, A_arena, b_arena, x_max, x_min, y_max, y_min, A_extra, b_extra, d_extra, huil_p, vxe, vye):
-    #Create CBF constraint matrices
-    A_cm = np.zeros((len(edges), number_robots*n))
-    b_cm = np.zeros((len(edges)))
-    A_oa = np.zeros((len(edges), number_robots*n))
-    b_oa = np.zeros((len(edges)))
-    for i in range(len(edges)):
-        aux_i = edges[i][0]-1
-        aux_j = edges[i][1]-1
-        p_i = np.array([p[2*aux_i],p[2*aux_i+1]])
-        p_j = np.array([p[2*aux_j],p[2*aux_j+1]])
-
-        b_cm[i] = alpha*cbf_h(p_i, p_j, d_cm, 1)
-        b_oa[i] = alpha*cbf_h(p_i, p_j, d_oa, -1)
-
-        grad_h_value_cm = np.transpose(cbf_gradh(p_i, p_j, 1))
-        grad_h_value_oa = np.transpose(cbf_gradh(p_i, p_j, -1))
-
-        A_cm[i, 2*aux_i:2*aux_i+2] = grad_h_value_cm
-        A_cm[i, 2*aux_j:2*aux_j+2] = -grad_h_value_cm
-        A_oa[i, 2*aux_i:2*aux_i+2] = grad_h_value_oa
-        A_oa[i, 2*aux_j:2*aux_j+2] = -grad_h_value_oa
-
-    #Calculate CBF for arena safety
-    for i in range(number_robots):
-        b_arena[4*i] = alpha*(x_max - p[2*i])
-        b_arena[4*i+1] = alpha*(p[2*i] - x_min)
-        b_arena[4*i+2] = alpha*(y_max - p[2*i+1])
-        b_arena[4*i+3] = alpha*(p[2*i+1] - y_min)
-
-        A_extra[i, 2*i:2*i+2] = 2*np.array([p[2*i]-huil_p[0], p[2*i+1]-huil_p[1]])
-        b_extra[i] = alpha*cbf_h(np.array([p[2*i],p[2*i+1]]), huil_p, d_extra, -1) - 2*(p[2*i]-huil_p[0])*vxe - 2*(p[2*i+1]-huil_p[1])*vye
-
-    #----------------------------
-    # Solve minimization problem
-    #----------------------------
-    #Define linear constraints
-    constraint_cm = LinearConstraint(A_cm*cm, lb=-b_cm*cm, ub=np.inf)
-    constraint_oa = LinearConstraint(A_oa*oa, lb=-b_oa*oa, ub=np.inf)
-    constraint_arena = LinearConstraint(A_arena, lb=-b_arena, ub=np.inf)
-    constraint_extra = LinearConstraint(A_extra, lb=-b_extra, ub=np.inf)
-    
-    #Define objective function
-    def objective_function(u, u_n):
-        return np.linalg.norm(u - u_n)**2
-    
-    #Construct the problem
-    u = minimize(
-        objective_function,
-        x0=u_n,
-        args=(u_n,),
-        constraints=[constraint_cm, constraint_oa, constraint_arena, constraint_extra],
-    )
-
-    return u.x, b_cm, b_oa, b_extra
-
-def systemDynamics(p, u):
-    # System dynamics parameters
-    f = np.zeros(len(p))
-    g = np.identity(len(u))
+    #Project the nominal controller onto the safe set (warm started if a solver is given)
+    if solver is None:
+        u = solve_cbf_qp(u_n, A, b)
+    else:
+        u = solver.solve(u_n, A, b)
+    if profiler is not None:
+        profiler.lap("qp")
 
-    # Update state vector derivative
-    xdot = f+np.dot(g,u)
-    return xdot
\ No newline at end of file
+    return u.x, constraints.b_values
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+# To force int division to floats (for Python 2.7)
+from __future__ import division
+
+import numpy as np
+from scipy import sparse
+
+from auxiliary import edgeGeometry, cbfArena, cbfWedge, cbfExtraKernel
+from state import padAxes
+
+
+## CBF constraint families
+
+# Every family is a block of rows A_f u >= -b_f of the CBF-QP. The sparsity
+# pattern (rows, cols) of a family is fixed at construction, static families
+# also have fixed values, so per step only the values of the dynamic families
+# and every right-hand side b_f have to be refreshed. evaluate() returns b_f and
+# the matrix values in the order of the pattern (None for static families).
+
+class EdgeCBF():
+    # Pairwise CBF of every edge (dir 1 corresponds to CM and -1 to OA)
+    static = False
+
+    def __init__(self, name, edge_idx, safe_distance, dir, alpha, n):
+        self.name = name
+        self.edge_idx = edge_idx
+        self.safe_distance = safe_distance
+        self.dir = dir
+        self.alpha = alpha
+        self.rows = len(edge_idx)
+
+        # Row e holds the gradient for robot i and its opposite for robot j
+        self.pattern_rows = np.repeat(np.arange(self.rows), 2*n)
+        self.pattern_cols = np.hstack((n*edge_idx[:, :1] + np.arange(n), n*edge_idx[:, 1:] + np.arange(n))).ravel()
+
+    def evaluate(self, state):
+        diff, dist2 = edgeGeometry(state, self.edge_idx)
+        b = self.alpha*self.dir*(self.safe_distance**2 - dist2)
+        grad = -2*self.dir*diff
+
+        return b, np.hstack((grad, -grad)).ravel()
+
+class RobotCBF():
+    # Individual CBFs with one (or more) rows per robot, each acting on its own
+    # velocity only. A_block is the constant block of a static family.
+    static = False
+
+    def __init__(self, name, number_robots, n, rows_per_robot=1, A_block=None):
+        self.name = name
+        self.rows = rows_per_robot*number_robots
+
+        # Block diagonal pattern
+        block = sparse.coo_matrix(np.ones((rows_per_robot, n)) if A_block is None else A_block)
+        self.pattern_rows = (rows_per_robot*np.arange(number_robots)[:, None] + block.row).ravel()
+        self.pattern_cols = (n*np.arange(number_robots)[:, None] + block.col).ravel()
+        if A_block is not None:
+            self.static = True
+            self.data = np.tile(block.data, number_robots).astype(float)
+
+class ArenaCBF(RobotCBF):
+    # Rectangular arena walls, constant gradients (on x and y)
+    def __init__(self, number_robots, alpha, x_max, x_min, y_max, y_min, n=2, name="arena"):
+        RobotCBF.__init__(self, name, number_robots, n, 4, padAxes([[-1, 0], [1, 0], [0, -1], [0, 1]], n))
+        self.limits = (x_max, x_min, y_max, y_min)
+        self.alpha = alpha
+
+    def evaluate(self, state):
+        return cbfArena(state["P"], self.alpha, *self.limits), None
+
+class WedgeCBF(RobotCBF):
+    # Wedge shaped area, constant gradients (on x and y)
+    def __init__(self, number_robots, alpha, x_max, y_max, n=2, name="wedge"):
+        RobotCBF.__init__(self, name, number_robots, n, 2, padAxes([[-y_max/(2*x_max), -1], [-y_max/(2*x_max), 1]], n))
+        self.x_max = x_max
+        self.y_max = y_max
+        self.alpha = alpha
+
+    def evaluate(self, state):
+        return cbfWedge(state["P"], self.alpha, self.x_max, self.y_max), None
+
+class ExtraRobotCBF(RobotCBF):
+    # Avoidance of the extra (HuIL) robot, whose position huil_p is a signal
+    # given every step and whose speed is bounded by (vxe, vye)
+    def __init__(self, number_robots, alpha, d_extra, vxe, vye, n=2, name="extra_robot"):
+        RobotCBF.__init__(self, name, number_robots, n)
+        self.alpha = alpha
+        self.d_extra = d_extra
+        self.v = (vxe, vye)
+
+    def evaluate(self, state):
+        b, grad = cbfExtraKernel(state["P"], state["huil_p"], self.d_extra, self.alpha, *self.v)
+        return b, grad.ravel()
+
+
+## CBF constraint set
+
+class CBFConstraintSet():
+    # Registry of the constraint families of the CBF-QP. Only active families
+    # are stacked into A u >= -b, monitored ones are just evaluated so that their
+    # CBF values can be logged. The stacked CSR matrix is built once and its
+    # values are refreshed in place every step.
+    def __init__(self, number_robots, n):
+        self.number_robots = number_robots
+        self.n = n
+        self.families = []
+        self.monitored = []
+        self.b_values = {}
+        self.A = None
+
+    def register(self, family, active=True):
+        if active:
+            self.families.append(family)
+        else:
+            self.monitored.append(family)
+        # The stacked pattern has to be rebuilt
+        self.A = None
+        return family
+
+    def _build(self):
+        # Stack the patterns of the active families
+        rows = []
+        cols = []
+        self._blocks = []
+        row = 0
+        nnz = 0
+        for family in self.families:
+            rows.append(family.pattern_rows + row)
+            cols.append(family.pattern_cols)
+            k = len(family.pattern_rows)
+            self._blocks.append((family, slice(row, row+family.rows), slice(nnz, nnz+k)))
+            row += family.rows
+            nnz += k
+        rows = np.concatenate(rows) if rows else np.zeros(0, dtype=int)
+        cols = np.concatenate(cols) if cols else np.zeros(0, dtype=int)
+        shape = (row, self.number_robots*self.n)
+
+        # Position in the CSR data of every pattern entry
+        order = sparse.csr_matrix((np.arange(1, nnz+1, dtype=float), (rows, cols)), shape=shape)
+        self._perm = order.data.astype(int) - 1
+
+        # Values of the static families never change
+        self._data = np.zeros(nnz)
+        for family, _, data_slice in self._blocks:
+            if family.static:
+                self._data[data_slice] = family.data
+        self.A = order
+        self.A.data[:] = self._data[self._perm]
+        self.m = row
+
+    def update(self, p, **signals):
+        # Refresh the dynamic rows and all the right-hand sides for state p
+        if self.A is None:
+            self._build()
+
+        state = dict(signals)
+        state["P"] = np.reshape(p, (self.number_robots, self.n))
+
+        b = np.zeros(self.m)
+        dynamic = False
+        for family, row_slice, data_slice in self._blocks:
+            b_f, data = family.evaluate(state)
+            b[row_slice] = b_f
+            self.b_values[family.name] = b_f
+            if data is not None:
+                self._data[data_slice] = data
+                dynamic = True
+        for family in self.monitored:
+            self.b_values[family.name] = family.evaluate(state)[0]
+
+        if dynamic:
+            self.A.data[:] = self._data[self._perm]
+
+        return self.A, b
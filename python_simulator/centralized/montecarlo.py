@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+#=====================================
+#          Python simulator
+#          mobile 2D robots
+#     Victor Nan Fernandez-Ayala
+#           (vnfa@kth.se)
+#=====================================
+
+# To force int division to floats (for Python 2.7)
+from __future__ import division
+
+import argparse
+import os
+import sys
+
+import numpy as np
+
+from simulator import SimulationConfig, Simulator
+
+# The statistics and the early stopping loop are shared with the other
+# simulator (python_simulator/montecarlo_engine.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import montecarlo_engine
+from montecarlo_engine import reportStatistics, reportFamilies
+
+
+## Monte Carlo safety statistics
+
+# Every run starts from random initial positions with a random HuIL trajectory
+# (start of the extra robot and HuIL speed) drawn from its own seed, so any run can be reproduced on its own.
+# A CBF is violated in a run if it starts satisfied (h >= 0) and later becomes
+# negative, the CBFs that start unsafe are only reflected in the minimum of h.
+
+def sampleScenario(seed, config):
+    # Random initial positions of the robots and the extra robot and HuIL speed
+    # (between half and all of the configured one)
+    rng = np.random.RandomState(seed)
+    number_robots = len(config.formation_positions)
+    p0 = config.x_max*rng.rand(number_robots*config.dim)-config.x_max/2
+    huil_p0 = rng.uniform([-config.x_max, -config.y_max], [config.x_max, config.y_max])
+    v_huil = config.v_huil*rng.uniform(0.5, 1)
+    return {"p0": p0, "huil_p0": huil_p0, "v_huil": v_huil}
+
+def _monteCarloRun(task):
+    # Worker: one run and its minimum CBF values
+    seed, base, tol = task
+    config = SimulationConfig(**base)
+    config.verbose = False
+    for name, value in sampleScenario(seed, config).items():
+        setattr(config, name, value)
+    results = Simulator(config).run()
+
+    row = {"seed": seed}
+    violated = False
+    for family in ("cbf_cm", "cbf_oa", "cbf_extra_robot", "cbf_wedge"):
+        h = results.log.array(family)[:, 1:]
+        if h.size == 0 or (family == "cbf_cm" and results.cm != 1) or (family == "cbf_oa" and config.oa != 1):
+            continue
+        row["min_h_"+family[4:]] = h.min()
+        violated = violated or bool(np.any((h[0] >= 0) & (h.min(axis=0) < -tol)))
+    row["violation"] = violated
+    return row
+
+def monteCarlo(base=None, **options):
+    # Safety statistics of this simulator with the base parameters, see
+    # montecarlo_engine.monteCarlo for the options
+    return montecarlo_engine.monteCarlo(_monteCarloRun, base, **options)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monte Carlo safety statistics of the centralized CBF simulator")
+    parser.add_argument("--runs", type=int, default=1000, help="maximum number of runs")
+    parser.add_argument("--ci_width", type=float, default=0.05, help="target width of the violation rate interval")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first run")
+    parser.add_argument("--processes", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--max_T", type=float, default=30, help="simulated time of every run")
+    parser.add_argument("--extra_robot", action="store_true", help="add the extra (HuIL) robot")
+    args = parser.parse_args()
+
+    stats, rows = monteCarlo({"max_T": args.max_T, "extra_robot": args.extra_robot}, max_runs=args.runs,
+                             ci_width=args.ci_width, seed=args.seed, processes=args.processes)
+    reportStatistics(stats)
+    reportFamilies(stats)
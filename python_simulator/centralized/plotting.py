@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+
+# To force int division to floats (for Python 2.7)
+from __future__ import division
+
+import numpy as np
+from matplotlib import pyplot as plt
+from matplotlib import animation
+
+from state import robotRows
+
+#plt.style.use("seaborn-whitegrid")
+
+
+## Visualize CBF conditions/plots & trajectories
+
+def plotResults(results, show=True):
+    # Plot the CBF functions and the controllers of a SimulationResults
+    config = results.config
+    cm = results.cm
+    oa = config.oa
+    wedge = config.wedge
+    extra_robot = config.extra_robot
+    human_robot = results.human_robot
+    dim = config.dim
+    dataframes = results.dataframes()
+    df_cbf_cm = dataframes["df_cbf_cm"]
+    df_cbf_oa = dataframes["df_cbf_oa"]
+    df_controller = dataframes["df_controller"]
+    df_nom_controller = dataframes["df_nom_controller"]
+    df_huil_controller = dataframes["df_huil_controller"]
+    df_cbf_wedge = dataframes["df_cbf_wedge"]
+    df_cbf_extra_robot = dataframes["df_cbf_extra_robot"]
+
+    cbf_cm_col = df_cbf_cm.columns.values
+    starting_point = df_cbf_cm[cbf_cm_col[1]].ne(0).idxmax()
+    if cm == 1:
+        # Plot the CBF comunication maintenance
+        fig_cbf_cm, ax_cbf_cm = plt.subplots()  # Create a figure and an axes.
+        for i in range(len(cbf_cm_col)):
+            if i > 0:
+                ax_cbf_cm.plot(df_cbf_cm[cbf_cm_col[0]].iloc[starting_point:-1], df_cbf_cm[cbf_cm_col[i]].iloc[starting_point:-1], label=cbf_cm_col[i])  # Plot some data on the axes.
+
+        ax_cbf_cm.set_xlabel('time')  # Add an x-label to the axes.
+        ax_cbf_cm.set_ylabel('h_cm')  # Add a y-label to the axes.
+        ax_cbf_cm.set_title("CBF functions for comunication maintenance")  # Add a title to the axes.
+        ax_cbf_cm.legend()  # Add a legend.
+        ax_cbf_cm.axhline(y=0, color='k', lw=1)
+
+    if oa == 1:
+        # Plot the CBF obstacle avoidance
+        cbf_oa_col = df_cbf_oa.columns.values
+        fig_cbf_oa, ax_cbf_oa = plt.subplots()  # Create a figure and an axes.
+        for i in range(len(cbf_oa_col)):
+            if i > 0:
+                ax_cbf_oa.plot(df_cbf_oa[cbf_oa_col[0]].iloc[starting_point:-1], df_cbf_oa[cbf_oa_col[i]].iloc[starting_point:-1], label=cbf_oa_col[i])  # Plot some data on the axes.
+
+        ax_cbf_oa.set_xlabel('time')  # Add an x-label to the axes.
+        ax_cbf_oa.set_ylabel('h_oa')  # Add a y-label to the axes.
+        ax_cbf_oa.set_title("CBF functions for obstacle avoidance")  # Add a title to the axes.
+        ax_cbf_oa.legend()  # Add a legend.
+        ax_cbf_oa.axhline(y=0, color='k', lw=1)
+
+    # Plot the normed difference between nominal and final controller
+    controller_col = df_controller.columns.values
+    fig_norm, ax_norm = plt.subplots()  # Create a figure and an axes.
+    step = 1
+    ax_norm.axis('on')
+    for i in range(1, len(controller_col), dim):
+        if i > 0:
+            diff = np.array([df_controller[controller_col[i+k]].iloc[starting_point:-1] - df_nom_controller[controller_col[i+k]].iloc[starting_point:-1]
+                             for k in range(dim)])
+            normed_difference = np.sqrt(np.square(diff).sum(axis=0))
+            ax_norm.plot(df_controller[controller_col[0]].iloc[starting_point:-1], normed_difference, label="Robot"+str(step))  # Plot some data on the axes.
+            step += 1
+
+    if not extra_robot:
+        huil_col = controller_col[dim*(human_robot-1)+1:dim*human_robot+1]
+        diff = np.array([df_controller[col].iloc[starting_point:-1] - df_huil_controller[col].iloc[starting_point:-1] for col in huil_col])
+        normed_difference = np.sqrt(np.square(diff).sum(axis=0))
+        ax_norm.plot(df_controller[controller_col[0]].iloc[starting_point:-1], normed_difference, label="HuILDiff"+str(human_robot))  # Plot some data on the axes.
+
+        huil = np.array([df_huil_controller[col].iloc[starting_point:-1] for col in huil_col])
+        normed_huil = np.sqrt(np.square(huil).sum(axis=0))
+        #ax_norm.plot(df_controller[controller_col[0]].iloc[starting_point:-1], normed_huil, label="HuIL"+str(human_robot))  # Plot some data on the axes.
+
+    ax_norm.set_xlabel('time')  # Add an x-label to the axes.
+    ax_norm.set_ylabel('|u - u_nom|')  # Add a y-label to the axes.
+    ax_norm.set_title("Normed difference between u and nominal u")  # Add a title to the axes.
+    ax_norm.legend()  # Add a legend.
+    ax_norm.axhline(y=0, color='k', lw=1)
+
+    if wedge:
+        # Plot the CBF wedge shape
+        cbf_wedge_col = df_cbf_wedge.columns.values
+        fig_cbf_wedge, ax_cbf_wedge = plt.subplots()  # Create a figure and an axes.
+        ax_cbf_wedge.axis('on')
+        for i in range(1, len(cbf_wedge_col)):
+            if i > 0:
+                ax_cbf_wedge.plot(df_cbf_wedge[cbf_wedge_col[0]].iloc[starting_point:-1], df_cbf_wedge[cbf_wedge_col[i]].iloc[starting_point:-1], label=cbf_wedge_col[i])  # Plot some data on the axes.
+
+        ax_cbf_wedge.set_xlabel('time')  # Add an x-label to the axes.
+        ax_cbf_wedge.set_ylabel('h_wedge')  # Add a y-label to the axes.
+        ax_cbf_wedge.set_title("CBF functions for wedge shape")  # Add a title to the axes.
+        ax_cbf_wedge.legend()  # Add a legend.
+        ax_cbf_wedge.axhline(y=0, color='k', lw=1)
+
+    if extra_robot:
+        # Plot the CBF extra robot
+        cbf_extra_robot_col = df_cbf_extra_robot.columns.values
+        fig_cbf_extra_robot, ax_cbf_extra_robot = plt.subplots()  # Create a figure and an axes.
+        step = 1
+        ax_cbf_extra_robot.axis('on')
+        for i in range(1, len(cbf_extra_robot_col)):
+            if i > 0:
+                ax_cbf_extra_robot.plot(df_cbf_extra_robot[cbf_extra_robot_col[0]].iloc[starting_point:-1], df_cbf_extra_robot[cbf_extra_robot_col[i]].iloc[starting_point:-1], label="Robot"+str(step))  # Plot some data on the axes.
+                step += 1
+
+        ax_cbf_extra_robot.set_xlabel('time')  # Add an x-label to the axes.
+        ax_cbf_extra_robot.set_ylabel('h_extra_robot')  # Add a y-label to the axes.
+        ax_cbf_extra_robot.set_title("CBF functions for extra_robot")  # Add a title to the axes.
+        ax_cbf_extra_robot.legend()  # Add a legend.
+        ax_cbf_extra_robot.axhline(y=0, color='k', lw=1)
+
+    if show:
+        plt.show()
+
+
+## Animation
+
+def animateResults(results, show=True):
+    # Animate the trajectories of a SimulationResults (on the x-y plane), the
+    # animation is returned so that it can also be saved
+    config = results.config
+    p = results.p
+    # (time, N, dim) view of the positions
+    P = robotRows(p.T, config.dim)
+    huil_p = results.huil_p
+    edges = results.edges
+    number_robots = len(config.formation_positions)
+    max_time_size = p.shape[1]
+    freq = config.freq
+    winx = config.winx
+    winy = config.winy
+    x_max = config.x_max
+    y_max = config.y_max
+    r_robot = config.r_robot
+    wedge = config.wedge
+    extra_robot = config.extra_robot
+
+    # Start figure and axes with limits
+    fig = plt.figure()
+    ax = plt.axes(xlim=(-winx, winx), ylim=(-winy, winy))
+
+    time_txt = ax.text(0.475, 0.975,'',horizontalalignment='left',verticalalignment='top', transform=ax.transAxes)
+
+    # Add the limits of the arena
+    arena_limit1 = plt.Line2D((-x_max, x_max), (y_max, y_max), lw=2.5, color='r')
+    arena_limit2 = plt.Line2D((-x_max, x_max), (-y_max, -y_max), lw=2.5, color='r')
+    arena_limit3 = plt.Line2D((x_max, x_max), (-y_max, y_max), lw=2.5, color='r')
+    arena_limit4 = plt.Line2D((-x_max, -x_max), (-y_max, y_max), lw=2.5, color='r')
+    plt.gca().add_line(arena_limit1)
+    plt.gca().add_line(arena_limit2)
+    plt.gca().add_line(arena_limit3)
+    plt.gca().add_line(arena_limit4)
+
+    # Add wedge limits (OPTIONAL)
+    if wedge:
+        wedge1 = plt.Line2D((-x_max, x_max), (y_max, 0), lw=1, color='r', alpha=0.7)
+        wedge2 = plt.Line2D((-x_max, x_max), (-y_max, 0), lw=1, color='r', alpha=0.7)
+        plt.gca().add_line(wedge1)
+        plt.gca().add_line(wedge2)
+
+    shapes = []
+    for i in range(number_robots):
+        shapes.append(plt.Circle((P[0,i,0], P[0,i,1]), r_robot, fc='b'))
+
+    for i in range(len(edges)):
+        aux_i = edges[i][0]-1
+        aux_j = edges[i][1]-1
+        shapes.append(plt.Line2D((P[0,aux_i,0], P[0,aux_j,0]), (P[0,aux_i,1], P[0,aux_j,1]), lw=0.5, color='b', alpha=0.3))
+
+    if extra_robot:
+        shapes.append(plt.Circle((huil_p[0,0], huil_p[1,0]), r_robot, fc='g'))
+
+    def init():
+        for i in range(number_robots):
+            shapes[i].center = (P[0,i,0], P[0,i,1])
+            ax.add_patch(shapes[i])
+
+        for i in range(len(edges)):
+            aux_i = edges[i][0]-1
+            aux_j = edges[i][1]-1
+            shapes[number_robots+i].set_xdata((P[0,aux_i,0], P[0,aux_j,0]))
+            shapes[number_robots+i].set_ydata((P[0,aux_i,1], P[0,aux_j,1]))
+            ax.add_line(shapes[number_robots+i])
+
+        if extra_robot:
+            shapes[-1].center = (huil_p[0,0], huil_p[1,0])
+            ax.add_patch(shapes[-1])
+
+        time_txt.set_text('T=0.0 s')
+
+        return shapes + [time_txt,]
+
+    def animate(frame):
+
+        for i in range(number_robots):
+            shapes[i].center = (P[frame,i,0], P[frame,i,1])
+
+        for i in range(len(edges)):
+            aux_i = edges[i][0]-1
+            aux_j = edges[i][1]-1
+            shapes[number_robots+i].set_xdata((P[frame,aux_i,0], P[frame,aux_j,0]))
+            shapes[number_robots+i].set_ydata((P[frame,aux_i,1], P[frame,aux_j,1]))
+
+        if extra_robot:
+            shapes[-1].center = (huil_p[0,frame], huil_p[1,frame])
+
+        secs = frame/freq
+        time_txt.set_text('T=%.1d s' % secs)
+
+        return shapes + [time_txt,]
+
+    anim = animation.FuncAnimation(fig, animate, 
+                                   init_func=init, 
+                                   frames=max_time_size, 
+                                   interval=1/freq*1000,
+                                   blit=True,
+                                   repeat=False)
+
+    if show:
+        plt.show()
+
+    #anim.save('animation.mp4', fps=50, extra_args=['-vcodec', 'libx264'])
+
+    return anim
@@ -0,0 +1,827 @@
+#!/usr/bin/env python
+
+# To force int division to floats (for Python 2.7)
+from __future__ import division
+
+from timeit import default_timer as timer
+
+import numpy as np
+from scipy import sparse
+from scipy.optimize import OptimizeResult
+from scipy.sparse.csgraph import connected_components, reverse_cuthill_mckee
+from scipy.sparse.linalg import splu
+
+
+## CBF-QP solver
+
+# Every CBF controller solves
+#     min ||u - u_n||^2   s.t.   A u >= -b
+# which is the euclidean projection of u_n onto a polyhedron. Since the Hessian
+# is the identity, the dual active-set method of Goldfarb-Idnani only needs the
+# normals of the active constraints: it starts at the unconstrained minimum u_n,
+# adds the most violated constraint each iteration and drops the ones whose
+# multipliers would become negative. Every iterate is the exact projection onto
+# the current active set, so the final multipliers are the exact KKT ones.
+# A can be dense or a scipy.sparse matrix, only the active rows are densified.
+
+# Termination status (same convention as scipy.optimize)
+QP_SOLVED = 0
+QP_MAX_ITER = 1
+QP_INFEASIBLE = 2
+QP_TIMEOUT = 3
+
+QP_MESSAGES = {
+    QP_SOLVED: "Optimal solution found",
+    QP_MAX_ITER: "Iteration limit reached",
+    QP_INFEASIBLE: "Constraints are infeasible",
+    QP_TIMEOUT: "Time limit reached",
+}
+
+
+def _rows(A, idx):
+    # Dense copy of the rows idx of A
+    rows = A[idx]
+    if sparse.issparse(rows):
+        rows = rows.toarray()
+    return rows
+
+def _as_matrix(A):
+    # Sparse matrices are row sliced every iteration, so keep them as CSR
+    if sparse.issparse(A):
+        return A.tocsr()
+    return np.asarray(A, dtype=float)
+
+def _dual_active_set(u_n, A, b, u, active, lam, tol, max_iter, deadline=None):
+    # u must be the projection of u_n onto {a_k u = -b_k, k in active} with
+    # multipliers lam >= 0, i.e. u = u_n + A[active]^T lam. The iterations stop
+    # once the timer passes deadline (if given).
+    nit = 0
+    if A.shape[0] == 0:
+        return u, active, lam, nit, QP_SOLVED
+    while True:
+        # Most violated constraint
+        s = A.dot(u) + b
+        p = int(np.argmin(s))
+        if s[p] >= -tol:
+            return u, active, lam, nit, QP_SOLVED
+
+        n_p = _rows(A, [p])[0]
+        lam_p = 0.
+        while True:
+            nit += 1
+            if nit > max_iter:
+                return u, active, lam, nit, QP_MAX_ITER
+            if deadline is not None and timer() > deadline:
+                return u, active, lam, nit, QP_TIMEOUT
+
+            # Primal direction (n_p projected onto the nullspace of the active
+            # normals) and dual direction (least squares coefficients)
+            if active:
+                N = _rows(A, active)
+                r = np.linalg.solve(np.dot(N, N.T), np.dot(N, n_p))
+                z = n_p - np.dot(N.T, r)
+            else:
+                r = np.zeros(0)
+                z = n_p
+
+            # Partial step: largest step keeping the active multipliers >= 0
+            t1 = np.inf
+            k = -1
+            blocking = np.flatnonzero(r > tol)
+            if len(blocking) > 0:
+                ratios = lam[blocking]/r[blocking]
+                k = blocking[np.argmin(ratios)]
+                t1 = ratios.min()
+
+            # Full step: step that makes constraint p active
+            zz = np.dot(z, n_p)
+            t2 = np.inf
+            if zz > tol*max(1., np.dot(n_p, n_p)):
+                t2 = -(np.dot(n_p, u) + b[p])/zz
+
+            if t1 == np.inf and t2 == np.inf:
+                return u, active, lam, nit, QP_INFEASIBLE
+
+            if t2 == np.inf:
+                # Only the multipliers move, drop the blocking constraint
+                lam = lam - t1*r
+                lam_p += t1
+                lam = np.delete(lam, k)
+                del active[k]
+                continue
+
+            t = min(t1, t2)
+            u = u + t*z
+            lam = lam - t*r
+            lam_p += t
+            if t2 <= t1:
+                active.append(p)
+                lam = np.append(lam, lam_p)
+                break
+            lam = np.delete(lam, k)
+            del active[k]
+
+def _qp_result(u, u_n, active, lam, nit, status, m):
+    # Multipliers for the cost ||u - u_n||^2 (twice the ones of the 1/2 cost)
+    lam_full = np.zeros(m)
+    lam_full[active] = 2*lam
+
+    return OptimizeResult(
+        x=u,
+        fun=np.linalg.norm(u - u_n)**2,
+        lam=lam_full,
+        active=np.array(active, dtype=int),
+        nit=nit,
+        status=status,
+        success=(status == QP_SOLVED),
+        message=QP_MESSAGES[status],
+    )
+
+def solve_cbf_qp(u_n, A, b, tol=1e-9, max_iter=None):
+    # Solve min ||u - u_n||^2 s.t. A u >= -b
+    # Returns an OptimizeResult like scipy.optimize.minimize, with the extra
+    # fields lam (KKT multipliers of every row) and active (active rows)
+    u_n = np.asarray(u_n, dtype=float)
+    A = _as_matrix(A)
+    b = np.asarray(b, dtype=float)
+    m = len(b)
+    if max_iter is None:
+        max_iter = 10*(m + len(u_n)) + 10
+
+    if m == 0:
+        return _qp_result(u_n.copy(), u_n, [], np.zeros(0), 0, QP_SOLVED, m)
+
+    u, active, lam, nit, status = _dual_active_set(u_n, A, b, u_n.copy(), [], np.zeros(0), tol, max_iter)
+
+    return _qp_result(u, u_n, active, lam, nit, status, m)
+
+class CBFQPSolver():
+    # Stateful CBF-QP solver for consecutive control cycles. The active set and
+    # multipliers of the previous solve are used to start the next one, which
+    # at 50 Hz is usually already (close to) optimal.
+    def __init__(self, tol=1e-9, max_iter=None):
+        self.tol = tol
+        self.max_iter = max_iter
+        self.reset()
+
+    def reset(self):
+        # Previous solution
+        self.u = None
+        self.active = []
+        self.lam = np.zeros(0)
+        self.m = None
+
+        # Statistics
+        self.solves = 0
+        self.warm_starts = 0
+        self.warm_hits = 0
+        self.iterations = 0
+
+    def _warm_start(self, u_n, A, b):
+        # Project u_n onto the previous active set (as equalities) and drop
+        # constraints with negative multipliers until the point is dual feasible
+        active = list(self.active)
+        while active:
+            N = _rows(A, active)
+            G = np.dot(N, N.T)
+            try:
+                L = np.linalg.cholesky(G)
+            except np.linalg.LinAlgError:
+                break
+            # Rows that became (almost) linearly dependent, restart cold
+            if np.diag(L).min()**2 <= self.tol*np.diag(G).max():
+                break
+
+            lam = np.linalg.solve(G, -b[active] - np.dot(N, u_n))
+            if lam.min() >= 0:
+                return u_n + np.dot(N.T, lam), active, lam
+            del active[int(np.argmin(lam))]
+
+        return u_n.copy(), [], np.zeros(0)
+
+    def solve(self, u_n, A, b):
+        # Same interface and result as solve_cbf_qp
+        u_n = np.asarray(u_n, dtype=float)
+        A = _as_matrix(A)
+        b = np.asarray(b, dtype=float)
+        m = len(b)
+        max_iter = self.max_iter
+        if max_iter is None:
+            max_iter = 10*(m + len(u_n)) + 10
+
+        if m == 0:
+            return _qp_result(u_n.copy(), u_n, [], np.zeros(0), 0, QP_SOLVED, m)
+
+        # The active set can only be reused if the constraint rows are the same
+        if m == self.m and self.active:
+            u, active, lam = self._warm_start(u_n, A, b)
+        else:
+            u, active, lam = u_n.copy(), [], np.zeros(0)
+        warm = len(active) > 0
+
+        u, active, lam, nit, status = _dual_active_set(u_n, A, b, u, active, lam, self.tol, max_iter)
+
+        self.solves += 1
+        self.iterations += nit
+        if warm:
+            self.warm_starts += 1
+            if nit == 0:
+                self.warm_hits += 1
+
+        # Keep the solution only if it is a valid starting point
+        if status == QP_SOLVED:
+            self.u = u
+            self.active = list(active)
+            self.lam = lam
+            self.m = m
+        else:
+            self.active = []
+
+        return _qp_result(u, u_n, active, lam, nit, status, m)
+
+    def stats(self):
+        solves = max(self.solves, 1)
+        return {
+            "solves": self.solves,
+            "warm_starts": self.warm_starts,
+            "warm_hits": self.warm_hits,
+            "warm_start_rate": self.warm_starts/solves,
+            "warm_hit_rate": self.warm_hits/solves,
+            "mean_iterations": self.iterations/solves,
+        }
+
+
+## Constraint screening
+
+# In dense formations most CM/OA rows are far from binding. A row is screened
+# out when its slack at u_n is larger than margin times |a_r|.|u_n|, the largest
+# change u_n can make to it. The reduced QP is solved and every screened row the
+# solution violates is added back (the dual method continues from the current
+# active set), so the result is the solution of the full QP.
+
+def screenRows(u_n, A, b, margin=1.):
+    # Mask of the rows that are kept in the QP
+    A = _as_matrix(A)
+    slack = A.dot(u_n) + b
+    reach = abs(A).dot(abs(u_n))
+    return slack <= margin*reach
+
+class ScreenedQPSolver(CBFQPSolver):
+    # Warm started solver that only hands the rows that may bind at u_n (and the
+    # previously active ones) to the dual active-set method
+    def __init__(self, margin=1., tol=1e-9, max_iter=None):
+        self.margin = margin
+        CBFQPSolver.__init__(self, tol, max_iter)
+
+    def reset(self):
+        CBFQPSolver.reset(self)
+        self.rows = 0
+        self.kept = 0
+        self.readded = 0
+
+    def solve(self, u_n, A, b):
+        # Same interface and result as solve_cbf_qp
+        u_n = np.asarray(u_n, dtype=float)
+        A = _as_matrix(A)
+        b = np.asarray(b, dtype=float)
+        m = len(b)
+        max_iter = self.max_iter
+        if max_iter is None:
+            max_iter = 10*(m + len(u_n)) + 10
+
+        if m == 0:
+            return _qp_result(u_n.copy(), u_n, [], np.zeros(0), 0, QP_SOLVED, m)
+
+        keep = screenRows(u_n, A, b, self.margin)
+
+        # The previous active rows are always kept (indices of the full QP)
+        if m == self.m and self.active:
+            u, active, lam = self._warm_start(u_n, A, b)
+            keep[active] = True
+        else:
+            u, active, lam = u_n.copy(), [], np.zeros(0)
+        warm = len(active) > 0
+
+        nit = 0
+        while True:
+            rows = np.flatnonzero(keep)
+            if len(rows) == 0:
+                # Every row was screened out, u_n is the solution unless the
+                # check below finds a violated row
+                u, active, lam, status = u_n.copy(), [], np.zeros(0), QP_SOLVED
+            else:
+                index = np.cumsum(keep) - 1
+                active = list(index[active])
+                u, active, lam, it, status = _dual_active_set(u_n, A[rows], b[rows], u, active, lam, self.tol, max_iter - nit)
+                nit += it
+                active = list(rows[active])
+                if status != QP_SOLVED:
+                    break
+
+            # Add back the screened rows that the solution violates
+            violated = ~keep & (A.dot(u) + b < -self.tol)
+            if not violated.any():
+                break
+            keep |= violated
+            self.readded += int(np.count_nonzero(violated))
+
+        self.solves += 1
+        self.iterations += nit
+        self.rows += m
+        self.kept += int(np.count_nonzero(keep))
+        if warm:
+            self.warm_starts += 1
+            if nit == 0:
+                self.warm_hits += 1
+
+        if status == QP_SOLVED:
+            self.u = u
+            self.active = list(active)
+            self.lam = lam
+            self.m = m
+        else:
+            self.active = []
+
+        return _qp_result(u, u_n, active, lam, nit, status, m)
+
+    def stats(self):
+        stats = CBFQPSolver.stats(self)
+        stats["kept_rate"] = self.kept/max(self.rows, 1)
+        stats["readded"] = self.readded
+        return stats
+
+
+## Anytime solver
+
+# In the real-time loops a slow solve must not stretch the control cycle. The
+# dual iterates are only feasible once the method has finished, so when the
+# time budget runs out the command is taken from the last feasible command (or
+# the zero command) by moving along the segment towards the current dual
+# iterate as far as every constraint allows. The partial active set is kept to
+# warm start the next cycle, which continues where this one stopped.
+
+class AnytimeQPSolver(CBFQPSolver):
+    # Warm started solver with a time budget (seconds) per solve. The result has
+    # the extra fields feasible, prim_res (largest constraint violation),
+    # dual_res (stationarity residual) and solve_time.
+    def __init__(self, time_budget=0.01, tol=1e-9, max_iter=None):
+        self.time_budget = time_budget
+        CBFQPSolver.__init__(self, tol, max_iter)
+
+    def reset(self):
+        CBFQPSolver.reset(self)
+        self.u_safe = None
+        self.timeouts = 0
+        self.fallbacks = 0
+        self.unsafe = 0
+        self.solve_time = 0.
+        self.max_solve_time = 0.
+
+    def _fallback(self, u_n, A, b, u):
+        # Best feasible point on the segments from the safe candidates to u
+        s_u = A.dot(u) + b
+        best = None
+        best_violation = np.inf
+        for c in (self.u_safe, np.zeros(len(u_n))):
+            if c is None or len(c) != len(u_n):
+                continue
+            s_c = A.dot(c) + b
+            violation = max(0., -s_c.min())
+            if violation > self.tol:
+                # Keep the least violating candidate in case none is feasible
+                if best_violation > self.tol and violation < best_violation:
+                    best, best_violation = c, violation
+                continue
+
+            # Largest step towards u keeping every row satisfied
+            d = s_u - s_c
+            blocking = d < 0
+            t = 1.
+            if blocking.any():
+                t = min(1., np.min(np.maximum(s_c[blocking], 0)/-d[blocking]))
+            x = c + t*(u - c)
+            if best_violation > self.tol or np.linalg.norm(x - u_n) < np.linalg.norm(best - u_n):
+                best, best_violation = x, 0.
+
+        return best
+
+    def solve(self, u_n, A, b, time_budget=None):
+        # Same interface and result as solve_cbf_qp, time_budget overrides the
+        # budget of this call
+        start = timer()
+        if time_budget is None:
+            time_budget = self.time_budget
+        u_n = np.asarray(u_n, dtype=float)
+        A = _as_matrix(A)
+        b = np.asarray(b, dtype=float)
+        m = len(b)
+        max_iter = self.max_iter
+        if max_iter is None:
+            max_iter = 10*(m + len(u_n)) + 10
+
+        if m == 0:
+            u, active, lam, nit, status = u_n.copy(), [], np.zeros(0), 0, QP_SOLVED
+        else:
+            if m == self.m and self.active:
+                u, active, lam = self._warm_start(u_n, A, b)
+            else:
+                u, active, lam = u_n.copy(), [], np.zeros(0)
+            warm = len(active) > 0
+
+            u, active, lam, nit, status = _dual_active_set(u_n, A, b, u, active, lam, self.tol, max_iter, start + time_budget)
+
+            self.iterations += nit
+            if warm:
+                self.warm_starts += 1
+                if nit == 0:
+                    self.warm_hits += 1
+
+        # A stopped dual iterate is still a valid warm start
+        if status in (QP_SOLVED, QP_TIMEOUT):
+            self.active = list(active)
+            self.lam = lam
+            self.m = m
+        else:
+            self.active = []
+        result = _qp_result(u, u_n, active, lam, nit, status, m)
+
+        # Unfinished solve, replace the command by a feasible one
+        if status != QP_SOLVED and m > 0:
+            if status == QP_TIMEOUT:
+                self.timeouts += 1
+            x = self._fallback(u_n, A, b, u)
+            if x is not None:
+                result.x = x
+                result.fun = np.linalg.norm(x - u_n)**2
+            self.fallbacks += 1
+
+        result.prim_res = max(0., -(A.dot(result.x) + b).min()) if m > 0 else 0.
+        result.dual_res = np.abs(result.x - u_n - (np.dot(_rows(A, active).T, lam) if active else 0.)).max()
+        result.feasible = result.prim_res <= self.tol
+        if result.feasible:
+            self.u_safe = result.x
+        else:
+            self.unsafe += 1
+
+        self.solves += 1
+        result.solve_time = timer() - start
+        self.solve_time += result.solve_time
+        self.max_solve_time = max(self.max_solve_time, result.solve_time)
+
+        return result
+
+    def stats(self):
+        stats = CBFQPSolver.stats(self)
+        solves = max(self.solves, 1)
+        stats["timeouts"] = self.timeouts
+        stats["fallbacks"] = self.fallbacks
+        stats["unsafe"] = self.unsafe
+        stats["mean_solve_time"] = self.solve_time/solves
+        stats["max_solve_time"] = self.max_solve_time
+        return stats
+
+
+## ADMM backend
+
+# For swarms of hundreds of robots the active set can hold hundreds of rows and
+# the dense least squares solves of the active-set method grow cubically. The
+# ADMM backend (operator splitting as in OSQP) instead only needs solves with
+#     K = (1 + sigma) I + rho A^T A
+# which is sparse since every row of A touches at most two robots. The fill
+# reducing ordering of K depends only on the sparsity pattern (fixed by the
+# edges and the individual families) and is computed once per pattern, while
+# the numeric factorization is only redone when the values of A change. The
+# iterations stop at a configurable tolerance or iteration limit, trading
+# accuracy for a bounded solve time.
+
+class ADMMQPSolver():
+    # The values of A follow the positions, so in a simulation they change
+    # every step and every solve includes a full numeric factorization of K
+    # (SciPy's splu cannot reuse the symbolic one), the latency of a control
+    # step is that factorization plus the iterations. Keeping an old
+    # factorization as a preconditioner with residual corrections was tried
+    # and is slower here: with the banded ordering the factorization costs
+    # about as much as a few solves, while the corrections add a product with
+    # K to every iteration and stall when the robots move fast
+    def __init__(self, rho=1., sigma=1e-6, relaxation=1.6, eps_abs=1e-5, eps_rel=1e-5, max_iter=4000, check_every=5, warm_start=True):
+        self.rho = rho
+        self.sigma = sigma
+        self.relaxation = relaxation
+        self.eps_abs = eps_abs
+        self.eps_rel = eps_rel
+        self.max_iter = max_iter
+        self.check_every = check_every
+        self.warm_start = warm_start
+        self.reset()
+
+    def reset(self):
+        # Cached pattern, ordering and factorization
+        self._indptr = None
+        self._indices = None
+        self._data = None
+        self._rho = None
+        self._perm = None
+        self._lu = None
+
+        # Previous iterates (in the scaled problem)
+        self.u = None
+        self.z = None
+        self.y = None
+
+        # Statistics
+        self.solves = 0
+        self.iterations = 0
+        self.pattern_builds = 0
+        self.factorizations = 0
+        self.converged = 0
+
+    def _factorize(self, A):
+        # New sparsity pattern, compute the ordering of K
+        if (self._indptr is None or A.shape[1] != len(self._perm) or
+                not np.array_equal(A.indptr, self._indptr) or not np.array_equal(A.indices, self._indices)):
+            self._indptr = A.indptr.copy()
+            self._indices = A.indices.copy()
+            K = sparse.identity(A.shape[1], format='csr') + abs(A).T.dot(abs(A))
+            self._perm = reverse_cuthill_mckee(K.tocsr(), symmetric_mode=True)
+            self._data = None
+            self.pattern_builds += 1
+
+        # New values, redo the numeric factorization of K
+        if self._data is None or self._rho != self.rho or not np.array_equal(A.data, self._data):
+            self._data = A.data.copy()
+            self._rho = self.rho
+            K = (1 + self.sigma)*sparse.identity(A.shape[1], format='csc') + self.rho*A.T.dot(A)
+            K = K.tocsc()[self._perm][:, self._perm].tocsc()
+            self._lu = splu(K, permc_spec="NATURAL", diag_pivot_thresh=0., options=dict(SymmetricMode=True))
+            self.factorizations += 1
+
+    def _kkt_solve(self, rhs):
+        x = np.empty_like(rhs)
+        x[self._perm] = self._lu.solve(rhs[self._perm])
+        return x
+
+    def solve(self, u_n, A, b):
+        # Same interface and result as solve_cbf_qp, with the extra fields
+        # prim_res and dual_res (infinity norms of the ADMM residuals)
+        u_n = np.asarray(u_n, dtype=float)
+        b = np.asarray(b, dtype=float)
+        m = len(b)
+        self.solves += 1
+        if m == 0:
+            return _qp_result(u_n.copy(), u_n, [], np.zeros(0), 0, QP_SOLVED, m)
+
+        # Scale the rows to unit norm, which keeps a single rho suitable for
+        # both the CM/OA rows and the arena rows
+        A = sparse.csr_matrix(A)
+        norms = np.sqrt(np.asarray(A.multiply(A).sum(axis=1)).ravel())
+        D = np.where(norms > 0, 1/np.where(norms > 0, norms, 1), 1.)
+        A_s = sparse.diags(D).dot(A).tocsr()
+        A_s.sort_indices()
+        l = -b*D
+        self._factorize(A_s)
+
+        # Start from the previous iterates if the problem has the same size
+        if self.warm_start and self.y is not None and len(self.y) == m and len(self.u) == len(u_n):
+            u, z, y = self.u, self.z, self.y
+        else:
+            u = u_n.copy()
+            z = np.maximum(A_s.dot(u), l)
+            y = np.zeros(m)
+
+        rho = self.rho
+        a = self.relaxation
+        status = QP_MAX_ITER
+        prim_res = dual_res = np.inf
+        nit = 0
+        for nit in range(1, self.max_iter+1):
+            u_t = self._kkt_solve(self.sigma*u + u_n + A_s.T.dot(rho*z - y))
+            z_t = A_s.dot(u_t)
+            u = a*u_t + (1 - a)*u
+            z_relax = a*z_t + (1 - a)*z
+            z_new = np.maximum(z_relax + y/rho, l)
+            y = y + rho*(z_relax - z_new)
+            z = z_new
+
+            # Residuals are only checked every few iterations
+            if nit % self.check_every == 0 or nit == self.max_iter:
+                Au = A_s.dot(u)
+                ATy = A_s.T.dot(y)
+                prim_res = np.abs(Au - z).max()
+                dual_res = np.abs(u - u_n + ATy).max()
+                eps_prim = self.eps_abs + self.eps_rel*max(np.abs(Au).max(), np.abs(z).max())
+                eps_dual = self.eps_abs + self.eps_rel*max(np.abs(u).max(), np.abs(ATy).max(), np.abs(u_n).max())
+                if prim_res <= eps_prim and dual_res <= eps_dual:
+                    status = QP_SOLVED
+                    break
+
+        self.iterations += nit
+        if status == QP_SOLVED:
+            self.converged += 1
+        self.u, self.z, self.y = u, z, y
+
+        # Multipliers of the original rows (y <= 0 holds for lower bounds)
+        lam = -y*D
+        active = list(np.flatnonzero(lam > self.eps_abs))
+        result = _qp_result(u, u_n, active, lam[active], nit, status, m)
+        result.prim_res = prim_res
+        result.dual_res = dual_res
+
+        return result
+
+    def stats(self):
+        solves = max(self.solves, 1)
+        return {
+            "solves": self.solves,
+            "converged": self.converged,
+            "pattern_builds": self.pattern_builds,
+            "factorizations": self.factorizations,
+            "mean_iterations": self.iterations/solves,
+        }
+
+
+## Decomposition into independent blocks
+
+# Robots are only coupled through rows that involve more than one of them
+# (CM/OA edges), so the CBF-QP splits into one independent QP per connected
+# component of the graph that links the variables sharing a row. Only the rows
+# that may bind (screenRows at u_n and the previously active ones) link the
+# variables, otherwise a connected communication graph always gives a single
+# block. Every screened row the solution violates is added back, which merges
+# the blocks it links, and the blocks are solved again until none is violated,
+# so the result is the solution of the full QP.
+
+def qpComponents(A):
+    # Labels of the connected components of the variables (columns) of A and
+    # of the rows (-1 for rows without any nonzero)
+    P = sparse.csr_matrix(A, copy=True)
+    P.eliminate_zeros()
+    P.data[:] = 1
+    num_components, col_labels = connected_components(P.T.dot(P), directed=False)
+
+    row_labels = -np.ones(P.shape[0], dtype=int)
+    nonempty = np.diff(P.indptr) > 0
+    row_labels[nonempty] = col_labels[P.indices[P.indptr[:-1][nonempty]]]
+
+    return num_components, col_labels, row_labels
+
+def _group(labels, num_groups):
+    # Indices of every label value, for labels in range(num_groups)
+    order = np.argsort(labels, kind='stable')
+    counts = np.bincount(labels[labels >= 0], minlength=num_groups)
+    start = np.count_nonzero(labels < 0)
+    return np.split(order[start:], np.cumsum(counts)[:-1])
+
+class DecomposedQPSolver():
+    # Solves every connected component of the CBF-QP as a separate QP and
+    # stitches the results back together. Each block gets its own solver from
+    # solver_factory (warm started as long as the block stays the same). Blocks
+    # with at least parallel_min_rows rows are submitted to the executor if one
+    # is given (any concurrent.futures executor, with a process pool the warm
+    # start state stays in the worker copies). margin is the one of screenRows.
+    def __init__(self, solver_factory=CBFQPSolver, executor=None, parallel_min_rows=32, margin=1., tol=1e-9):
+        self.solver_factory = solver_factory
+        self.executor = executor
+        self.parallel_min_rows = parallel_min_rows
+        self.margin = margin
+        self.tol = tol
+        self.reset()
+
+    def reset(self):
+        self._solvers = {}
+
+        # Previous active rows
+        self.active = []
+        self.m = None
+
+        # Statistics
+        self.solves = 0
+        self.blocks = 0
+        self.max_block = 0
+        self.readded = 0
+
+    def solve(self, u_n, A, b):
+        # Same interface and result as solve_cbf_qp, with the extra field
+        # components (number of independent blocks that were solved)
+        u_n = np.asarray(u_n, dtype=float)
+        A = sparse.csr_matrix(A)
+        b = np.asarray(b, dtype=float)
+        m = len(b)
+        self.solves += 1
+
+        # Rows without any variable can only be checked
+        empty = np.asarray(abs(A).sum(axis=1)).ravel() == 0
+        infeasible = bool(np.any(b[empty] < -self.tol))
+
+        # Rows that may bind and the previously active ones
+        keep = screenRows(u_n, A, b, self.margin) & ~empty
+        was_active = np.zeros(m, dtype=bool)
+        if m == self.m:
+            was_active[self.active] = True
+            keep |= was_active
+
+        nit = 0
+        solved = {}
+        solvers = {}
+        while True:
+            kept = np.flatnonzero(keep)
+            A_kept = A[kept]
+            num_components, col_labels, row_labels = qpComponents(A_kept)
+
+            # Only the components with rows are blocks, the variables without
+            # constraints keep their nominal value
+            block_labels = np.unique(row_labels[row_labels >= 0])
+            relabel = -np.ones(num_components + 1, dtype=int)
+            relabel[block_labels] = np.arange(len(block_labels))
+            cols = _group(relabel[col_labels], len(block_labels))
+            rows = _group(relabel[row_labels], len(block_labels))
+
+            # Nonzeros of every block with their row and column in the block,
+            # the (small) blocks are solved as dense matrices
+            A_kept = A_kept.tocoo()
+            nonzero = A_kept.data != 0
+            entry_rows, entry_cols, entry_data = A_kept.row[nonzero], A_kept.col[nonzero], A_kept.data[nonzero]
+            entries = _group(relabel[row_labels[entry_rows]], len(block_labels))
+            position = np.zeros(max(len(kept), A.shape[1]), dtype=int)
+
+            # Solve the blocks that are new in this partition
+            blocks = []
+            pending = []
+            for k in range(len(block_labels)):
+                rows_k = kept[rows[k]]
+                key = rows_k.tobytes()
+                blocks.append(key)
+                if key in solved:
+                    continue
+
+                # The block solver is kept while the block has the same rows,
+                # a new one is warm started with the rows that were active
+                solver = self._solvers.get(key)
+                if solver is None:
+                    solver = self.solver_factory()
+                    if isinstance(solver, CBFQPSolver):
+                        solver.m = len(rows_k)
+                        solver.active = list(np.flatnonzero(was_active[rows_k]))
+                solvers[key] = solver
+
+                A_k = np.zeros((len(rows_k), len(cols[k])))
+                position[rows[k]] = np.arange(len(rows_k))
+                block_rows = position[entry_rows[entries[k]]]
+                position[cols[k]] = np.arange(len(cols[k]))
+                A_k[block_rows, position[entry_cols[entries[k]]]] = entry_data[entries[k]]
+
+                args = (u_n[cols[k]], A_k, b[rows_k])
+                if self.executor is not None and len(rows_k) >= self.parallel_min_rows:
+                    pending.append((key, rows_k, cols[k], self.executor.submit(solver.solve, *args)))
+                else:
+                    pending.append((key, rows_k, cols[k], solver.solve(*args)))
+                self.max_block = max(self.max_block, len(cols[k]))
+
+            for key, rows_k, cols_k, result in pending:
+                if not isinstance(result, OptimizeResult):
+                    result = result.result()
+                solved[key] = (rows_k, cols_k, result)
+                nit += result.nit
+
+            # Stitch the blocks together
+            u = u_n.copy()
+            lam = np.zeros(m)
+            status = QP_INFEASIBLE if infeasible else QP_SOLVED
+            for key in blocks:
+                rows_k, cols_k, result = solved[key]
+                u[cols_k] = result.x
+                lam[rows_k] = result.lam
+                status = max(status, result.status)
+            if status != QP_SOLVED:
+                break
+            was_active = lam > 0
+
+            # Add back the screened rows that the solution violates
+            violated = ~keep & ~empty & (A.dot(u) + b < -self.tol)
+            if not violated.any():
+                break
+            keep |= violated
+            self.readded += int(np.count_nonzero(violated))
+
+        # Forget the solvers of blocks that disappeared
+        self._solvers = solvers
+        self.blocks += len(blocks)
+
+        active = list(np.flatnonzero(lam > 0))
+        if status == QP_SOLVED:
+            self.active = active
+            self.m = m
+        else:
+            self.active = []
+        result = _qp_result(u, u_n, active, lam[active]/2, nit, status, m)
+        result.components = len(blocks)
+
+        return result
+
+    def stats(self):
+        solves = max(self.solves, 1)
+        return {
+            "solves": self.solves,
+            "mean_blocks": self.blocks/solves,
+            "max_block": self.max_block,
+            "readded": self.readded,
+        }
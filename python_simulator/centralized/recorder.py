@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+# To force int division to floats (for Python 2.7)
+from __future__ import division
+
+import numpy as np
+
+
+## Simulation recorder
+
+# Appending one row DataFrames every time step is quadratic in the length of
+# the run. The recorder instead preallocates one (steps, 1 + columns) array per
+# named channel, with the time in the first column, writes the rows in place and
+# only builds the DataFrames once the simulation is over (pandas is only
+# imported then, so headless runs that save the arrays never load it).
+
+class Recorder():
+    def __init__(self, steps):
+        self.steps = steps
+        self.channels = {}
+
+    def add_channel(self, name, columns, data=None):
+        # columns are the names of the logged values (without the time), data
+        # restores previously recorded rows
+        self.channels[name] = {
+            "columns": ['Time'] + list(columns),
+            "data": np.zeros((self.steps, 1 + len(columns))) if data is None else np.asarray(data),
+            "length": 0 if data is None else len(data),
+        }
+
+    def record(self, name, step, secs, values):
+        # Write the row of time step step
+        channel = self.channels[name]
+        channel["data"][step, 0] = secs
+        channel["data"][step, 1:] = values
+        channel["length"] = max(channel["length"], step + 1)
+
+    def array(self, name):
+        # Recorded rows of a channel (time in the first column)
+        channel = self.channels[name]
+        return channel["data"][:channel["length"]]
+
+    def dataframe(self, name):
+        import pandas as pd
+
+        return pd.DataFrame(self.array(name), columns=self.channels[name]["columns"])
+
+    def dataframes(self):
+        return dict((name, self.dataframe(name)) for name in self.channels)
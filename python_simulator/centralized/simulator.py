@@ -0,0 +1,394 @@
+#!/usr/bin/env python
+#=====================================
+#          Python simulator
+#          mobile 2D robots
+#     Victor Nan Fernandez-Ayala
+#           (vnfa@kth.se)
+#=====================================
+
+# To force int division to floats (for Python 2.7)
+from __future__ import division
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from tqdm import tqdm
+
+from auxiliary import *
+from constraints import *
+from dynamics import makeDynamics, integrate
+from profiler import PhaseProfiler, profileReport
+from qp_solver import *
+from recorder import Recorder
+from state import SwarmState, padAxes, axisColumns
+
+
+## Parameter setup
+
+class SimulationConfig():
+    # Parameters of a simulation run, every one of them can be overridden by
+    # keyword, e.g. SimulationConfig(max_T=10, extra_robot=True)
+    def __init__(self, **params):
+        # Dimensionality of the problem (2 for planar robots, 3 for aerial
+        # robots, the arena and the HuIL input act on x and y)
+        self.dim = 2
+
+        # Window size
+        self.winx = 20
+        self.winy = 20
+
+        # Arena size
+        self.x_max = self.winx-5
+        self.y_max = self.winy-5
+
+        # Robot size/radius (modelled as a circle with a directional arrow)
+        self.r_robot = 0.5
+
+        # Frequency of update of the simulation (in Hz)
+        self.freq = 50
+
+        # Robot dynamics ("single" integrator, "double" integrator tracking the
+        # commanded velocity, "unicycle" or "mecanum" like the Nexus robots) with
+        # their parameters, and integrator of every time step ("euler", "rk4"
+        # or "adaptive")
+        self.dynamics = "single"
+        self.dynamics_params = {}
+        self.integrator = "euler"
+
+        # Maximum time of the simulation (in seconds)
+        self.max_T = 30
+
+        # Ideal formation positions
+        self.formation_positions = [[0, 2], [0, 0], [0, -2], [2, 2], [2, -2]]
+
+        # List of neighbours for each robot
+        self.neighbours = [[2, 4], [1, 3, 4, 5], [2, 5], [1, 2], [2, 3]]
+
+        # CBF Communication maintenance or obstacle avoidance activation
+        # (1 is activated/0 is deactivated)
+        self.cm = 1
+        self.oa = 1
+
+        # Safe distance for communication maintenance and obstacle avoidance
+        self.d_cm = 2
+        self.d_oa = 1.1
+
+        # Linear alpha function with parameter
+        self.alpha = 1
+
+        # Backend of the CBF-QP solver ("active_set", "screened" to leave out the rows
+        # that cannot bind or "admm" for large swarms)
+        self.qp_backend = "active_set"
+        # Solve the independent blocks (connected components) of the CBF-QP separately,
+        # with qp_workers threads for the large blocks (0 solves them in turn)
+        self.qp_decompose = False
+        self.qp_workers = 0
+
+        # Variable to determine if HuIL is active or not
+        # (1 is activated/0 is deactivated) as well as the robot it affects
+        # (None is the last robot)
+        self.huil = 1
+        self.human_robot = None
+
+        # HuIL parameters
+        self.v_huil = 2
+        self.division = 6
+
+        # Parameter to decide if wedge is shown or not
+        self.wedge = False
+
+        # Parameter to decide if Extra robot is shown or not
+        self.extra_robot = False
+
+        # Initial positions (None is random with the given seed) and initial
+        # position for the extra robot
+        self.p0 = None
+        self.seed = None
+        self.huil_p0 = [-5, 20]
+
+        # Show the progress bar and the solver statistics
+        self.verbose = True
+
+        # Time every phase of the simulation step (reported at the end of the run)
+        self.profile = False
+
+        for key, value in params.items():
+            if not hasattr(self, key):
+                raise TypeError("Unknown simulation parameter "+str(key))
+            setattr(self, key, value)
+
+
+## Simulation results
+
+class SimulationResults():
+    # Trajectories and logs of a run. The logged channels are kept as arrays in
+    # log and converted to the usual pandas dataframes on demand.
+    def __init__(self, config, edges, human_robot, cm, p, huil_p, log, qp_stats, profile=None):
+        self.config = config
+        self.edges = edges
+        self.human_robot = human_robot
+        self.cm = cm
+        self.p = p
+        self.huil_p = huil_p
+        self.log = log
+        self.qp_stats = qp_stats
+        # Summary of the step profiler (if enabled)
+        self.profile = profile
+
+    def dataframes(self):
+        # Dataframes df_cbf_cm, df_cbf_oa, df_controller, df_nom_controller,
+        # df_huil_controller, df_cbf_wedge and df_cbf_extra_robot
+        return dict(("df_"+name, df) for name, df in self.log.dataframes().items())
+
+    def save(self, path):
+        # Save the results to a compressed .npz file: the trajectories and the
+        # logged channels as arrays, the rest as json
+        arrays = {"p": self.p, "huil_p": self.huil_p}
+        columns = {}
+        for name in self.log.channels:
+            arrays["log_"+name] = self.log.array(name)
+            columns[name] = self.log.channels[name]["columns"][1:]
+        meta = {
+            "config": vars(self.config),
+            "edges": self.edges,
+            "human_robot": self.human_robot,
+            "cm": self.cm,
+            "qp_stats": self.qp_stats,
+            "profile": self.profile,
+            "columns": columns,
+        }
+        np.savez_compressed(path, meta=json.dumps(meta, default=_json_default), **arrays)
+
+def _json_default(value):
+    # numpy values in the config and the statistics
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return value.item()
+
+def loadResults(path):
+    # SimulationResults saved with SimulationResults.save
+    data = np.load(path)
+    meta = json.loads(str(data["meta"]))
+    log = Recorder(0)
+    for name, columns in meta["columns"].items():
+        log.add_channel(name, columns, data["log_"+name])
+    edges = [tuple(edge) for edge in meta["edges"]]
+
+    return SimulationResults(SimulationConfig(**meta["config"]), edges, meta["human_robot"], meta["cm"],
+                             data["p"], data["huil_p"], log, meta["qp_stats"], meta.get("profile"))
+
+
+## Simulator
+
+class Simulator():
+    def __init__(self, config=None):
+        if config is None:
+            config = SimulationConfig()
+        self.config = config
+        dim = config.dim
+
+        ## Pre-calculations needed for controller and simulation
+
+        # Get the number of robots
+        self.number_robots = number_robots = len(config.formation_positions)
+        self.human_robot = number_robots if config.human_robot is None else config.human_robot
+
+        # Safety check, if wedge or extra_robot is active. cm should not be
+        self.cm = config.cm
+        if config.wedge or config.extra_robot:
+            self.cm = 0
+
+        # Create edge list
+        self.edges = edges = []
+        edge_set = set()
+        # Create (sparse) Laplacian matrix for the graph
+        self.L_G = laplacian(config.neighbours)
+        # Create robot/wedge/extra_robot list for the name of columns
+        self.robot_col = ['Time'] + axisColumns("Robot", number_robots, dim)
+        self.wedge_col = ['Time']
+        self.extra_robot_col = ['Time']
+        for i in range(number_robots):
+            self.wedge_col.append("Robot_Up"+str(i+1))
+            self.wedge_col.append("Robot_Low"+str(i+1))
+            self.extra_robot_col.append("Robot"+str(i+1))
+            for j in config.neighbours[i]:
+                if (i+1,j) not in edge_set and (j,i+1) not in edge_set:
+                    edges.append((i+1,j))
+                    edge_set.add((i+1,j))
+
+        # Create edge list for the name of columns
+        self.edges_col = ['Time']
+        for i in range(len(edges)):
+            self.edges_col.append("Edge"+str(edges[i]))
+
+        # Ideal formation positions (N, dim)
+        self.P_d = np.reshape(config.formation_positions, (number_robots, dim))
+
+        # Register the CBF constraint families of the QP
+        # (CM and OA are always evaluated for logging, but only enter the QP if activated)
+        alpha = config.alpha
+        x_max = config.x_max
+        y_max = config.y_max
+        edge_idx = edgeIndex(edges)
+        self.constraints = CBFConstraintSet(number_robots, dim)
+        self.constraints.register(EdgeCBF("cm", edge_idx, config.d_cm, 1, alpha, dim), active=(self.cm == 1))
+        self.constraints.register(EdgeCBF("oa", edge_idx, config.d_oa, -1, alpha, dim), active=(config.oa == 1))
+        # Safety constraint for arena (as well as wedge shape or extra robot)
+        if config.extra_robot:
+            self.constraints.register(ArenaCBF(number_robots, alpha, x_max, -x_max, y_max, -y_max, dim))
+            self.constraints.register(ExtraRobotCBF(number_robots, alpha, config.d_oa, config.v_huil, config.v_huil, dim))
+        elif config.wedge:
+            self.constraints.register(ArenaCBF(number_robots, alpha, x_max, -x_max, y_max, -y_max, dim))
+            self.constraints.register(WedgeCBF(number_robots, alpha, x_max, y_max, dim))
+
+        # CBF-QP solver warm started from the previous time step
+        if config.qp_backend == "admm":
+            qp_factory = ADMMQPSolver
+        elif config.qp_backend == "screened":
+            qp_factory = ScreenedQPSolver
+        else:
+            qp_factory = CBFQPSolver
+        if config.qp_decompose:
+            self.qp_solver = DecomposedQPSolver(qp_factory)
+        else:
+            self.qp_solver = qp_factory()
+
+        # Robot dynamics model
+        self.dynamics = makeDynamics(config.dynamics, number_robots, dim, **config.dynamics_params)
+
+    def run(self):
+        config = self.config
+        dim = config.dim
+        freq = config.freq
+        alpha = config.alpha
+        number_robots = self.number_robots
+        human_robot = self.human_robot
+
+        ## Simulation loop
+
+        max_time_size = int(config.max_T*freq)
+
+        ## Initialize logging
+
+        #Preallocated log of every channel, converted to pandas dataframes at the end
+        log = Recorder(max_time_size-1)
+        log.add_channel("cbf_cm", self.edges_col[1:])
+        log.add_channel("cbf_oa", self.edges_col[1:])
+        log.add_channel("controller", self.robot_col[1:])
+        log.add_channel("nom_controller", self.robot_col[1:])
+        log.add_channel("huil_controller", self.robot_col[dim*(human_robot-1)+1:dim*human_robot+1])
+        log.add_channel("cbf_wedge", self.wedge_col[1:])
+        log.add_channel("cbf_extra_robot", self.extra_robot_col[1:])
+
+        # Initialize position matrix
+        p = np.zeros((number_robots*dim,max_time_size))
+
+        # Initialize position for extra robot
+        huil_p = np.zeros((dim,max_time_size))
+
+        # Randomize initial position
+        if config.p0 is None:
+            rng = np.random.RandomState(config.seed)
+            p[:,0] = config.x_max*rng.rand(number_robots*dim)-config.x_max/2
+        else:
+            p[:,0] = np.ravel(config.p0)
+
+        # Initial position for extra robot
+        huil_p[:,0] = padAxes(config.huil_p0, dim)
+
+        # Positions of the current step and state of the dynamics model
+        swarm = SwarmState(p[:,0], dim)
+        state = self.dynamics.initialState(swarm.flat)
+
+        self.qp_solver.reset()
+        executor = None
+        if config.qp_decompose and config.qp_workers > 0:
+            executor = ThreadPoolExecutor(config.qp_workers)
+            self.qp_solver.executor = executor
+
+        # Timers of the phases of the step
+        prof = PhaseProfiler(max_time_size-1, config.profile)
+
+        # Start simulation loop
+        steps = range(max_time_size-1)
+        if config.verbose:
+            print("Computing evolution of the system...")
+            steps = tqdm(steps)
+        for i in steps:
+            secs = i/freq
+            prof.start(i)
+
+            # Compute nominal controller - Centralized and Distributed
+            u_nom = formationController(self.L_G, swarm.P, self.P_d)
+            prof.lap("nominal")
+
+            # Add HuIL control
+            if config.extra_robot:
+                u_n = u_nom
+            else:
+                u_n = huilController(u_nom, config.huil, human_robot, i, max_time_size, config.v_huil, config.division)
+            prof.lap("huil")
+
+            # Compute CBF constrained controller (w and w/out arena safety, wedge shape or extra robot) - Centralized and Distributed
+            u, cbf_b = cbfController(swarm.P, u_n.reshape(-1), self.constraints, solver=self.qp_solver, profiler=prof, huil_p=huil_p[:,i])
+            if config.extra_robot:
+                # Save extra robot cbf in log
+                log.record("cbf_extra_robot", i, secs, cbf_b["extra_robot"]/alpha)
+            elif config.wedge:
+                # Save wedge cbf in log
+                log.record("cbf_wedge", i, secs, cbf_b["wedge"]/alpha)
+            prof.lap("logging")
+
+            # Update the system using dynamics
+            state = integrate(self.dynamics, state, u, 1/freq, config.integrator)
+            swarm = SwarmState(self.dynamics.position(state), dim)
+            p[:,i+1] = swarm.flat
+
+            # Update extra robot (if applicable)
+            if config.extra_robot:
+                huil_pdot = extraRobotDynamics(i, max_time_size, config.v_huil, config.division, dim)
+                huil_p[:,i+1] = huil_pdot*(1/freq) + huil_p[:,i]
+            prof.lap("integration")
+
+            # Save data in log
+            # CBF functions
+            log.record("cbf_cm", i, secs, cbf_b["cm"]/alpha)
+            log.record("cbf_oa", i, secs, cbf_b["oa"]/alpha)
+
+            # Final controller
+            log.record("controller", i, secs, u)
+
+            # Nominal controller
+            log.record("nom_controller", i, secs, u_nom.reshape(-1))
+
+            # HuIL controller
+            log.record("huil_controller", i, secs, u_n[human_robot-1])
+            prof.lap("logging")
+
+        if executor is not None:
+            executor.shutdown()
+            self.qp_solver.executor = None
+
+        results = SimulationResults(config, self.edges, human_robot, self.cm, p, huil_p, log, self.qp_solver.stats(),
+                                    prof.summary() if config.profile else None)
+        if config.verbose:
+            printSolverStats(config, results.qp_stats)
+            if config.profile:
+                print(profileReport(results.profile))
+
+        return results
+
+def printSolverStats(config, qp_stats):
+    if config.qp_decompose:
+        print("CBF-QP split into "+str(round(qp_stats["mean_blocks"], 2))+" blocks per solve, the largest with "+
+              str(qp_stats["max_block"])+" variables, "+str(qp_stats["readded"])+" screened rows added back")
+    elif config.qp_backend == "admm":
+        print("CBF-QP ADMM converged in "+str(qp_stats["converged"])+" of "+str(qp_stats["solves"])+" solves with "+
+              str(qp_stats["factorizations"])+" factorizations, "+str(round(qp_stats["mean_iterations"], 2))+" iterations per solve")
+    else:
+        print("CBF-QP warm start reused in "+str(qp_stats["warm_starts"])+" of "+str(qp_stats["solves"])+" solves ("+
+              str(qp_stats["warm_hits"])+" already optimal), "+str(round(qp_stats["mean_iterations"], 2))+" iterations per solve")
+        if config.qp_backend == "screened":
+            print("CBF-QP screening kept "+str(round(100*qp_stats["kept_rate"], 1))+"% of the rows, "+
+                  str(qp_stats["readded"])+" rows added back")
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+
+# To force int division to floats (for Python 2.7)
+from __future__ import division
+
+import numpy as np
+
+
+## Swarm state
+
+# The positions of the robots are kept as an (N, dim) array, one row per robot
+# and one column per axis, so the controllers, the CBFs and the recorders work
+# on whole arrays instead of [2*i:2*i+2] slices. flat is a zero-copy view of
+# the same memory in the [x_1, y_1, x_2, ...] layout of the QP variables, the
+# dynamics models and the logged (N*dim, time) arrays. The robots move in the
+# plane (dim 2) or in space (dim 3, e.g. aerial robots), the arena walls, the
+# HuIL input and the extra robot only act on x and y.
+
+AXES = "xyz"
+
+class SwarmState():
+    def __init__(self, positions, dim=2):
+        self.P = np.array(positions, dtype=float).reshape(-1, dim)
+        self.flat = self.P.reshape(-1)
+        self.number_robots, self.dim = self.P.shape
+
+def robotRows(v, dim):
+    # (..., N, dim) view of per robot values in the flat layout
+    v = np.asarray(v)
+    return v.reshape(v.shape[:-1] + (-1, dim))
+
+def padAxes(v, dim):
+    # Values given for the first axes (x, y) padded with zeros to dim axes
+    v = np.asarray(v, dtype=float)
+    padded = np.zeros(v.shape[:-1] + (dim,))
+    padded[..., :v.shape[-1]] = v
+    return padded
+
+def axisColumns(prefix, number_robots, dim):
+    # Names of the flat layout: prefix_x1, prefix_y1, prefix_x2...
+    return [prefix+"_"+AXES[k]+str(i+1) for i in range(number_robots) for k in range(dim)]
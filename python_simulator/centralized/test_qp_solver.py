@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+
+# To force int division to floats (for Python 2.7)
+from __future__ import division
+
+import numpy as np
+from scipy import sparse
+
+from qp_solver import solve_cbf_qp, ScreenedQPSolver, QP_SOLVED
+
+
+## CBF-QP solver tests
+
+def test_screened_no_active_rows():
+    # Every row is far from binding, so screening keeps none of them and the
+    # solution is u_n (also in the next, warm started, solve)
+    u_n = np.array([0.5, -0.5, 1., 0.])
+    A = sparse.csr_matrix(np.array([[1., 0., -1., 0.], [0., 1., 0., -1.], [1., 0., 0., 0.]]))
+    b = np.array([10., 10., 10.])
+    solver = ScreenedQPSolver()
+    for _ in range(2):
+        result = solver.solve(u_n, A, b)
+        assert result.status == QP_SOLVED
+        assert np.array_equal(result.x, u_n)
+        assert len(result.active) == 0
+
+def test_no_rows():
+    u_n = np.array([1., 2.])
+    result = solve_cbf_qp(u_n, np.zeros((0, 2)), np.zeros(0))
+    assert result.status == QP_SOLVED
+    assert np.array_equal(result.x, u_n)
+    assert np.array_equal(ScreenedQPSolver().solve(u_n, np.zeros((0, 2)), np.zeros(0)).x, u_n)
+
+def test_screened_matches_full_qp():
+    # Random feasible QPs (u = 0 satisfies every row) where only some of the
+    # rows bind
+    rng = np.random.RandomState(0)
+    solver = ScreenedQPSolver()
+    for _ in range(20):
+        u_n = rng.randn(6)
+        A = rng.randn(15, 6)
+        b = rng.uniform(0, 5, 15)
+        expected = solve_cbf_qp(u_n, A, b)
+        result = solver.solve(u_n, A, b)
+        assert result.status == expected.status == QP_SOLVED
+        assert np.allclose(result.x, expected.x, atol=1e-8)
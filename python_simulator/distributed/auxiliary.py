@@ -1,30 +1,65 @@
 import numpy as np
 
+from state import padAxes
+
 
 ## Auxiliary functions
 
-def formationControllerCentralized(L_G, p, p_d):
-    # Create extended laplacian
-    I = np.identity(2)
-    L_ext = np.kron(L_G,I)
+def formationControllerCentralized(L_G, P, P_d):
+    # Compute formation controller -L_G (P - P_d) of all the robots on the
+    # (N, dim) positions, same as the extended laplacian kron(L_G, I) on the
+    # flat layout without building it (L_G can also be sparse)
+    return np.asarray(-L_G.dot(P-P_d))
 
-    # Compute formation controller
-    u = -np.dot(L_ext,p-p_d)
-    return u
+def neighbourIndex(neighbours):
+    # Neighbours of every robot (starting at 1) as padded (N, max neighbours)
+    # zero based indices with a 0/1 mask
+    number_robots = len(neighbours)
+    max_neighbours = max(len(neighbours_i) for neighbours_i in neighbours)
+    nbr = np.zeros((number_robots, max_neighbours), dtype=int)
+    nbr_mask = np.zeros((number_robots, max_neighbours))
+    for i in range(number_robots):
+        nbr[i, :len(neighbours[i])] = np.array(neighbours[i]) - 1
+        nbr_mask[i, :len(neighbours[i])] = 1
+    return nbr, nbr_mask
 
-def formationController(i, number_neighbours, neighbours, p, p_d):
-    u = np.zeros(2)
-    for j in range(number_neighbours):
-        aux_j = neighbours[j]
-        u += p[2*aux_j-2:2*aux_j] - p[2*i:2*i+2] + p_d[2*i:2*i+2] - p_d[2*aux_j-2:2*aux_j]
-    
+def formationController(nbr, nbr_mask, P, P_d):
+    # Formation controller of every robot from its own neighbours on the
+    # (..., N, dim) positions, added neighbour by neighbour
+    u = np.zeros(P.shape)
+    for k in range(nbr.shape[1]):
+        j = nbr[:, k]
+        u += (P[..., j, :] - P + P_d - P_d[j])*nbr_mask[:, k, None]
     return u
 
-def coverageController(p, p_d, gain):
-    u = gain*(np.squeeze(p_d, axis=1) - p)
-    
+def edgeLinks(nbr, nbr_mask, edge_i, edge_j):
+    # Flat neighbour slots (i*max neighbours + k) of every edge as seen by its
+    # tail robot i (slot of j) and by its head robot j (slot of i)
+    tail = edge_i*nbr.shape[1] + np.argmax((nbr[edge_i] == edge_j[:, None])*nbr_mask[edge_i], axis=1)
+    head = edge_j*nbr.shape[1] + np.argmax((nbr[edge_j] == edge_i[:, None])*nbr_mask[edge_j], axis=1)
+    return tail, head
+
+def laplacianViews(nbr_mask, v, v_views):
+    # L_G v of every robot (..., N) from its own v and the v of its neighbours
+    # as it knows them v_views (..., N, max neighbours)
+    return nbr_mask.sum(axis=1)*v - np.sum(v_views*nbr_mask, axis=-1)
+
+def neighbourLaplacian(nbr, nbr_mask, v):
+    # L_G v of every robot (..., N) added over its neighbours, the same sums
+    # the robots do with the values they receive
+    return laplacianViews(nbr_mask, v, v[..., nbr])
+
+def formationControllerViews(nbr, nbr_mask, P, P_views, P_d):
+    # Formation controller of every robot from the positions of its neighbours
+    # as it knows them P_views (N, max neighbours, dim)
+    u = np.zeros(P.shape)
+    for k in range(nbr.shape[1]):
+        u += (P_views[:, k] - P + P_d - P_d[nbr[:, k]])*nbr_mask[:, k, None]
     return u
 
+def coverageController(P, P_d, gain):
+    return gain*(P_d - P)
+
 def huilController(u_nom, huil, human_robot, i, max_time_size, v_huil, division):
     # Leave some time at the start and the end to allow the robots to form
     max_time = max_time_size*(1-2/division)
@@ -50,12 +85,12 @@ def huilController(u_nom, huil, human_robot, i, max_time_size, v_huil, division)
             u_huil_x = 0
             u_huil_y = 0
     
-    u_nom[2*human_robot-2] += u_huil_x
-    u_nom[2*human_robot-1] += u_huil_y
+    u_nom[human_robot-1, 0] += u_huil_x
+    u_nom[human_robot-1, 1] += u_huil_y
 
     return u_nom
 
-def extraRobotDynamics(i, max_time_size, v_huil, division):
+def extraRobotDynamics(i, max_time_size, v_huil, division, dim=2):
     # Leave some time at the start and the end to allow the robots to form
     max_time = max_time_size*(1-2/division)
     i = i - max_time_size/division
@@ -79,7 +114,7 @@ def extraRobotDynamics(i, max_time_size, v_huil, division):
         u_huil_x = 0
         u_huil_y = 0
 
-    return np.array([u_huil_x, u_huil_y])
+    return padAxes([u_huil_x, u_huil_y], dim)
 
 def cbf_h(p_i, p_j, safe_distance, dir):
     # Dir 1 corresponds to CM and -1 to OA
@@ -92,25 +127,160 @@ def cbf_gradh(p_i, p_j, dir):
 def cbf_walls(p, wall):
     return wall[2]*(wall[0]-p[wall[1]])
 
-def systemDynamics(p, u, u_max, u_min):
-    # System dynamics parameters
-    f = np.zeros(len(p))
-    g = np.identity(len(u))
+def edgeIndex(edges):
+    # Zero based tail and head robots of every edge
+    edges = np.array(edges, dtype=int).reshape(-1, 2) - 1
+    return edges[:, 0], edges[:, 1]
 
-    # Bound the control input
-    for i in range(len(u)):
-        u[i] = max(u_min, min(u_max, u[i]))
+class CBFEvaluation():
+    # Values h, gradients and exponential weights exp(-p h) of the CBFs at the
+    # positions x_r (..., N, dim) and extra robot position huil_p of one time
+    # step. Each one is computed on first use and then shared by the
+    # controller and the recorders of that step
+    def __init__(self, x_r, huil_p, p, edge_i, edge_j):
+        self.x_r = x_r
+        self.huil_p = huil_p
+        self.p = p
+        self.edge_i = edge_i
+        self.edge_j = edge_j
+        self.values = {}
 
-    # Update state vector derivative
-    xdot = f+np.dot(g,u)
-    return xdot
+    def _cached(self, key, compute):
+        if key not in self.values:
+            with np.errstate(over="ignore"):
+                self.values[key] = compute()
+        return self.values[key]
 
-def sign_filter(x, a):
-    if x >= a:
-        sol = 1
-    elif x <= a:
-        sol = -1
-    else:
-        sol = 1/a*x
+    def relative(self):
+        # x_i - x_j of every edge (..., E, dim)
+        return self._cached("relative", lambda: self.x_r[..., self.edge_i, :] - self.x_r[..., self.edge_j, :])
+
+    def edge(self, safe_distance, dir):
+        # Pairwise CBF of every edge with its gradient for the tail robot (the
+        # head robot gets minus it). Dir 1 corresponds to CM and -1 to OA
+        def compute():
+            rel = self.relative()
+            h = dir*(safe_distance**2 - np.sum(rel*rel, axis=-1))
+            return h, dir*(-2*rel), np.exp(-self.p*h)
+        return self._cached(("edge", safe_distance, dir), compute)
+
+    def walls(self, walls):
+        # Arena wall CBFs of every robot (..., N, walls), the gradients are constant
+        def compute():
+            h = np.stack([wall[2]*(wall[0]-self.x_r[..., wall[1]]) for wall in walls], axis=-1)
+            return h, np.exp(-self.p*h)
+        return self._cached(("walls", str(walls)), compute)
+
+    def extra(self, safe_distance):
+        # Extra robot avoidance CBF of every robot with its gradient for the
+        # robot (the extra robot gets minus it)
+        def compute():
+            rel = self.x_r - np.expand_dims(self.huil_p, -2)
+            h = -(safe_distance**2 - np.sum(rel*rel, axis=-1))
+            return h, 2*rel, np.exp(-self.p*h)
+        return self._cached(("extra", safe_distance), compute)
 
-    return sol
\ No newline at end of file
+def edgeCBFTerms(cbfs, safe_distance, dir, alpha, num_constraints):
+    # a and b terms of the pairwise CBF of every edge (..., E) from a
+    # CBFEvaluation. a is the term of the tail robot i, the head robot j gets -a
+    _, grad, weight = cbfs.edge(safe_distance, dir)
+    a = np.nan_to_num((-cbfs.p*weight)[..., None]*grad)
+    b = np.nan_to_num(-alpha/2*(1/num_constraints-weight))
+    return a, b
+
+def scatterEdges(a_e, b_e, edge_i, edge_j, number_robots):
+    # Add the edge terms to both robots of every edge: a through the signed
+    # incidence matrix (+ at the tail, - at the head) and b through the unsigned
+    # one, O(E) with np.add.at (leading batch axes are kept)
+    return scatterLinks(a_e, -a_e, b_e, b_e, edge_i, edge_j, number_robots)
+
+def scatterLinks(a_tail, a_head, b_tail, b_head, edge_i, edge_j, number_robots):
+    # Add the terms of every edge as computed by its tail robot and by its head
+    # robot to each of them, first the tails then the heads in edge order
+    a = np.zeros(a_tail.shape[:-2] + (number_robots, a_tail.shape[-1]))
+    b = np.zeros(b_tail.shape[:-1] + (number_robots,))
+    a_r = np.moveaxis(a, -2, 0)
+    b_r = np.moveaxis(b, -1, 0)
+    np.add.at(a_r, edge_i, np.moveaxis(a_tail, -2, 0))
+    np.add.at(a_r, edge_j, np.moveaxis(a_head, -2, 0))
+    np.add.at(b_r, edge_i, np.moveaxis(b_tail, -1, 0))
+    np.add.at(b_r, edge_j, np.moveaxis(b_head, -1, 0))
+    return a, b
+
+def neighbourCBFTerms(P, P_views, nbr_mask, p, safe_distance, dir, alpha, num_constraints):
+    # a and b terms of the pairwise CBFs of every robot with the positions of
+    # its neighbours as it knows them P_views (N, max neighbours, dim), one per
+    # neighbour slot (0 for the empty ones). Dir 1 corresponds to CM and -1 to OA
+    rel = P[:, None, :] - P_views
+    with np.errstate(over="ignore"):
+        h = dir*(safe_distance**2 - np.sum(rel*rel, axis=-1))
+        weight = np.exp(-p*h)
+    a = np.nan_to_num((-p*weight)[..., None]*(dir*(-2*rel)))*nbr_mask[..., None]
+    b = np.nan_to_num(-alpha/2*(1/num_constraints-weight))*nbr_mask
+    return a, b
+
+def wallCBFTerms(cbfs, walls, wall_grad, alpha, num_constraints):
+    # a and b terms of the arena walls of every robot, added over the walls
+    _, weight = cbfs.walls(walls)
+    a = np.zeros(cbfs.x_r.shape)
+    b = np.zeros(cbfs.x_r.shape[:-1])
+    for k in range(len(walls)):
+        a += np.nan_to_num((-cbfs.p*weight[..., k])[..., None]*wall_grad[:, k])
+        b += np.nan_to_num(-alpha*(1/num_constraints-weight[..., k]))
+    return a, b
+
+def extraCBFTerms(cbfs, safe_distance, alpha, num_constraints, v_extra):
+    # a and b terms of the extra robot avoidance of every robot, with the worst
+    # case extra robot speed v_extra
+    _, grad, weight = cbfs.extra(safe_distance)
+    a = np.nan_to_num((-cbfs.p*weight)[..., None]*grad)
+    b = np.nan_to_num(-alpha*(1/num_constraints-weight) - cbfs.p*weight*np.dot(-grad, v_extra))
+    return a, b
+
+SCHEMES = ("slack", "tracking", "centralized", "nominal")
+
+def cbfPortion(scheme, a_zero, au, b, aa, Ly, z1, z2):
+    # Portion c of every robot (..., N) in u = u_n - max(0, c) a, from au = a·u_n,
+    # b and aa = a·a of every robot:
+    #  - "slack": consensus with the slack variables, Ly = L_G y
+    #  - "tracking": dynamic average tracking, p = z1 + d and q = z2 + e with
+    #    d = a·u_n + b and e = a·a, so p/q tracks sum(d)/sum(e)
+    #  - "centralized": the exact portion sum(d)/sum(e) of Eq. (6) for all
+    #  - "nominal": no CBFs
+    # Also returns p and q (zeros but for "tracking")
+    p = np.zeros(au.shape)
+    q = np.zeros(au.shape)
+    with np.errstate(over="ignore", divide="ignore", invalid="ignore"):
+        if scheme == "slack":
+            c = np.where(a_zero, 0., (Ly + au + b)/aa)
+        elif scheme == "tracking":
+            p = z1 + (au + b)
+            q = z2 + aa
+            c = np.where(q == 0, 0., p/q)
+        elif scheme == "centralized":
+            sum_d = np.sum(au + b, axis=-1, keepdims=True)
+            sum_e = np.sum(aa, axis=-1, keepdims=True)
+            c = np.where(sum_e == 0, 0., sum_d/sum_e)*np.ones(au.shape)
+        else:
+            c = np.zeros(au.shape)
+    return c, p, q
+
+def neighbourSign(nbr, nbr_mask, v):
+    # Sum of sign(v_j - v_i) over the neighbours j of every robot i (..., N),
+    # the consensus direction of the average tracking. An undefined difference
+    # (overflowed e = a·a far outside the safe set) does not move the state
+    s = np.zeros(v.shape)
+    with np.errstate(invalid="ignore"):
+        for k in range(nbr.shape[1]):
+            s += np.nan_to_num(np.sign(v[..., nbr[:, k]] - v))*nbr_mask[:, k]
+    return s
+
+def boundInput(u, u_max, u_min):
+    # Bound the control input in place (a nan goes to u_max)
+    u[:] = np.where(u < u_max, u, u_max)
+    u[:] = np.where(u > u_min, u, u_min)
+    return u
+
+def sign_filter(x, a):
+    # Works on scalars and arrays
+    return np.where(x >= a, 1., np.where(x <= a, -1., x/a))
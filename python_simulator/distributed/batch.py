@@ -0,0 +1,247 @@
+#=====================================
+#          Python simulator
+#          mobile 2D robots
+#     Victor Nan Fernandez-Ayala
+#           (vnfa@kth.se)
+#=====================================
+
+import numpy as np
+from tqdm import tqdm
+
+from auxiliary import *
+from dynamics import integrate
+from simulator import SimulationConfig, SimulationResults, Simulator
+
+
+## Batched simulator
+
+# The distributed controller only needs algebra on the positions (the a_i, b_i
+# and c_i of every robot and the y update with L_G and the sign filter), so B
+# independent swarms with the same parameters and graph but different initial
+# positions can be stepped together as (B, N, dim) arrays. The edge terms are
+# computed once per edge for all the swarms and scattered to the robots with
+# the incidence of the graph, and the terms are added in the same order as in
+# Simulator.run, so every swarm follows the trajectory of a single run up to
+# rounding (with extra = 0 the idle extra robot stays at its initial position
+# instead of being logged as zeros).
+
+class BatchResults():
+    # Arrays of B swarms with the batch axis first: (B, time, ...) when the
+    # whole run is recorded, otherwise only the final state, the minimum of
+    # every CBF family and the a = 0 counters of every swarm
+    def __init__(self, config, simulator, **arrays):
+        self.config = config
+        self.simulator = simulator
+        for name, value in arrays.items():
+            setattr(self, name, value)
+
+    def swarm(self, k):
+        # SimulationResults of swarm k, laid out as the ones of Simulator.run
+        sim = self.simulator
+        number_robots = sim.number_robots
+        dim = self.config.dim
+        steps = self.x.shape[1]
+
+        cbf_extra = np.zeros((number_robots*dim, steps-1))
+        cbf_extra[:number_robots] = self.cbf_extra[k].T
+        human_robot = sim.human_robot
+
+        return SimulationResults(self.config,
+            edges=sim.edges, edges_col=sim.edges_col, human_robot=human_robot, huil=sim.huil,
+            x=self.x[k].reshape(steps, -1).T, huil_x=self.huil_x[k].T, y=self.y[k].T, c=self.c[k].T,
+            z1=self.z1[k].T, z2=self.z2[k].T, p_track=self.p_track[k].T, q_track=self.q_track[k].T,
+            a_counter=self.a_counter[k].reshape(-1, 1),
+            cbf_cm=self.cbf_cm[k].T, cbf_oa=self.cbf_oa[k].T,
+            cbf_arena_top=self.cbf_arena[k, :, :, 0].T, cbf_arena_right=self.cbf_arena[k, :, :, 1].T,
+            cbf_arena_bottom=self.cbf_arena[k, :, :, 2].T, cbf_arena_left=self.cbf_arena[k, :, :, 3].T,
+            cbf_extra=cbf_extra,
+            controller=self.controller[k].reshape(steps-1, -1).T,
+            nom_controller=self.nom_controller[k].reshape(steps-1, -1).T,
+            huil_controller=self.nom_controller[k, :, human_robot-1].T)
+
+class BatchSimulator(Simulator):
+    def run(self, x0=None, huil_x0=None, batch=None, record=True):
+        # x0 are the initial positions of every swarm (B, N, dim) and huil_x0
+        # the ones of the extra robot (B, dim) or a single (dim) one for all
+        # of them. Without x0, batch copies of the configured initial positions
+        # are simulated
+        config = self.config
+        dim = config.dim
+        freq = config.freq
+        number_robots = self.number_robots
+        human_robot = self.human_robot
+        walls = self.walls
+        wall_grad = self.wall_grad
+        num_constraints = self.num_constraints
+        cm, oa, arena, extra = config.cm, config.oa, config.arena, config.extra
+        alpha, p, k0, u_max, gains = config.alpha, config.p, config.k0, config.u_max, config.gains
+        d_cm, d_oa, d_extra = self.d_cm, config.d_oa, config.d_extra
+        v_huil = self.v_huil
+
+        # Initial positions
+        default_x0, default_huil_x0 = self.initialPositions()
+        if x0 is None:
+            x0 = np.tile(default_x0.reshape(number_robots, dim), (1 if batch is None else batch, 1, 1))
+        x = np.array(x0, dtype=float).reshape(-1, number_robots, dim)
+        B = len(x)
+        huil_x = np.empty((B, dim))
+        huil_x[:] = default_huil_x0 if huil_x0 is None else huil_x0
+
+        edge_i, edge_j = self.edge_i, self.edge_j
+        x_d = self.x_d
+
+        # Time size
+        max_time_size = int(config.max_T*freq)
+        E = len(edge_i)
+
+        # Recorded arrays (time first while simulating)
+        if record:
+            x_log = np.zeros((max_time_size, B, number_robots, dim))
+            huil_x_log = np.zeros((max_time_size, B, dim))
+            y_log = np.zeros((max_time_size, B, number_robots))
+            c_log = np.zeros((max_time_size-1, B, number_robots))
+            z1_log = np.zeros((max_time_size, B, number_robots))
+            z2_log = np.zeros((max_time_size, B, number_robots))
+            p_log = np.zeros((max_time_size-1, B, number_robots))
+            q_log = np.zeros((max_time_size-1, B, number_robots))
+            controller = np.zeros((max_time_size-1, B, number_robots, dim))
+            nom_controller = np.zeros((max_time_size-1, B, number_robots, dim))
+            cbf_cm_log = np.zeros((max_time_size-1, B, E))
+            cbf_oa_log = np.zeros((max_time_size-1, B, E))
+            cbf_arena_log = np.zeros((max_time_size-1, B, number_robots, len(walls)))
+            cbf_extra_log = np.zeros((max_time_size-1, B, number_robots))
+            x_log[0] = x
+            huil_x_log[0] = huil_x
+        min_h = dict((name, np.full(B, np.inf)) for name in ("cm", "oa", "arena", "extra"))
+
+        # Slack, consensus and average tracking variables, a = 0 counters
+        y = np.zeros((B, number_robots))
+        c = np.zeros((B, number_robots))
+        z1 = np.zeros((B, number_robots))
+        z2 = np.zeros((B, number_robots))
+        p_t = np.zeros((B, number_robots))
+        q_t = np.zeros((B, number_robots))
+        a = np.zeros((B, number_robots, dim))
+        a_zero = np.zeros((B, number_robots), dtype=bool)
+        a_counter = np.zeros((B, number_robots), dtype=int)
+        u = np.zeros((B, number_robots, dim))
+
+        # State of the dynamics model of every swarm
+        state = self.dynamics.initialState(x.reshape(B, -1))
+
+        steps = range(max_time_size-1)
+        if config.verbose:
+            print("Computing evolution of "+str(B)+" swarms...")
+            steps = tqdm(steps)
+        for t in steps:
+            # CBFs of this step, shared by the controller and the recorders
+            cbfs = CBFEvaluation(x, huil_x, p, edge_i, edge_j)
+
+            c[:] = 0
+            if t % self.update_par == 0:
+                # Compute nominal controller - Distributed
+                if config.coverage == 1:
+                    u_nom = coverageController(x, x_d, config.gain)
+                else:
+                    u_nom = formationController(self.nbr, self.nbr_mask, x, x_d)
+
+                # Add HuIL control (the same input for every swarm)
+                if extra != 1:
+                    u_nom += huilController(np.zeros((number_robots, dim)), self.huil, human_robot, t,
+                                            max_time_size, v_huil, config.division)
+                u_n = u_nom
+
+                # Compute CBF constrained controller - Distributed
+                with np.errstate(over="ignore", invalid="ignore"):
+                    # Collective constraints, once per edge and added to both robots
+                    a_cm, b_cm = edgeCBFTerms(cbfs, d_cm, 1, alpha, num_constraints)
+                    a_oa, b_oa = edgeCBFTerms(cbfs, d_oa, -1, alpha, num_constraints)
+                    a, b = scatterEdges(cm*a_cm + oa*a_oa, cm*b_cm + oa*b_oa, edge_i, edge_j, number_robots)
+                    # Individual constraints
+                    a_walls, b_walls = wallCBFTerms(cbfs, walls, wall_grad, alpha, num_constraints)
+                    a += arena*a_walls
+                    b += arena*b_walls
+                    # Extra robot avoidance
+                    a_extra, b_extra = extraCBFTerms(cbfs, d_extra, alpha, num_constraints, self.v_extra)
+                    a += extra*a_extra
+                    b += extra*b_extra
+
+                # Consensus on the constraint (robots with a = 0 keep u_n)
+                a_zero = np.all(a == 0, axis=-1)
+                a_counter += a_zero
+                Ly = neighbourLaplacian(self.nbr, self.nbr_mask, y)
+                with np.errstate(over="ignore", invalid="ignore"):
+                    c, p_t, q_t = cbfPortion(config.scheme, a_zero, np.sum(a*u_n, axis=-1), b, np.sum(a*a, axis=-1), Ly, z1, z2)
+                u = (u_n - np.maximum(0, c)[..., None]*a)*gains
+
+                # Bound the control input
+                boundInput(u, u_max, -u_max)
+
+            # Update the system using dynamics
+            state = integrate(self.dynamics, state, u.reshape(B, -1), 1/freq, config.integrator)
+            x = self.dynamics.position(state).reshape(B, number_robots, dim)
+
+            # Update extra robot (if applicable)
+            if extra == 1:
+                huil_xdot = np.clip(extraRobotDynamics(t, max_time_size, v_huil, config.division, dim), -u_max, u_max)
+                huil_x = huil_xdot*(1/freq) + huil_x
+
+            # Update slack variable
+            if config.scheme == "slack":
+                Lc = neighbourLaplacian(self.nbr, self.nbr_mask, c)
+                y = np.where(a_zero, 0., y - k0*sign_filter(Lc, config.filter_param)*(1/freq))
+
+            # Update average tracking variables
+            if config.scheme == "tracking":
+                z1 = z1 + config.k_track*neighbourSign(self.nbr, self.nbr_mask, p_t)*(1/freq)
+                z2 = z2 + config.k_track*neighbourSign(self.nbr, self.nbr_mask, q_t)*(1/freq)
+
+            # Save CBF functions and the rest
+            h_cm = cbfs.edge(d_cm, 1)[0]
+            h_oa = cbfs.edge(d_oa, -1)[0]
+            h_walls = cbfs.walls(walls)[0]
+            h_extra = cbfs.extra(d_extra)[0]
+            if record:
+                x_log[t+1] = x
+                huil_x_log[t+1] = huil_x
+                y_log[t+1] = y
+                c_log[t] = c
+                z1_log[t+1] = z1
+                z2_log[t+1] = z2
+                p_log[t] = p_t
+                q_log[t] = q_t
+                controller[t] = u
+                nom_controller[t] = u_n
+                cbf_cm_log[t] = h_cm
+                cbf_oa_log[t] = h_oa
+                cbf_arena_log[t] = h_walls
+                cbf_extra_log[t] = h_extra
+            if E > 0:
+                min_h["cm"] = np.minimum(min_h["cm"], h_cm.min(axis=1))
+                min_h["oa"] = np.minimum(min_h["oa"], h_oa.min(axis=1))
+            min_h["arena"] = np.minimum(min_h["arena"], h_walls.min(axis=(1, 2)))
+            min_h["extra"] = np.minimum(min_h["extra"], h_extra.min(axis=1))
+
+        arrays = dict(("min_h_"+name, value) for name, value in min_h.items())
+        if record:
+            arrays.update(x=x_log.swapaxes(0, 1), huil_x=huil_x_log.swapaxes(0, 1), y=y_log.swapaxes(0, 1),
+                          c=c_log.swapaxes(0, 1), z1=z1_log.swapaxes(0, 1), z2=z2_log.swapaxes(0, 1),
+                          p_track=p_log.swapaxes(0, 1), q_track=q_log.swapaxes(0, 1), controller=controller.swapaxes(0, 1),
+                          nom_controller=nom_controller.swapaxes(0, 1),
+                          cbf_cm=cbf_cm_log.swapaxes(0, 1), cbf_oa=cbf_oa_log.swapaxes(0, 1),
+                          cbf_arena=cbf_arena_log.swapaxes(0, 1), cbf_extra=cbf_extra_log.swapaxes(0, 1))
+        return BatchResults(config, self, final_x=x, final_huil_x=huil_x, a_counter=a_counter, **arrays)
+
+
+if __name__ == "__main__":
+    import time
+
+    # Throughput on random initial positions inside the arena
+    config = SimulationConfig(max_T=30, verbose=False)
+    rng = np.random.RandomState(0)
+    for B in [1, 10, 100, 1000]:
+        x0 = rng.uniform(-(config.x_max-1), config.x_max-1, (B, len(config.formation_positions), config.dim))
+        start = time.time()
+        results = BatchSimulator(config).run(x0, record=False)
+        elapsed = time.time() - start
+        print(str(B)+" swarms: "+str(round(elapsed, 2))+" s, "+str(round(B/elapsed, 1))+" swarms/s")
@@ -0,0 +1,205 @@
+import numpy as np
+
+
+## Dynamics models
+
+# Every model keeps the state of all the robots in one vector (with optional
+# leading batch axes) and takes the velocity command of the CBF controller for
+# every robot, u = [u_x1, u_y1, u_x2, ...]. The derivative is computed robot
+# by robot on a (..., N, k) view of the state, never with an N x N input matrix.
+# position() gives the point the controller steers, which is what is logged.
+
+class SingleIntegrator():
+    # p_dot = u
+    def __init__(self, number_robots, dim=2):
+        self.number_robots = number_robots
+        self.dim = dim
+
+    def initialState(self, p0):
+        return np.array(p0, dtype=float)
+
+    def position(self, x):
+        return x
+
+    def f(self, x, u):
+        return u
+
+class DoubleIntegrator():
+    # p_dot = v, v_dot = k_v (u - v): the commanded velocity is tracked by an
+    # acceleration loop, bounded by a_max (None is unbounded). The state is
+    # [p, v] with all the positions first
+    def __init__(self, number_robots, dim=2, k_v=10., a_max=None):
+        self.number_robots = number_robots
+        self.dim = dim
+        self.k_v = k_v
+        self.a_max = a_max
+
+    def initialState(self, p0):
+        p0 = np.array(p0, dtype=float)
+        return np.concatenate((p0, np.zeros_like(p0)), axis=-1)
+
+    def position(self, x):
+        return x[..., :self.number_robots*self.dim]
+
+    def f(self, x, u):
+        n = self.number_robots*self.dim
+        v = x[..., n:]
+        a = self.k_v*(u - v)
+        if self.a_max is not None:
+            a = np.clip(a, -self.a_max, self.a_max)
+        return np.concatenate((v, a), axis=-1)
+
+class Unicycle():
+    # Differential drive robots, state [x, y, theta] per robot. The velocity
+    # command is followed by the point at distance l in front of the wheel axis
+    # (near identity feedback linearization), so that point is the position
+    # seen by the controller. v_max and w_max bound the linear and angular speed
+    def __init__(self, number_robots, dim=2, l=0.1, v_max=None, w_max=None):
+        if dim != 2:
+            raise ValueError("Unicycle robots only move in the plane (dim 2)")
+        self.number_robots = number_robots
+        self.l = l
+        self.v_max = v_max
+        self.w_max = w_max
+
+    def initialState(self, p0):
+        # Heading 0 with the look ahead point at p0
+        p0 = np.array(p0, dtype=float)
+        p = p0.reshape(p0.shape[:-1] + (-1, 2))
+        x = np.zeros(p.shape[:-1] + (3,))
+        x[..., 0] = p[..., 0] - self.l
+        x[..., 1] = p[..., 1]
+        return x.reshape(p0.shape[:-1] + (-1,))
+
+    def position(self, x):
+        s = x.reshape(x.shape[:-1] + (-1, 3))
+        p = s[..., :2] + self.l*np.stack((np.cos(s[..., 2]), np.sin(s[..., 2])), axis=-1)
+        return p.reshape(x.shape[:-1] + (-1,))
+
+    def f(self, x, u):
+        s = x.reshape(x.shape[:-1] + (-1, 3))
+        u = u.reshape(u.shape[:-1] + (-1, 2))
+        cos, sin = np.cos(s[..., 2]), np.sin(s[..., 2])
+        v = cos*u[..., 0] + sin*u[..., 1]
+        w = (-sin*u[..., 0] + cos*u[..., 1])/self.l
+        if self.v_max is not None:
+            v = np.clip(v, -self.v_max, self.v_max)
+        if self.w_max is not None:
+            w = np.clip(w, -self.w_max, self.w_max)
+        return np.stack((v*cos, v*sin, w), axis=-1).reshape(x.shape)
+
+class Mecanum():
+    # Four mecanum wheels like the Nexus robots, state [x, y, theta] per robot.
+    # The velocity command is turned to the body frame while the heading is
+    # held at 0 (k_theta), and when a wheel would exceed w_max (rad/s) the
+    # whole body velocity is scaled down so the robot keeps its direction.
+    # r is the wheel radius and lx, ly half the wheel base and track
+    def __init__(self, number_robots, dim=2, r=0.05, lx=0.15, ly=0.15, w_max=None, k_theta=1.):
+        if dim != 2:
+            raise ValueError("Mecanum robots only move in the plane (dim 2)")
+        self.number_robots = number_robots
+        self.r = r
+        self.lxy = lx + ly
+        self.w_max = w_max
+        self.k_theta = k_theta
+
+    def initialState(self, p0):
+        p0 = np.array(p0, dtype=float)
+        p = p0.reshape(p0.shape[:-1] + (-1, 2))
+        x = np.concatenate((p, np.zeros(p.shape[:-1] + (1,))), axis=-1)
+        return x.reshape(p0.shape[:-1] + (-1,))
+
+    def position(self, x):
+        s = x.reshape(x.shape[:-1] + (-1, 3))
+        return s[..., :2].reshape(x.shape[:-1] + (-1,))
+
+    def f(self, x, u):
+        s = x.reshape(x.shape[:-1] + (-1, 3))
+        u = u.reshape(u.shape[:-1] + (-1, 2))
+        cos, sin = np.cos(s[..., 2]), np.sin(s[..., 2])
+        # Body frame velocity
+        vx = cos*u[..., 0] + sin*u[..., 1]
+        vy = -sin*u[..., 0] + cos*u[..., 1]
+        wz = -self.k_theta*s[..., 2]
+        if self.w_max is not None:
+            # Wheel speeds of the inverse kinematics
+            wheels = np.abs(np.stack((vx - vy - self.lxy*wz, vx + vy + self.lxy*wz,
+                                      vx + vy - self.lxy*wz, vx - vy + self.lxy*wz), axis=-1))/self.r
+            scale = np.minimum(1, self.w_max/np.maximum(wheels.max(axis=-1), 1e-12))
+            vx, vy, wz = scale*vx, scale*vy, scale*wz
+        return np.stack((cos*vx - sin*vy, sin*vx + cos*vy, wz), axis=-1).reshape(x.shape)
+
+DYNAMICS = {"single": SingleIntegrator, "double": DoubleIntegrator, "unicycle": Unicycle, "mecanum": Mecanum}
+
+def makeDynamics(name, number_robots, dim=2, **params):
+    if name not in DYNAMICS:
+        raise ValueError("Unknown dynamics "+str(name)+", use one of "+str(sorted(DYNAMICS)))
+    return DYNAMICS[name](number_robots, dim, **params)
+
+
+## Integrators
+
+# One step of length dt of x_dot = f(x). The control input is held over the
+# step, so for single integrators every method is exact and Euler is enough.
+
+def eulerStep(f, x, dt):
+    return f(x)*dt + x
+
+def rk4Step(f, x, dt):
+    k1 = f(x)
+    k2 = f(x + dt/2*k1)
+    k3 = f(x + dt/2*k2)
+    k4 = f(x + dt*k3)
+    return x + dt/6*(k1 + 2*k2 + 2*k3 + k4)
+
+# Dormand-Prince 5(4) tableau
+_DP_A = [[],
+         [1/5],
+         [3/40, 9/40],
+         [44/45, -56/15, 32/9],
+         [19372/6561, -25360/2187, 64448/6561, -212/729],
+         [9017/3168, -355/33, 46732/5247, 49/176, -5103/18656],
+         [35/384, 0, 500/1113, 125/192, -2187/6784, 11/84]]
+_DP_E = [71/57600, 0, -71/16695, 71/1920, -17253/339200, 22/525, -1/40]
+
+def adaptiveStep(f, x, dt, rtol=1e-6, atol=1e-9, max_substeps=1000):
+    # Dormand-Prince substeps with error control until dt is covered. The
+    # leading axes of x are a batch of states, each one with its own error norm,
+    # step size and time (a state that already covered dt takes h = 0 steps).
+    # A single state is stepped as a batch of one, so the error norm is reduced
+    # the same way and it follows the same steps as in a batch
+    shape = np.shape(x)
+    x = np.array(x, dtype=float).reshape(-1, shape[-1])
+    t = np.zeros(len(x))
+    h = np.full(len(x), float(dt))
+    for _ in range(max_substeps):
+        if np.all(t >= dt):
+            break
+        h = np.minimum(h, dt - t)
+        h_x = h[:, None]
+        k = [f(x)]
+        for a in _DP_A[1:]:
+            k.append(f(x + h_x*sum(a_j*k_j for a_j, k_j in zip(a, k) if a_j != 0)))
+        # The 7th stage is the 5th order solution (first same as last)
+        x_new = x + h_x*sum(a_j*k_j for a_j, k_j in zip(_DP_A[6], k) if a_j != 0)
+        err = h_x*sum(e_j*k_j for e_j, k_j in zip(_DP_E, k) if e_j != 0)
+        scale = atol + rtol*np.maximum(np.abs(x), np.abs(x_new))
+        err_norm = np.sqrt(np.mean((err/scale)**2, axis=-1))
+        accept = err_norm <= 1
+        t = np.where(accept, np.where(h >= dt - t, dt, t + h), t)
+        x = np.where(accept[:, None], x_new, x)
+        # Step size update with the usual safety factor and bounds
+        with np.errstate(divide="ignore"):
+            factor = np.where(err_norm > 0, 0.9*err_norm**(-1/5), 5)
+        h = h*np.clip(factor, 0.2, 5)
+    if np.any(t < dt):
+        raise RuntimeError("Adaptive step did not cover dt = "+str(dt)+" in "+str(max_substeps)+" substeps")
+    return x.reshape(shape)
+
+INTEGRATORS = {"euler": eulerStep, "rk4": rk4Step, "adaptive": adaptiveStep}
+
+def integrate(model, x, u, dt, method="euler"):
+    # State of the model after dt with the control input u held
+    if method not in INTEGRATORS:
+        raise ValueError("Unknown integrator "+str(method)+", use one of "+str(sorted(INTEGRATORS)))
+    return INTEGRATORS[method](lambda s: model.f(s, u), x, dt)
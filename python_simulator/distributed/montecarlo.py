@@ -0,0 +1,95 @@
+#=====================================
+#          Python simulator
+#          mobile 2D robots
+#     Victor Nan Fernandez-Ayala
+#           (vnfa@kth.se)
+#=====================================
+
+import argparse
+import os
+import sys
+
+import numpy as np
+
+from simulator import SimulationConfig, Simulator
+from state import padAxes
+
+# The statistics and the early stopping loop are shared with the other
+# simulator (python_simulator/montecarlo_engine.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import montecarlo_engine
+from montecarlo_engine import reportStatistics, reportFamilies
+
+
+## Monte Carlo safety statistics
+
+# Every run starts from random initial positions with a random HuIL trajectory
+# (start of the extra robot and HuIL speed) drawn from its own seed, so any run can be reproduced on its own.
+# A CBF is violated in a run if it starts satisfied (h >= 0) and later becomes
+# negative, the CBFs that start unsafe are only reflected in the minimum of h.
+
+def sampleScenario(seed, config):
+    # Random initial positions of the robots and the extra robot (on the
+    # ground in 3D) and HuIL speed (between half and all of the configured one)
+    rng = np.random.RandomState(seed)
+    number_robots = len(config.formation_positions)
+    low = padAxes([-(config.x_max-1), -(config.y_max-1)], config.dim)
+    high = padAxes([config.x_max-1, config.y_max-1], config.dim)
+    x0 = rng.uniform(low, high, (number_robots, config.dim))
+    huil_x0 = rng.uniform(low, high)
+    v_huil = config.v_huil*rng.uniform(0.5, 1)
+    return {"x0": x0.ravel(), "huil_x0": huil_x0, "v_huil": v_huil}
+
+def _monteCarloRun(task):
+    # Worker: one run and its minimum CBF values
+    seed, base, tol = task
+    config = SimulationConfig(**base)
+    config.verbose = False
+    for name, value in sampleScenario(seed, config).items():
+        setattr(config, name, value)
+    with np.errstate(all="ignore"):
+        results = Simulator(config).run()
+
+    # Active CBF families as (rows, time) arrays
+    number_robots = len(config.formation_positions)
+    families = {}
+    if config.cm == 1:
+        families["cm"] = results.cbf_cm
+    if config.oa == 1:
+        families["oa"] = results.cbf_oa
+    if config.arena == 1:
+        families["arena"] = np.vstack((results.cbf_arena_top, results.cbf_arena_right,
+                                       results.cbf_arena_bottom, results.cbf_arena_left))
+    if config.extra == 1:
+        families["extra"] = results.cbf_extra[:number_robots]
+
+    row = {"seed": seed}
+    violated = False
+    for family, h in families.items():
+        if h.size == 0:
+            continue
+        row["min_h_"+family] = h.min()
+        violated = violated or bool(np.any((h[:, 0] >= 0) & (h.min(axis=1) < -tol)))
+    row["violation"] = violated
+    row["a_counter"] = int(results.a_counter.sum())
+    return row
+
+def monteCarlo(base=None, **options):
+    # Safety statistics of this simulator with the base parameters, see
+    # montecarlo_engine.monteCarlo for the options
+    return montecarlo_engine.monteCarlo(_monteCarloRun, base, **options)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monte Carlo safety statistics of the distributed CBF simulator")
+    parser.add_argument("--runs", type=int, default=1000, help="maximum number of runs")
+    parser.add_argument("--ci_width", type=float, default=0.05, help="target width of the violation rate interval")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first run")
+    parser.add_argument("--processes", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--max_T", type=float, default=30, help="simulated time of every run")
+    args = parser.parse_args()
+
+    stats, rows = monteCarlo({"max_T": args.max_T}, max_runs=args.runs,
+                             ci_width=args.ci_width, seed=args.seed, processes=args.processes)
+    reportStatistics(stats)
+    reportFamilies(stats)
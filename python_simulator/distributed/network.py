@@ -0,0 +1,313 @@
+#=====================================
+#          Python simulator
+#          mobile 2D robots
+#     Victor Nan Fernandez-Ayala
+#           (vnfa@kth.se)
+#=====================================
+
+import numpy as np
+from tqdm import tqdm
+
+from auxiliary import *
+from dynamics import integrate
+from profiler import PhaseProfiler, profileReport
+from simulator import SimulationResults, Simulator
+from state import SwarmState
+
+
+## Simulated radio links
+
+# Every robot only knows its own position, the extra robot (sensed) and what
+# its neighbours sent over the radio. The links are simulated as discrete
+# events: every message takes its transmission time (size over bandwidth,
+# queued behind the previous ones of the same link), the latency and a random
+# jitter, is lost with probability drop_rate and is delivered at the first
+# step after its arrival. The deliveries are kept in a calendar queue (one
+# bucket per step) and handled for all the links at once, so thousands of
+# robots run in one process. A link whose bandwidth is too low keeps queueing
+# the messages, so their delay grows along the run.
+
+class Channels():
+    # Directed links from robot nbr[i, k] to robot i for every neighbour slot
+    # (flat index i*max neighbours + k), shared by every kind of message
+    def __init__(self, nbr, nbr_mask, freq, latency=0., jitter=0., drop_rate=0., bandwidth=None, seed=0):
+        self.sender = nbr.ravel()
+        self.links = np.flatnonzero(nbr_mask.ravel())
+        self.freq = freq
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.bandwidth = bandwidth
+        self.rng = np.random.RandomState(seed)
+
+        # Time at which every link is free again
+        self.busy = np.zeros(nbr.size)
+
+        # Messages of every kind by delivery step: (links, sent step, payload)
+        self.queue = {}
+
+        # Message counters (stale are the ones older than the last delivered)
+        self.sent = 0
+        self.dropped = 0
+        self.delivered = 0
+        self.stale = 0
+
+    def send(self, kind, t, values, size):
+        # Broadcast values (N, ...) of every robot at step t to its neighbours
+        # as messages of size bytes
+        links = self.links
+        now = t/self.freq
+        self.sent += len(links)
+        if self.bandwidth is None:
+            done = np.full(len(links), now)
+        else:
+            done = np.maximum(now, self.busy[links]) + size/self.bandwidth
+            self.busy[links] = done
+        arrival = done + self.latency + self.jitter*self.rng.uniform(size=len(links))
+        kept = self.rng.uniform(size=len(links)) >= self.drop_rate
+        self.dropped += len(links) - np.count_nonzero(kept)
+
+        # First step at or after the arrival (without delay, this same step)
+        steps = t + np.ceil((arrival[kept] - now)*self.freq - 1e-9).astype(int)
+        links = links[kept]
+        payload = values[self.sender[links]]
+        order = np.argsort(steps, kind="stable")
+        buckets, starts = np.unique(steps[order], return_index=True)
+        queue = self.queue.setdefault(kind, {})
+        for bucket, part in zip(buckets, np.split(order, starts[1:])):
+            queue.setdefault(bucket, []).append((links[part], t, payload[part]))
+
+    def receive(self, kind, t, views, stamps):
+        # Deliver the messages of kind due at step t to views (links, ...),
+        # keeping the newest one of every link and the step it was sent in stamps
+        for links, sent, payload in self.queue.get(kind, {}).pop(t, []):
+            newer = sent >= stamps[links]
+            self.delivered += len(links)
+            self.stale += len(links) - np.count_nonzero(newer)
+            views[links[newer]] = payload[newer]
+            stamps[links[newer]] = sent
+
+    def summary(self):
+        return {"sent": int(self.sent), "dropped": int(self.dropped), "delivered": int(self.delivered),
+                "stale": int(self.stale), "pending": int(self.sent - self.dropped - self.delivered)}
+
+
+## Message passing simulator
+
+# At every control update robot i broadcasts a state message (x_i, y_i),
+# computes a_i, b_i, c_i and u_i from the last messages it received and
+# broadcasts c_i, and every step it updates y_i with the last c_j it received.
+# With ideal links (no latency, jitter, losses or bandwidth limit) every
+# message arrives in the same step and the run is the same as Simulator.run,
+# also for freq_sol < freq. The CBFs are logged at the true positions.
+
+class NetworkSimulator(Simulator):
+    def run(self):
+        config = self.config
+        if config.scheme not in ("slack", "nominal"):
+            raise ValueError("The message passing simulator runs the slack or nominal scheme, not "+str(config.scheme))
+        dim = config.dim
+        freq = config.freq
+        number_robots = self.number_robots
+        human_robot = self.human_robot
+        edges = self.edges
+        edge_i, edge_j = self.edge_i, self.edge_j
+        nbr, nbr_mask = self.nbr, self.nbr_mask
+        walls = self.walls
+        wall_grad = self.wall_grad
+        num_constraints = self.num_constraints
+        x_d = self.x_d
+        cm, oa, arena, extra = config.cm, config.oa, config.arena, config.extra
+        alpha, p, k0, u_max, gains = config.alpha, config.p, config.k0, config.u_max, config.gains
+        d_cm, d_oa, d_extra = self.d_cm, config.d_oa, config.d_extra
+        v_huil = self.v_huil
+        max_neighbours = nbr.shape[1]
+        degree = nbr_mask.sum(axis=1)
+        tail_link, head_link = edgeLinks(nbr, nbr_mask, edge_i, edge_j)
+
+        # Time size
+        max_time_size = int(config.max_T*freq)
+
+        # Setup controller output init output
+        controller = np.zeros((number_robots*dim,max_time_size-1))
+        nom_controller = np.zeros((number_robots*dim,max_time_size-1))
+        huil_controller = np.zeros((dim,max_time_size-1))
+
+        # Setup cbf functions init output
+        cbf_cm = np.zeros((len(edges),max_time_size-1))
+        cbf_oa = np.zeros((len(edges),max_time_size-1))
+        cbf_arena_top = np.zeros((number_robots,max_time_size-1))
+        cbf_arena_right = np.zeros((number_robots,max_time_size-1))
+        cbf_arena_bottom = np.zeros((number_robots,max_time_size-1))
+        cbf_arena_left = np.zeros((number_robots,max_time_size-1))
+        cbf_extra = np.zeros((number_robots*dim,max_time_size-1))
+
+        # Mean age (in seconds) of the neighbour states known by every robot
+        age = np.zeros((number_robots,max_time_size-1))
+
+        ## Simulation loop
+
+        # Initialize position matrix
+        x = np.zeros((number_robots*dim,max_time_size))
+
+        # Initialize position for extra robot
+        huil_x = np.zeros((dim,max_time_size))
+
+        # Initial positions
+        x[:,0], huil_x[:,0] = self.initialPositions()
+
+        # Positions of the current step and state of the dynamics model
+        swarm = SwarmState(x[:,0], dim)
+        state = self.dynamics.initialState(swarm.flat)
+
+        # Initialize slack and consensus variables
+        y = np.zeros((number_robots, max_time_size))
+        c = np.zeros((number_robots, max_time_size-1))
+
+        # Radio links and what every robot knows of its neighbours (one row per
+        # link) with the step it was sent, the initial positions are known
+        links = Channels(nbr, nbr_mask, freq, config.latency, config.jitter, config.drop_rate,
+                         config.bandwidth, config.network_seed)
+        state_views = np.zeros((number_robots*max_neighbours, dim+1))
+        state_views[:, :dim] = swarm.P[nbr.ravel()]
+        state_stamps = np.zeros(number_robots*max_neighbours, dtype=int)
+        c_views = np.zeros(number_robots*max_neighbours)
+        c_stamps = np.zeros(number_robots*max_neighbours, dtype=int)
+        state_size = config.header_size + 8*(dim+1)
+        c_size = config.header_size + 8
+
+        # Create a counter for the times a=0 error happen
+        a_counter = np.zeros((number_robots,1))
+
+        # Timers of the phases of the step
+        prof = PhaseProfiler(max_time_size-1, config.profile)
+
+        # Start simulation loop
+        steps = range(max_time_size-1)
+        if config.verbose:
+            print("Computing evolution of the system over the radio links...")
+            steps = tqdm(steps)
+        for t in steps:
+            prof.start(t)
+
+            # CBFs of this step at the true positions, for the individual
+            # constraints (own position and sensed extra robot) and the recorders
+            cbfs = CBFEvaluation(swarm.P, huil_x[:,t], p, edge_i, edge_j)
+
+            # Exchange the states
+            if t % self.update_par == 0:
+                links.send("state", t, np.column_stack((swarm.P, y[:,t])), state_size)
+            links.receive("state", t, state_views, state_stamps)
+            P_views = state_views[:, :dim].reshape(number_robots, max_neighbours, dim)
+            y_views = state_views[:, dim].reshape(number_robots, max_neighbours)
+            prof.lap("network")
+
+            if t % self.update_par == 0:
+                # Compute nominal controller - Distributed
+                if config.coverage == 1:
+                    u_nom = coverageController(swarm.P, x_d, config.gain)
+                else:
+                    u_nom = formationControllerViews(nbr, nbr_mask, swarm.P, P_views, x_d)
+                prof.lap("nominal")
+
+                # Add HuIL control
+                if extra == 1:
+                    u_n = u_nom
+                else:
+                    u_n = huilController(u_nom, self.huil, human_robot, t, max_time_size, v_huil, config.division)
+                prof.lap("huil")
+
+                # Compute CBF constrained controller - Distributed
+                with np.errstate(over="ignore", invalid="ignore"):
+                    # Collective constraints with the known neighbour positions,
+                    # every robot adds the terms of its links in the same order
+                    # as Simulator.run adds the ones of the edges
+                    a_cm, b_cm = neighbourCBFTerms(swarm.P, P_views, nbr_mask, p, d_cm, 1, alpha, num_constraints)
+                    a_oa, b_oa = neighbourCBFTerms(swarm.P, P_views, nbr_mask, p, d_oa, -1, alpha, num_constraints)
+                    a_links = (cm*a_cm + oa*a_oa).reshape(-1, dim)
+                    b_links = (cm*b_cm + oa*b_oa).reshape(-1)
+                    a, b = scatterLinks(a_links[tail_link], a_links[head_link], b_links[tail_link], b_links[head_link],
+                                        edge_i, edge_j, number_robots)
+                    # Individual constraints
+                    a_walls, b_walls = wallCBFTerms(cbfs, walls, wall_grad, alpha, num_constraints)
+                    a += arena*a_walls
+                    b += arena*b_walls
+                    # Extra robot avoidance
+                    a_extra, b_extra = extraCBFTerms(cbfs, d_extra, alpha, num_constraints, self.v_extra)
+                    a += extra*a_extra
+                    b += extra*b_extra
+                prof.lap("constraints")
+
+                # Robots with a = 0 keep the nominal controller
+                a_zero = np.all(a == 0, axis=1)
+                a_counter[a_zero] += 1
+                Ly = laplacianViews(nbr_mask, y[:,t], y_views)
+                with np.errstate(over="ignore", invalid="ignore"):
+                    c[:,t], _, _ = cbfPortion(config.scheme, a_zero, np.sum(a*u_n, axis=1), b, np.sum(a*a, axis=1), Ly, 0, 0)
+                # Flat layout for the dynamics and the logs
+                u = ((u_n - np.maximum(0,c[:,t])[:,None]*a)*gains).reshape(-1)
+                prof.lap("distributed_update")
+
+                # Exchange the consensus variables
+                links.send("c", t, c[:,t], c_size)
+            links.receive("c", t, c_views, c_stamps)
+            prof.lap("network")
+
+            # Update the system using dynamics
+            boundInput(u, u_max, -u_max)
+            state = integrate(self.dynamics, state, u, 1/freq, config.integrator)
+            swarm = SwarmState(self.dynamics.position(state), dim)
+            x[:,t+1] = swarm.flat
+
+            # Update extra robot (if applicable)
+            if extra == 1:
+                huil_xdot = extraRobotDynamics(t, max_time_size, v_huil, config.division, dim)
+                # Bound the control input
+                for r in range(len(huil_xdot)):
+                    huil_xdot[r] = max(-u_max, min(u_max, huil_xdot[r]))
+                huil_x[:,t+1] = huil_xdot*(1/freq) + huil_x[:,t]
+            prof.lap("integration")
+
+            # Update slack variable with the received c_j. Between the control
+            # updates c is 0 as in Simulator.run, and so are the c_j the robot
+            # uses (the views still hold the ones of the last update)
+            if config.scheme == "slack":
+                if t % self.update_par == 0:
+                    Lc = laplacianViews(nbr_mask, c[:,t], c_views.reshape(number_robots, max_neighbours))
+                else:
+                    Lc = degree*c[:,t]
+                y[:,t+1] = np.where(a_zero, 0, y[:,t] - k0*sign_filter(Lc, config.filter_param)*(1/freq))
+            prof.lap("distributed_update")
+
+            # Save CBF functions
+            cbf_cm[:,t] = cbfs.edge(d_cm, 1)[0]
+            cbf_oa[:,t] = cbfs.edge(d_oa, -1)[0]
+            cbf_arena_top[:,t], cbf_arena_right[:,t], cbf_arena_bottom[:,t], cbf_arena_left[:,t] = cbfs.walls(walls)[0].T
+            cbf_extra[:number_robots,t] = cbfs.extra(d_extra)[0]
+
+            # Save Final, Nominal and HuIL controller
+            controller[:,t] = u
+            nom_controller[:,t] = u_nom.reshape(-1)
+            huil_controller[:,t] = u_n[human_robot-1]
+
+            # Save age of the known neighbour states
+            stamps = state_stamps.reshape(number_robots, max_neighbours)
+            age[:,t] = np.sum((t - stamps)*nbr_mask, axis=1)/np.maximum(degree, 1)/freq
+            prof.lap("logging")
+
+        profile = prof.summary() if config.profile else None
+        messages = links.summary()
+        if config.verbose:
+            for j in range(number_robots):
+                print("For robot "+str(j+1)+", a = 0 has happened "+str(a_counter[j])+" times out of "+str(max_time_size-1)+" iterations")
+            print("Messages: "+", ".join(name+" "+str(value) for name, value in messages.items()))
+            if config.profile:
+                print(profileReport(profile))
+
+        return SimulationResults(config,
+            edges=edges, edges_col=self.edges_col, human_robot=human_robot, huil=self.huil,
+            x=x, huil_x=huil_x, y=y, c=c, a_counter=a_counter,
+            cbf_cm=cbf_cm, cbf_oa=cbf_oa, cbf_arena_top=cbf_arena_top, cbf_arena_right=cbf_arena_right,
+            cbf_arena_bottom=cbf_arena_bottom, cbf_arena_left=cbf_arena_left, cbf_extra=cbf_extra,
+            controller=controller, nom_controller=nom_controller, huil_controller=huil_controller,
+            age=age, messages=messages, profile=profile)
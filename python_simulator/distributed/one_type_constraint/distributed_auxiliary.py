@@ -4,21 +4,31 @@ from scipy.optimize import minimize, LinearConstraint
 
 ## Auxiliary functions
 
-def formationControllerCentralized(L_G, p, p_d):
-    # Create extended laplacian
-    I = np.identity(2)
-    L_ext = np.kron(L_G,I)
+def formationControllerCentralized(L_G, P, P_d):
+    # Compute formation controller -L_G (P - P_d) of all the robots on the
+    # (N, dim) positions, same as the extended laplacian kron(L_G, I) on the
+    # flat layout without building it (L_G can also be sparse)
+    return np.asarray(-L_G.dot(P-P_d))
 
-    # Compute formation controller
-    u = -np.dot(L_ext,p-p_d)
-    return u
+def neighbourIndex(neighbours):
+    # Neighbours of every robot (starting at 1) as padded (N, max neighbours)
+    # zero based indices with a 0/1 mask
+    number_robots = len(neighbours)
+    max_neighbours = max(len(neighbours_i) for neighbours_i in neighbours)
+    nbr = np.zeros((number_robots, max_neighbours), dtype=int)
+    nbr_mask = np.zeros((number_robots, max_neighbours))
+    for i in range(number_robots):
+        nbr[i, :len(neighbours[i])] = np.array(neighbours[i]) - 1
+        nbr_mask[i, :len(neighbours[i])] = 1
+    return nbr, nbr_mask
 
-def formationController(i, number_neighbours, neighbours, p, p_d):
-    u = np.zeros(2)
-    for j in range(number_neighbours):
-        aux_j = neighbours[j]
-        u += p[2*aux_j-2:2*aux_j] - p[2*i:2*i+2] + p_d[2*i:2*i+2] - p_d[2*aux_j-2:2*aux_j]
-    
+def formationController(nbr, nbr_mask, P, P_d):
+    # Formation controller of every robot from its own neighbours on the
+    # (N, dim) positions, added neighbour by neighbour
+    u = np.zeros(P.shape)
+    for k in range(nbr.shape[1]):
+        j = nbr[:, k]
+        u += (P[j] - P + P_d - P_d[j])*nbr_mask[:, k, None]
     return u
 
 def huilController(u_nom, huil, human_robot, i, max_time_size, v_huil, division):
@@ -46,8 +56,8 @@ def huilController(u_nom, huil, human_robot, i, max_time_size, v_huil, division)
             u_huil_x = 0
             u_huil_y = 0
     
-    u_nom[2*human_robot-2] += u_huil_x
-    u_nom[2*human_robot-1] += u_huil_y
+    u_nom[human_robot-1, 0] += u_huil_x
+    u_nom[human_robot-1, 1] += u_huil_y
 
     return u_nom
 
@@ -59,15 +69,34 @@ def cbf_gradh(p_i, p_j, dir):
     # Dir 1 corresponds to CM and -1 to OA
     return dir*(-2*np.array([[p_i[0]-p_j[0]], [p_i[1]-p_j[1]]]))
 
-def systemDynamics(p, u, u_max, u_min):
-    # System dynamics parameters
-    f = np.zeros(len(p))
-    g = np.identity(len(u))
+def edgeIndex(edges):
+    # Zero based tail and head robots of every edge
+    edges = np.array(edges, dtype=int).reshape(-1, 2) - 1
+    return edges[:, 0], edges[:, 1]
 
-    # Bound the control input
-    for i in range(len(u)):
-        u[i] = max(u_min, min(u_max, u[i]))
+def edgeCBFTerms(P, edge_i, edge_j, p, safe_distance, dir, alpha, num_constraints):
+    # a and b terms of the pairwise CBF of every edge added to both of its
+    # robots, (N, dim) and (N), with np.add.at (+ a at the tail, - a at the
+    # head). Dir 1 corresponds to CM and -1 to OA
+    rel = P[edge_i] - P[edge_j]
+    weight = np.exp(-p*dir*(safe_distance**2 - np.sum(rel*rel, axis=1)))
+    a_e = (-p*weight)[:, None]*(dir*(-2*rel))
+    b_e = -alpha/2*(1/num_constraints-weight)
+    a = np.zeros(P.shape)
+    b = np.zeros(len(P))
+    np.add.at(a, edge_i, a_e)
+    np.add.at(a, edge_j, -a_e)
+    np.add.at(b, edge_i, b_e)
+    np.add.at(b, edge_j, b_e)
+    return a, b
+
+def systemDynamics(p, u, u_max, u_min):
+    # Single integrator with the control input bounded (in place)
+    u[:] = np.clip(u, u_min, u_max)
+    return u.copy()
 
-    # Update state vector derivative
-    xdot = f+np.dot(g,u)
-    return xdot
\ No newline at end of file
+def zeroOrderHold(x, xdot, steps, dt):
+    # States after 1, ..., steps time steps of length dt with xdot held (the
+    # same sums as updating x = xdot*dt + x step by step)
+    increments = np.tile(xdot*dt, (steps, 1)).T
+    return np.cumsum(np.hstack((x[:, None], increments)), axis=1)[:, 1:]
\ No newline at end of file
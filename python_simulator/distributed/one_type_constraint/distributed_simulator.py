@@ -12,6 +12,7 @@ from scipy.optimize import minimize, LinearConstraint
 from tqdm import tqdm
 
 from distributed_auxiliary import *
+from state import SwarmState, robotRows
 
 #plt.style.use("seaborn-whitegrid")
 
@@ -119,8 +120,12 @@ cbf_cmoa = np.zeros((len(edges),max_time_size))
 for i in range(len(edges)):
     edges_col.append("Edge"+str(edges[i]))
 
-# Modify ideal formation positions to one column vector
-x_d = np.reshape(formation_positions,number_robots*dim)
+# Ideal formation positions as (N, dim) rows
+x_d = np.reshape(formation_positions,(number_robots,dim))
+
+# Padded neighbour indices and zero based robots of every edge
+nbr, nbr_mask = neighbourIndex(neighbours)
+edge_i, edge_j = edgeIndex(edges)
 
 # Update parameter for multi-freq update
 update_par = freq/freq_sol
@@ -144,88 +149,71 @@ x[:,0] = 0.7*np.ones(number_robots*dim)
 # Initialize slack variable
 y = np.zeros((number_robots,max_time_size))
 
-# Start simulation loop
+# Time steps where the controller is updated, in between the control input,
+# a, b and c are held so the robots move on straight lines and the slack
+# variables change by a constant amount every step
+solve_steps = [t for t in range(max_time_size-1) if t % update_par == 0] + [max_time_size-1]
+
+# Start simulation loop (one iteration per controller update)
 print("Computing evolution of the system...")
-for t in tqdm(range(max_time_size-1)):
+for t, t_next in tqdm(list(zip(solve_steps[:-1], solve_steps[1:]))):
     secs = t/freq
+    steps = t_next - t
+
+    swarm = SwarmState(x[:,t], dim)
+
+    # Compute nominal controller - Distributed
+    u_nom = formationController(nbr, nbr_mask, swarm.P, x_d)
+    #u_nom = formationControllerCentralized(L_G, swarm.P, x_d)
+
+    u_n = huilController(u_nom, huil, human_robot, t, max_time_size, v_huil, division)
+
+    # Compute CBF constrained controller - Distributed
+    a, b = edgeCBFTerms(swarm.P, edge_i, edge_j, p, d, cbf, alpha, len(edges))
+    # Only robots with both components of a non-zero take the CBF portion
+    active = np.all(a != 0, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        c = np.where(active, (np.dot(L_G,y[:,t]) + np.sum(a*u_n, axis=1) + b)/np.sum(a*a, axis=1), 0.)
+    u = u_n - np.maximum(0,c)[:,None]*a
 
-    if t % update_par == 0:
-        # Compute nominal controller - Distributed
-        u_nom = np.zeros((dim*number_robots, 1))
-        for i in range(number_robots):
-            u_nom[2*i:2*i+2] = np.expand_dims(formationController(i, number_neighbours[i], neighbours[i], x[:,t], x_d), axis=1)
-
-        #u_nom = formationControllerCentralized(L_G, x[:,t], x_d)
-        u_nom = np.squeeze(u_nom, axis=1)
-
-        u_n = huilController(u_nom, huil, human_robot, t, max_time_size, v_huil, division)
-
-        # Compute CBF constrained controller - Distributed
-        u = np.zeros((dim*number_robots, 1))
-        c = np.zeros((number_robots, 1))
-        a = np.zeros((dim*number_robots, 1))
-        b = np.zeros((number_robots, 1))
-        for i in range(number_robots):
-
-            for e in range(len(edges)):
-                aux_i = edges[e][0]-1
-                aux_j = edges[e][1]-1
-                x_i = np.array([x[2*aux_i,t],x[2*aux_i+1,t]])
-                x_j = np.array([x[2*aux_j,t],x[2*aux_j+1,t]])
-
-                if i == aux_i:
-                    a[2*i:2*i+2] += -p*np.exp(-p*cbf_h(x_i, x_j, d, cbf))*cbf_gradh(x_i, x_j, cbf)
-                    b[i] += -alpha/2*(1/len(edges)-np.exp(-p*cbf_h(x_i, x_j, d, cbf)))
-                elif i == aux_j:
-                    a[2*i:2*i+2] += -p*np.exp(-p*cbf_h(x_i, x_j, d, cbf))*cbf_gradh(x_j, x_i, cbf)
-                    b[i] += -alpha/2*(1/len(edges)-np.exp(-p*cbf_h(x_i, x_j, d, cbf)))
-                else:
-                    a[2*i:2*i+2] += np.zeros((dim, 1))
-                    b[i] += 0
-
-            u[2*i:2*i+2] = np.expand_dims(u_n[2*i:2*i+2], axis=1)
-            if a[2*i] != 0 and a[2*i+1] != 0:
-                c[i] = (np.dot(L_G[i,:],y[:,t])+np.dot(np.transpose(a[2*i:2*i+2]),u_n[2*i:2*i+2])+b[i])/np.dot(np.transpose(a[2*i:2*i+2]),a[2*i:2*i+2])
-                u[2*i:2*i+2] -=  np.maximum(0,c[i])*a[2*i:2*i+2]
-        
-        #u = u_nom
-        u = np.squeeze(u, axis=1)
-
-    # Update the system using dynamics
+    #u = u_nom
+    u = u.reshape(-1)
+
+    # Update the system using dynamics, integrated at once over the held steps
     xdot = systemDynamics(x[:,t], u, u_max, -u_max)
-    x[:,t+1] = xdot*(1/freq) + x[:,t]
+    x[:,t+1:t_next+1] = zeroOrderHold(x[:,t], xdot, steps, 1/freq)
 
     # Update slack variable
-    for i in range(number_robots):
-        if a[2*i] == 0 and a[2*i+1] == 0:
-            y[i,t+1] = 0
-        else:
-            #y[i,t+1] = y[i,t]
-            y[i,t+1] = y[i,t] - np.transpose(k0*np.sign(np.dot(L_G[i,:],c)))*(1/freq)
-
-
-    # Save CBF functions
-    for e in range(len(edges)):
-        aux_i = edges[e][0]-1
-        aux_j = edges[e][1]-1
-        x_i = np.array([x[2*aux_i,t],x[2*aux_i+1,t]])
-        x_j = np.array([x[2*aux_j,t],x[2*aux_j+1,t]])
-        cbf_cmoa[e,t+1] = cbf_h(x_i, x_j, d, cbf)
-    
+    a_zero = np.all(a == 0, axis=1)
+    ydot = -k0*np.sign(np.dot(L_G,c))
+    #ydot = np.zeros(number_robots)
+    y[:,t+1:t_next+1] = zeroOrderHold(y[:,t], ydot, steps, 1/freq)
+    y[a_zero,t+1:t_next+1] = 0
+
+    # Save CBF functions of every edge from the (steps, E, dim) relative positions
+    P_held = robotRows(x[:,t:t_next].T, dim)
+    rel = P_held[:,edge_i] - P_held[:,edge_j]
+    cbf_cmoa[:,t+1:t_next+1] = cbf*(d**2 - (rel**2).sum(axis=2)).T
+
     # Save Final controller
-    controller[:,t+1] = u
+    controller[:,t+1:t_next+1] = u[:,None]
 
     # Save Nominal controller
-    nom_controller[:,t+1] = u_nom
+    nom_controller[:,t+1:t_next+1] = u_nom.reshape(-1)[:,None]
 
     # Save HuIL controller
-    huil_controller[:,t+1] = np.array([u_n[2*human_robot-2], u_n[2*human_robot-1]])
+    huil_controller[:,t+1:t_next+1] = u_n[human_robot-1][:,None]
 
 
 ## Visualize conditions/plots & trajectories
 
 print("Showing functions evolution...")
 
+# Positions and controllers as (time, N, dim) arrays
+P_log = robotRows(x.T, dim)
+U_log = robotRows(controller.T, dim)
+U_nom_log = robotRows(nom_controller.T, dim)
+
 # Plot y-variables
 fig_y, ax_y = plt.subplots()  # Create a figure and an axes.
 for i in range(number_robots):
@@ -261,21 +249,14 @@ if cbf == -1:
 # Plot the normed difference between nominal and final controller
 fig_norm, ax_norm = plt.subplots()  # Create a figure and an axes.
 ax_norm.axis('on')
+normed_differences = np.sqrt(np.square(U_log - U_nom_log).sum(axis=2))
 for i in range(number_robots):
-    diff_x = controller[2*i,:] - nom_controller[2*i,:]
-    diff_y = controller[2*i+1,:] - nom_controller[2*i+1,:]
-    diff = np.array([diff_x, diff_y])
-    normed_difference = np.sqrt(np.square(diff).sum(axis=0))
-    ax_norm.plot(1/freq*np.arange(max_time_size), normed_difference, label="Robot"+str(i+1))  # Plot some data on the axes.
-
-diff_x = controller[2*human_robot-2,:] - huil_controller[0,:]
-diff_y = controller[2*human_robot-1,:] - huil_controller[1,:]
-diff = np.array([diff_x, diff_y])
-normed_difference = np.sqrt(np.square(diff).sum(axis=0))
+    ax_norm.plot(1/freq*np.arange(max_time_size), normed_differences[:,i], label="Robot"+str(i+1))  # Plot some data on the axes.
+
+normed_difference = np.sqrt(np.square(U_log[:,human_robot-1] - huil_controller.T).sum(axis=1))
 ax_norm.plot(1/freq*np.arange(max_time_size), normed_difference, label="HuILDiff"+str(human_robot))  # Plot some data on the axes.
 
-huil = np.array([huil_controller[0,:], huil_controller[1,:]])
-normed_huil = np.sqrt(np.square(huil).sum(axis=0))
+normed_huil = np.sqrt(np.square(huil_controller).sum(axis=0))
 #ax_norm.plot(1/freq*np.arange(max_time_size), normed_huil, label="HuIL"+str(human_robot))  # Plot some data on the axes.
 
 ax_norm.set_xlabel('time')  # Add an x-label to the axes.
@@ -298,12 +279,10 @@ time_txt = ax.text(0.475, 0.975,'',horizontalalignment='left',verticalalignment=
 # Add initial points
 initials = []
 for i in range(number_robots):
-    initials.append(plt.Circle((x[2*i,0], x[2*i+1,0]), r_robot/2, fc='k', alpha=0.3))
+    initials.append(plt.Circle(tuple(P_log[0,i,:2]), r_robot/2, fc='k', alpha=0.3))
     plt.gca().add_patch(initials[i])
 for i in range(len(edges)):
-    aux_i = edges[i][0]-1
-    aux_j = edges[i][1]-1
-    initials.append(plt.Line2D((x[2*aux_i,0], x[2*aux_j,0]), (x[2*aux_i+1,0], x[2*aux_j+1,0]), lw=0.5, color='k', alpha=0.1))
+    initials.append(plt.Line2D(P_log[0,[edge_i[i],edge_j[i]],0], P_log[0,[edge_i[i],edge_j[i]],1], lw=0.5, color='k', alpha=0.1))
     plt.gca().add_line(initials[number_robots+i])
 
 # Add the limits of the arena
@@ -318,23 +297,19 @@ plt.gca().add_line(arena_limit4)
 
 shapes = []
 for i in range(number_robots):
-    shapes.append(plt.Circle((x[2*i,0], x[2*i+1,0]), r_robot, fc='b'))
+    shapes.append(plt.Circle(tuple(P_log[0,i,:2]), r_robot, fc='b'))
 
 for i in range(len(edges)):
-    aux_i = edges[i][0]-1
-    aux_j = edges[i][1]-1
-    shapes.append(plt.Line2D((x[2*aux_i,0], x[2*aux_j,0]), (x[2*aux_i+1,0], x[2*aux_j+1,0]), lw=0.5, color='b', alpha=0.3))
+    shapes.append(plt.Line2D(P_log[0,[edge_i[i],edge_j[i]],0], P_log[0,[edge_i[i],edge_j[i]],1], lw=0.5, color='b', alpha=0.3))
 
 def init():
     for i in range(number_robots):
-        shapes[i].center = (x[2*i,0], x[2*i+1,0])
+        shapes[i].center = tuple(P_log[0,i,:2])
         ax.add_patch(shapes[i])
 
     for i in range(len(edges)):
-        aux_i = edges[i][0]-1
-        aux_j = edges[i][1]-1
-        shapes[number_robots+i].set_xdata((x[2*aux_i,0], x[2*aux_j,0]))
-        shapes[number_robots+i].set_ydata((x[2*aux_i+1,0], x[2*aux_j+1,0]))
+        shapes[number_robots+i].set_xdata(P_log[0,[edge_i[i],edge_j[i]],0])
+        shapes[number_robots+i].set_ydata(P_log[0,[edge_i[i],edge_j[i]],1])
         ax.add_line(shapes[number_robots+i])
 
     time_txt.set_text('T=0.0 s')
@@ -344,13 +319,11 @@ def init():
 def animate(frame):
 
     for i in range(number_robots):
-        shapes[i].center = (x[2*i,frame], x[2*i+1,frame])
+        shapes[i].center = tuple(P_log[frame,i,:2])
 
     for i in range(len(edges)):
-        aux_i = edges[i][0]-1
-        aux_j = edges[i][1]-1
-        shapes[number_robots+i].set_xdata((x[2*aux_i,frame], x[2*aux_j,frame]))
-        shapes[number_robots+i].set_ydata((x[2*aux_i+1,frame], x[2*aux_j+1,frame]))
+        shapes[number_robots+i].set_xdata(P_log[frame,[edge_i[i],edge_j[i]],0])
+        shapes[number_robots+i].set_ydata(P_log[frame,[edge_i[i],edge_j[i]],1])
 
     secs = frame/freq
     time_txt.set_text('T=%.1d s' % secs)
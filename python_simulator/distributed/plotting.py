@@ -0,0 +1,249 @@
+import numpy as np
+from matplotlib import pyplot as plt
+from matplotlib import animation
+
+from state import robotRows
+
+
+## Visualize conditions/plots & trajectories
+
+def plotResults(results, show=True):
+    # Plot the slack and consensus variables, the CBF functions and the
+    # controllers of a SimulationResults
+    config = results.config
+    edges = results.edges
+    number_robots = len(config.formation_positions)
+    max_time_size = results.x.shape[1]
+    freq = config.freq
+    extra = config.extra
+    human_robot = results.human_robot
+    edges_col = results.edges_col
+    y = results.y
+    c = results.c
+    cbf_cm = results.cbf_cm
+    cbf_oa = results.cbf_oa
+    cbf_arena_top = results.cbf_arena_top
+    cbf_arena_right = results.cbf_arena_right
+    cbf_arena_bottom = results.cbf_arena_bottom
+    cbf_arena_left = results.cbf_arena_left
+    cbf_extra = results.cbf_extra
+    controller = results.controller
+    nom_controller = results.nom_controller
+    huil_controller = results.huil_controller
+    # (time, N, dim) views of the controllers
+    U = robotRows(controller.T, config.dim)
+    U_nom = robotRows(nom_controller.T, config.dim)
+
+    # Plot y-variables
+    fig_y, ax_y = plt.subplots()  # Create a figure and an axes.
+    for i in range(number_robots):
+        ax_y.plot(1/freq*np.arange(max_time_size), y[i,:], label="Robot"+str(i+1))  # Plot some data on the axes.
+    ax_y.set_xlabel('time')  # Add an x-label to the axes.
+    ax_y.set_ylabel('y')  # Add a y-label to the axes.
+    ax_y.set_title("y-variables")  # Add a title to the axes.
+    ax_y.legend(fontsize=13)  # Add a legend.
+    ax_y.axhline(y=0, color='k', lw=1)
+
+    # Plot c-variables
+    fig_c, ax_c = plt.subplots()  # Create a figure and an axes.
+    for i in range(number_robots):
+        ax_c.plot(1/freq*np.arange(max_time_size-1), c[i,:], label="Robot"+str(i+1))  # Plot some data on the axes.
+    ax_c.set_xlabel('time')  # Add an x-label to the axes.
+    ax_c.set_ylabel('c')  # Add a y-label to the axes.
+    ax_c.set_title("c-variables")  # Add a title to the axes.
+    ax_c.legend(fontsize=13)  # Add a legend.
+    ax_c.axhline(y=0, color='k', lw=1)
+
+    # Plot the CBF comunication maintenance
+    fig_cbf_cm, ax_cbf_cm = plt.subplots()  # Create a figure and an axes.
+    for i in range(len(edges)):
+        ax_cbf_cm.plot(1/freq*np.arange(max_time_size-1), cbf_cm[i,:], label=edges_col[i])  # Plot some data on the axes.
+    ax_cbf_cm.set_xlabel('time')  # Add an x-label to the axes.
+    ax_cbf_cm.set_ylabel('h_cm')  # Add a y-label to the axes.
+    ax_cbf_cm.set_title("CBF functions for connectivity maintenance")  # Add a title to the axes.
+    ax_cbf_cm.legend(fontsize=13)  # Add a legend.
+    ax_cbf_cm.axhline(y=0, color='k', lw=1)
+
+    # Plot the CBF obstacle avoidance
+    fig_cbf_oa, ax_cbf_oa = plt.subplots()  # Create a figure and an axes.
+    for i in range(len(edges)):
+        ax_cbf_oa.plot(1/freq*np.arange(max_time_size-1), cbf_oa[i,:], label=edges_col[i])  # Plot some data on the axes.
+    ax_cbf_oa.set_xlabel('time')  # Add an x-label to the axes.
+    ax_cbf_oa.set_ylabel('h_ca')  # Add a y-label to the axes.
+    ax_cbf_oa.set_title("CBF functions for collision avoidance")  # Add a title to the axes.
+    ax_cbf_oa.legend(fontsize=13)  # Add a legend.
+    ax_cbf_oa.axhline(y=0, color='k', lw=1)
+
+    # Plot the CBF arena walls
+    fig_cbf_arena, ax_cbf_arena = plt.subplots()  # Create a figure and an axes.
+    for i in range(number_robots):
+        ax_cbf_arena.plot(1/freq*np.arange(max_time_size-1), cbf_arena_top[i,:], label="RobotTop"+str(i+1))  # Plot some data on the axes.
+        ax_cbf_arena.plot(1/freq*np.arange(max_time_size-1), cbf_arena_right[i,:], label="RobotRight"+str(i+1))  # Plot some data on the axes.
+        ax_cbf_arena.plot(1/freq*np.arange(max_time_size-1), cbf_arena_bottom[i,:], label="RobotBottom"+str(i+1))  # Plot some data on the axes.
+        ax_cbf_arena.plot(1/freq*np.arange(max_time_size-1), cbf_arena_left[i,:], label="RobotLeft"+str(i+1))  # Plot some data on the axes.
+    ax_cbf_arena.set_xlabel('time')  # Add an x-label to the axes.
+    ax_cbf_arena.set_ylabel('h_arena')  # Add a y-label to the axes.
+    ax_cbf_arena.set_title("CBF functions for arena walls")  # Add a title to the axes.
+    ax_cbf_arena.legend(fontsize=13, ncol=4, loc=4)  # Add a legend.
+    ax_cbf_arena.axhline(y=0, color='k', lw=1)
+
+    if extra == 1:
+        # Plot the CBF extra robot
+        fig_cbf_extra, ax_cbf_extra = plt.subplots()  # Create a figure and an axes.
+        ax_cbf_extra.axis('on')
+        for i in range(number_robots):
+            ax_cbf_extra.plot(1/freq*np.arange(max_time_size-1), cbf_extra[i,:], label="Robot"+str(i+1))  # Plot some data on the axes.
+        ax_cbf_extra.set_xlabel('time')  # Add an x-label to the axes.
+        ax_cbf_extra.set_ylabel('h_extra')  # Add a y-label to the axes.
+        ax_cbf_extra.set_title("CBF functions for extra_human")  # Add a title to the axes.
+        ax_cbf_extra.legend(fontsize=13)  # Add a legend.
+        ax_cbf_extra.axhline(y=0, color='k', lw=1)
+
+    # Plot the normed difference between nominal and final controller
+    fig_norm, ax_norm = plt.subplots()  # Create a figure and an axes.
+    ax_norm.axis('on')
+    for i in range(number_robots):
+        normed_difference = np.sqrt(np.square(U[:,i] - U_nom[:,i]).sum(axis=1))
+        ax_norm.plot(1/freq*np.arange(max_time_size-1), normed_difference, label="Robot"+str(i+1))  # Plot some data on the axes.
+
+    if not extra:
+        normed_difference = np.sqrt(np.square(U[:,human_robot-1] - huil_controller.T).sum(axis=1))
+        ax_norm.plot(1/freq*np.arange(max_time_size-1), normed_difference, label="HuILDiff"+str(human_robot))  # Plot some data on the axes.
+
+        normed_huil = np.sqrt(np.square(huil_controller).sum(axis=0))
+        #ax_norm.plot(1/freq*np.arange(max_time_size-1), normed_huil, label="HuIL"+str(human_robot))  # Plot some data on the axes.
+
+    ax_norm.set_xlabel('time')  # Add an x-label to the axes.
+    ax_norm.set_ylabel('|u - u_nom|')  # Add a y-label to the axes.
+    ax_norm.set_title("Normed difference between u and nominal u")  # Add a title to the axes.
+    ax_norm.legend(fontsize=13)  # Add a legend.
+    ax_norm.axhline(y=0, color='k', lw=1)
+
+    # Plot the final controller values
+    fig_contr, ax_contr = plt.subplots()  # Create a figure and an axes.
+    ax_contr.axis('on')
+    for i in range(number_robots):
+        for k in range(config.dim):
+            ax_contr.plot(1/freq*np.arange(max_time_size-1), U[:,i,k], label="Robot"+"XYZ"[k]+str(i+1))  # Plot some data on the axes.
+    ax_contr.set_xlabel('time')  # Add an x-label to the axes.
+    ax_contr.set_ylabel('u')  # Add a y-label to the axes.
+    ax_contr.set_title("Final controller u")  # Add a title to the axes.
+    ax_contr.legend(fontsize=13)  # Add a legend.
+    ax_contr.axhline(y=0, color='k', lw=1)
+
+    if show:
+        plt.show()
+
+
+## Animation
+
+def animateResults(results, show=True):
+    # Animate the trajectories of a SimulationResults (on the x-y plane), the
+    # animation is returned so that it can also be saved
+    config = results.config
+    x = results.x
+    # (time, N, dim) view of the positions
+    X = robotRows(x.T, config.dim)
+    huil_x = results.huil_x
+    edges = results.edges
+    number_robots = len(config.formation_positions)
+    max_time_size = x.shape[1]
+    freq = config.freq
+    extra = config.extra
+    winx = config.winx
+    winy = config.winy
+    x_max = config.x_max
+    y_max = config.y_max
+    r_robot = config.r_robot
+
+    # Start figure and axes with limits
+    fig = plt.figure()
+    ax = plt.axes(xlim=(-winx, winx), ylim=(-winy, winy))
+
+    time_txt = ax.text(0.475, 0.975,'',horizontalalignment='left',verticalalignment='top', transform=ax.transAxes)
+
+    # Add initial points
+    initials = []
+    for i in range(number_robots):
+        initials.append(plt.Circle((X[0,i,0], X[0,i,1]), r_robot/2, fc='k', alpha=0.3))
+        plt.gca().add_patch(initials[i])
+    for i in range(len(edges)):
+        aux_i = edges[i][0]-1
+        aux_j = edges[i][1]-1
+        initials.append(plt.Line2D((X[0,aux_i,0], X[0,aux_j,0]), (X[0,aux_i,1], X[0,aux_j,1]), lw=0.5, color='k', alpha=0.1))
+        plt.gca().add_line(initials[number_robots+i])
+
+    # Add the limits of the arena
+    arena_limit1 = plt.Line2D((-x_max, x_max), (y_max, y_max), lw=2.5, color='r')
+    arena_limit2 = plt.Line2D((-x_max, x_max), (-y_max, -y_max), lw=2.5, color='r')
+    arena_limit3 = plt.Line2D((x_max, x_max), (-y_max, y_max), lw=2.5, color='r')
+    arena_limit4 = plt.Line2D((-x_max, -x_max), (-y_max, y_max), lw=2.5, color='r')
+    plt.gca().add_line(arena_limit1)
+    plt.gca().add_line(arena_limit2)
+    plt.gca().add_line(arena_limit3)
+    plt.gca().add_line(arena_limit4)
+
+    shapes = []
+    for i in range(number_robots):
+        shapes.append(plt.Circle((X[0,i,0], X[0,i,1]), r_robot, fc='b'))
+
+    for i in range(len(edges)):
+        aux_i = edges[i][0]-1
+        aux_j = edges[i][1]-1
+        shapes.append(plt.Line2D((X[0,aux_i,0], X[0,aux_j,0]), (X[0,aux_i,1], X[0,aux_j,1]), lw=0.5, color='b', alpha=0.3))
+
+    if extra == 1:
+        shapes.append(plt.Circle((huil_x[0,0], huil_x[1,0]), r_robot, fc='g'))
+
+    def init():
+        for i in range(number_robots):
+            shapes[i].center = (X[0,i,0], X[0,i,1])
+            ax.add_patch(shapes[i])
+
+        for i in range(len(edges)):
+            aux_i = edges[i][0]-1
+            aux_j = edges[i][1]-1
+            shapes[number_robots+i].set_xdata((X[0,aux_i,0], X[0,aux_j,0]))
+            shapes[number_robots+i].set_ydata((X[0,aux_i,1], X[0,aux_j,1]))
+            ax.add_line(shapes[number_robots+i])
+
+        if extra == 1:
+            shapes[-1].center = (huil_x[0,0], huil_x[1,0])
+            ax.add_patch(shapes[-1])
+
+        time_txt.set_text('T=0.0 s')
+
+        return shapes + [time_txt,]
+
+    def animate(frame):
+
+        for i in range(number_robots):
+            shapes[i].center = (X[frame,i,0], X[frame,i,1])
+
+        for i in range(len(edges)):
+            aux_i = edges[i][0]-1
+            aux_j = edges[i][1]-1
+            shapes[number_robots+i].set_xdata((X[frame,aux_i,0], X[frame,aux_j,0]))
+            shapes[number_robots+i].set_ydata((X[frame,aux_i,1], X[frame,aux_j,1]))
+
+        if extra == 1:
+            shapes[-1].center = (huil_x[0,frame], huil_x[1,frame])
+
+        secs = frame/freq
+        time_txt.set_text('T=%.1d s' % secs)
+
+        return shapes + [time_txt,]
+
+    anim = animation.FuncAnimation(fig, animate, 
+                                   init_func=init, 
+                                   frames=max_time_size, 
+                                   interval=1/freq*1000,
+                                   blit=True,
+                                   repeat=False)
+
+    if show:
+        plt.show()
+
+    #anim.save('animation.mp4', fps=50, extra_args=['-vcodec', 'libx264'])
+
+    return anim
@@ -0,0 +1,74 @@
+from timeit import default_timer as timer
+
+import numpy as np
+
+
+## Step profiler
+
+# The simulation loop calls start(step) at the beginning of every time step
+# and lap(phase) at the end of every phase, which adds the time since the
+# previous call to that phase and step. The times are kept per step in
+# preallocated arrays, so the summary has totals as well as percentiles.
+# A disabled profiler returns right away from both calls.
+
+class PhaseProfiler():
+    def __init__(self, steps, enabled=True):
+        self.steps = steps
+        self.enabled = enabled
+        self.phases = {}
+        self.step = 0
+        self.last = 0.
+
+    def start(self, step):
+        if not self.enabled:
+            return
+        self.step = step
+        self.last = timer()
+
+    def lap(self, phase):
+        if not self.enabled:
+            return
+        now = timer()
+        times = self.phases.get(phase)
+        if times is None:
+            times = self.phases[phase] = np.zeros(self.steps)
+        times[self.step] += now - self.last
+        self.last = now
+
+    def summary(self):
+        # Per phase (in the order they first ran): total time, number of steps
+        # where it ran, mean and 50/90/99 percentiles of those steps and share
+        # of the total step time
+        total = sum(times.sum() for times in self.phases.values())
+        summary = {}
+        for phase, times in self.phases.items():
+            ran = times[times > 0]
+            summary[phase] = {
+                "total": times.sum(),
+                "calls": len(ran),
+                "mean": ran.mean() if len(ran) else 0.,
+                "percentiles": np.percentile(ran, [50, 90, 99]) if len(ran) else np.zeros(3),
+                "share": times.sum()/total if total > 0 else 0.,
+            }
+        return summary
+
+def profileReport(summary, width=40):
+    # Table of the summary and a flame style breakdown of the step, one bar
+    # per phase starting where the previous one ends
+    total = sum(stats["total"] for stats in summary.values())
+    lines = ["Step profile ("+str(round(total, 3))+" s in total)",
+             "%-20s %10s %7s %7s %10s %10s %10s %10s" % ("phase", "total [s]", "share", "calls",
+                                                         "mean [ms]", "p50 [ms]", "p90 [ms]", "p99 [ms]")]
+    for phase, stats in summary.items():
+        p50, p90, p99 = 1e3*np.asarray(stats["percentiles"])
+        lines.append("%-20s %10.3f %6.1f%% %7d %10.3f %10.3f %10.3f %10.3f" % (
+            phase, stats["total"], 100*stats["share"], stats["calls"], 1e3*stats["mean"], p50, p90, p99))
+
+    lines.append("")
+    start = 0.
+    for phase, stats in summary.items():
+        begin = int(round(start*width))
+        end = max(begin + 1, int(round((start + stats["share"])*width))) if stats["share"] > 0 else begin
+        lines.append("|"+" "*begin+"#"*(end - begin)+" "*max(0, width - end)+"| "+phase)
+        start += stats["share"]
+    return "\n".join(lines)
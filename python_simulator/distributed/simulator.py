@@ -0,0 +1,479 @@
+#=====================================
+#          Python simulator
+#          mobile 2D robots
+#     Victor Nan Fernandez-Ayala
+#           (vnfa@kth.se)
+#=====================================
+
+import json
+
+import numpy as np
+from tqdm import tqdm
+
+from auxiliary import *
+from dynamics import makeDynamics, integrate
+from profiler import PhaseProfiler, profileReport
+from state import SwarmState, padAxes
+
+
+## Parameter setup
+
+class SimulationConfig():
+    # Parameters of a simulation run, every one of them can be overridden by
+    # keyword, e.g. SimulationConfig(max_T=10, alpha=20)
+    def __init__(self, **params):
+        # Dimensionality of the problem (2 for planar robots, 3 for aerial
+        # robots, the arena walls and the HuIL input act on x and y)
+        self.dim = 2
+
+        # Window size
+        self.winx = 20
+        self.winy = 20
+
+        # Arena size
+        self.x_max = self.winx-5
+        self.y_max = self.winy-5
+
+        # Robot size/radius (modelled as a circle)
+        self.r_robot = 0.5
+
+        # Frequency of update of the simulation (in Hz)
+        self.freq = 50
+
+        # Frequency of update of the control solver
+        self.freq_sol = 50
+
+        # Robot dynamics ("single" integrator, "double" integrator tracking the
+        # commanded velocity, "unicycle" or "mecanum" like the Nexus robots) with
+        # their parameters, and integrator of every time step ("euler", "rk4"
+        # or "adaptive")
+        self.dynamics = "single"
+        self.dynamics_params = {}
+        self.integrator = "euler"
+
+        # Maximum time of the simulation (in seconds)
+        self.max_T = 30
+
+        # Ideal formation positions
+        self.formation_positions = [[0, 2], [0, 0], [0, -2], [2, 2], [2, -2]]
+
+        # List of neighbours for each robot
+        self.neighbours = [[2, 4], [1, 3, 4, 5], [2, 5], [1, 2, 5], [2, 3, 4]]
+
+        # CBF Communication maintenance or obstacle avoidance activation
+        # (1 is activated/0 is deactivated)
+        self.cm = 1
+        self.oa = 1
+        self.arena = 1
+        self.extra = 1
+        self.coverage = 0
+
+        # Safe distance for communication maintenance and obstacle avoidance
+        self.d_cm = 3
+        self.d_oa = 1.5
+        self.d_extra = 2
+
+        # Linear alpha function with parameter
+        self.alpha = 50
+
+        # Exponential parameter
+        self.p = 1
+
+        # Adaptative law parameter
+        self.k0 = 1
+
+        # Distributed scheme of the CBF controller ("slack" variables y with the
+        # adaptative law, "tracking" dynamic average of the constraint with z1
+        # and z2, the "centralized" portion of Eq. (6) or "nominal" without
+        # CBFs) and gain of the average tracking
+        self.scheme = "slack"
+        self.k_track = 50
+
+        # Maximum value of control input
+        self.u_max = 10
+
+        # Parameter for the sign filter
+        self.filter_param = 5
+
+        # Gains on the control input
+        self.gains = 1
+
+        # Variable to determine if HuIL is active or not
+        # (1 is activated/0 is deactivated) as well as the robot it affects
+        # (None is the last robot)
+        self.huil = 1
+        self.human_robot = None
+
+        # HuIL parameters
+        self.v_huil = 5
+        self.division = 6
+
+        # Gain for the coverage controller
+        self.gain = 10
+
+        # Initial positions (None are the corners and the center of the arena,
+        # for five robots) and initial position for the extra robot (None is
+        # the top left corner)
+        self.x0 = None
+        self.huil_x0 = None
+
+        # Radio links of the message passing simulator (network.py): latency
+        # and jitter (uniform in [0, jitter]) of every message in seconds,
+        # probability of losing it, bandwidth of every link in bytes per
+        # second (None is unlimited), header bytes of every message and seed
+        # of the losses and delays
+        self.latency = 0.
+        self.jitter = 0.
+        self.drop_rate = 0.
+        self.bandwidth = None
+        self.header_size = 32
+        self.network_seed = 0
+
+        # Show the progress bar and the a = 0 counters
+        self.verbose = True
+
+        # Time every phase of the simulation step (reported at the end of the run)
+        self.profile = False
+
+        for key, value in params.items():
+            if not hasattr(self, key):
+                raise TypeError("Unknown simulation parameter "+str(key))
+            setattr(self, key, value)
+
+
+## Simulation results
+
+class SimulationResults():
+    # Trajectories, slack and consensus variables, CBF values and controllers
+    # of a run, all of them as (rows, time) arrays
+    def __init__(self, config, **arrays):
+        self.config = config
+        for name, value in arrays.items():
+            setattr(self, name, value)
+
+    def save(self, path):
+        # Save the results to a compressed .npz file: the arrays as they are,
+        # the config and the rest (edges, human robot...) as json
+        arrays = {}
+        meta = {"config": vars(self.config)}
+        for name, value in vars(self).items():
+            if isinstance(value, np.ndarray):
+                arrays[name] = value
+            elif name != "config":
+                meta[name] = value
+        np.savez_compressed(path, meta=json.dumps(meta, default=_json_default), **arrays)
+
+def _json_default(value):
+    # numpy values in the config
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return value.item()
+
+def loadResults(path):
+    # SimulationResults saved with SimulationResults.save
+    data = np.load(path)
+    meta = json.loads(str(data["meta"]))
+    config = SimulationConfig(**meta.pop("config"))
+    meta["edges"] = [tuple(edge) for edge in meta["edges"]]
+    for name in data.files:
+        if name != "meta":
+            meta[name] = data[name]
+
+    return SimulationResults(config, **meta)
+
+
+## Simulator
+
+class Simulator():
+    def __init__(self, config=None):
+        if config is None:
+            config = SimulationConfig()
+        self.config = config
+        dim = config.dim
+        x_max = config.x_max
+        y_max = config.y_max
+
+        ## Pre-calculations needed for controller and simulation
+
+        # Get the number of robots
+        self.number_robots = number_robots = len(config.formation_positions)
+        self.human_robot = number_robots if config.human_robot is None else config.human_robot
+
+        # Frequency of update of the control solver
+        self.freq_sol = min(config.freq_sol, config.freq)
+
+        if config.scheme not in SCHEMES:
+            raise ValueError("Unknown scheme "+str(config.scheme)+", use one of "+str(list(SCHEMES)))
+
+        # HuIL is always active with the extra robot
+        self.huil = config.huil
+        if config.extra == 1:
+            self.huil = 1
+
+        # Get the number of neighbours for each robot
+        self.number_neighbours = []
+        # Create edge list
+        self.edges = edges = []
+        # Create Laplacian matrix for the graph
+        self.L_G = np.zeros((number_robots,number_robots))
+        for i in range(number_robots):
+            self.number_neighbours.append(len(config.neighbours[i]))
+            self.L_G[i, i] = self.number_neighbours[i]
+            for j in config.neighbours[i]:
+                self.L_G[i, j-1] = -1
+                if (i+1,j) not in edges and (j,i+1) not in edges:
+                    edges.append((i+1,j))
+
+        # Neighbours of every robot as padded indices
+        self.nbr, self.nbr_mask = neighbourIndex(config.neighbours)
+
+        # Robots of every edge (signed incidence of the graph)
+        self.edge_i, self.edge_j = edgeIndex(edges)
+
+        # Create edge list for the name of columns
+        self.edges_col = []
+        for i in range(len(edges)):
+            self.edges_col.append("Edge"+str(edges[i]))
+
+        # Ideal formation positions (N, dim)
+        self.x_d = np.reshape(config.formation_positions, (number_robots, dim))
+
+        # Update parameter for multi-freq update
+        self.update_par = config.freq/self.freq_sol
+
+        # Arena walls constrained (defined as a rectangle clockwise starting from the top)
+        # Defined as [wall size, axis(1 is y, 0 is x), direction(1 is positive, -1 neg)]
+        self.walls = [[y_max, 1, 1], [x_max, 0, 1], [-y_max, 1, -1], [-x_max, 0, -1]]
+        self.wall_grad = np.transpose(padAxes([[0, -1], [-1, 0], [0, 1], [1, 0]], dim))
+
+        # Calculate the number of total constraints
+        self.num_constraints = (config.cm*len(edges)+config.oa*len(edges)+
+                                config.arena*len(self.walls)*number_robots+config.extra*number_robots)
+        if self.num_constraints == 0:
+            self.num_constraints = 1
+
+        # Robot dynamics model
+        self.dynamics = makeDynamics(config.dynamics, number_robots, dim, **config.dynamics_params)
+
+        # Predicted maximum bounded speeds for extra robot
+        self.vxe = config.v_huil
+        self.vye = config.v_huil
+        self.v_extra = padAxes([self.vxe, self.vye], dim)
+
+        # If coverage has been selected calculate the nominal points for each robot
+        self.d_cm = config.d_cm
+        self.v_huil = config.v_huil
+        if config.coverage:
+            self.d_cm = 15
+            self.v_huil = 10
+            # Divide the grid between the number of robots
+            max_x = x_max + 5
+            max_y = y_max + 10
+            division_x1 = number_robots-2
+            division_x2 = number_robots - division_x1
+            x1_division = round(2*max_x/(division_x1+1))
+            x2_division = round(2*max_x/(division_x2+1))
+            # Compute the nominal points
+            self.x_d = np.zeros((number_robots, dim))
+            i = 0
+            while i < number_robots:
+                if i < division_x1:
+                    self.x_d[i, :2] = [(i+1)*x1_division-max_x, round(2*max_y/3)-max_y]
+                else:
+                    self.x_d[i, :2] = [(i+1-division_x1)*x2_division-max_x, 2*round(2*max_y/3)-max_y]
+                i += 1
+
+    def initialPositions(self):
+        # Initial positions of the robots (flat layout) and of the extra robot,
+        # the defaults are on the ground (z = 0) in 3D
+        config = self.config
+        x_max = config.x_max
+        y_max = config.y_max
+        if config.x0 is None:
+            x0 = padAxes([[-(x_max-5), (y_max-5)], [0, 0], [-(x_max-5), -(y_max-5)], [(x_max-5), (y_max-5)], [(x_max-5), -(y_max-5)]], config.dim).ravel()
+        else:
+            x0 = np.ravel(config.x0)
+
+        if config.huil_x0 is None:
+            huil_x0 = padAxes([-(x_max-5), (y_max-1)], config.dim)
+        else:
+            huil_x0 = padAxes(config.huil_x0, config.dim)
+
+        return x0, huil_x0
+
+    def run(self):
+        config = self.config
+        dim = config.dim
+        freq = config.freq
+        number_robots = self.number_robots
+        human_robot = self.human_robot
+        edges = self.edges
+        edge_i, edge_j = self.edge_i, self.edge_j
+        walls = self.walls
+        wall_grad = self.wall_grad
+        num_constraints = self.num_constraints
+        x_d = self.x_d
+        cm, oa, arena, extra = config.cm, config.oa, config.arena, config.extra
+        alpha, p, k0, u_max, gains = config.alpha, config.p, config.k0, config.u_max, config.gains
+        d_cm, d_oa, d_extra = self.d_cm, config.d_oa, config.d_extra
+        v_huil = self.v_huil
+
+        # Time size
+        max_time_size = int(config.max_T*freq)
+
+        # Setup controller output init output
+        controller = np.zeros((number_robots*dim,max_time_size-1))
+        nom_controller = np.zeros((number_robots*dim,max_time_size-1))
+        huil_controller = np.zeros((dim,max_time_size-1))
+
+        # Setup cbf functions init output
+        cbf_cm = np.zeros((len(edges),max_time_size-1))
+        cbf_oa = np.zeros((len(edges),max_time_size-1))
+        cbf_arena_top = np.zeros((number_robots,max_time_size-1))
+        cbf_arena_right = np.zeros((number_robots,max_time_size-1))
+        cbf_arena_bottom = np.zeros((number_robots,max_time_size-1))
+        cbf_arena_left = np.zeros((number_robots,max_time_size-1))
+        cbf_extra = np.zeros((number_robots*dim,max_time_size-1))
+
+        ## Simulation loop
+
+        # Initialize position matrix
+        x = np.zeros((number_robots*dim,max_time_size))
+
+        # Initialize position for extra robot
+        huil_x = np.zeros((dim,max_time_size))
+
+        # Initial positions
+        x[:,0], huil_x[:,0] = self.initialPositions()
+
+        # Positions of the current step and state of the dynamics model
+        swarm = SwarmState(x[:,0], dim)
+        state = self.dynamics.initialState(swarm.flat)
+
+        # Initialize slack and consensus variables
+        y = np.zeros((number_robots, max_time_size))
+        c = np.zeros((number_robots, max_time_size-1))
+
+        # Initialize average tracking variables and the tracked p and q
+        z1 = np.zeros((number_robots, max_time_size))
+        z2 = np.zeros((number_robots, max_time_size))
+        p_track = np.zeros((number_robots, max_time_size-1))
+        q_track = np.zeros((number_robots, max_time_size-1))
+        p_t = np.zeros(number_robots)
+        q_t = np.zeros(number_robots)
+
+        # Create a counter for the times a=0 error happen
+        a_counter = np.zeros((number_robots,1))
+
+        # Timers of the phases of the step
+        prof = PhaseProfiler(max_time_size-1, config.profile)
+
+        # Start simulation loop
+        steps = range(max_time_size-1)
+        if config.verbose:
+            print("Computing evolution of the system...")
+            steps = tqdm(steps)
+        for t in steps:
+            prof.start(t)
+
+            # CBFs of this step, shared by the controller and the recorders
+            cbfs = CBFEvaluation(swarm.P, huil_x[:,t], p, edge_i, edge_j)
+
+            if t % self.update_par == 0:
+                # Compute nominal controller - Distributed
+                if config.coverage == 1:
+                    u_nom = coverageController(swarm.P, x_d, config.gain)
+                else:
+                    u_nom = formationController(self.nbr, self.nbr_mask, swarm.P, x_d)
+                prof.lap("nominal")
+
+                # Add HuIL control
+                if extra == 1:
+                    u_n = u_nom
+                else:
+                    u_n = huilController(u_nom, self.huil, human_robot, t, max_time_size, v_huil, config.division)
+                prof.lap("huil")
+
+                # Compute CBF constrained controller - Distributed
+                with np.errstate(over="ignore", invalid="ignore"):
+                    # Collective constraints, evaluated once per edge and added
+                    # to both of its robots
+                    a_cm, b_cm = edgeCBFTerms(cbfs, d_cm, 1, alpha, num_constraints)
+                    a_oa, b_oa = edgeCBFTerms(cbfs, d_oa, -1, alpha, num_constraints)
+                    a, b = scatterEdges(cm*a_cm + oa*a_oa, cm*b_cm + oa*b_oa, edge_i, edge_j, number_robots)
+                    # Individual constraints
+                    a_walls, b_walls = wallCBFTerms(cbfs, walls, wall_grad, alpha, num_constraints)
+                    a += arena*a_walls
+                    b += arena*b_walls
+                    # Extra robot avoidance
+                    a_extra, b_extra = extraCBFTerms(cbfs, d_extra, alpha, num_constraints, self.v_extra)
+                    a += extra*a_extra
+                    b += extra*b_extra
+                prof.lap("constraints")
+
+                # Robots with a = 0 keep the nominal controller
+                a_zero = np.all(a == 0, axis=1)
+                a_counter[a_zero] += 1
+                with np.errstate(over="ignore", invalid="ignore"):
+                    c[:,t], p_t, q_t = cbfPortion(config.scheme, a_zero, np.sum(a*u_n, axis=1), b, np.sum(a*a, axis=1),
+                                                  neighbourLaplacian(self.nbr, self.nbr_mask, y[:,t]), z1[:,t], z2[:,t])
+                # Flat layout for the dynamics and the logs
+                u = ((u_n - np.maximum(0,c[:,t])[:,None]*a)*gains).reshape(-1)
+                prof.lap("distributed_update")
+
+            # Update the system using dynamics
+            boundInput(u, u_max, -u_max)
+            state = integrate(self.dynamics, state, u, 1/freq, config.integrator)
+            swarm = SwarmState(self.dynamics.position(state), dim)
+            x[:,t+1] = swarm.flat
+
+            # Update extra robot (if applicable)
+            if extra == 1:
+                huil_xdot = extraRobotDynamics(t, max_time_size, v_huil, config.division, dim)
+                # Bound the control input
+                for r in range(len(huil_xdot)):
+                    huil_xdot[r] = max(-u_max, min(u_max, huil_xdot[r]))
+                huil_x[:,t+1] = huil_xdot*(1/freq) + huil_x[:,t]
+            prof.lap("integration")
+
+            # Update slack variable
+            if config.scheme == "slack":
+                y[:,t+1] = np.where(a_zero, 0, y[:,t] - k0*sign_filter(neighbourLaplacian(self.nbr, self.nbr_mask, c[:,t]), config.filter_param)*(1/freq))
+
+            # Update average tracking variables
+            if config.scheme == "tracking":
+                z1[:,t+1] = z1[:,t] + config.k_track*neighbourSign(self.nbr, self.nbr_mask, p_t)*(1/freq)
+                z2[:,t+1] = z2[:,t] + config.k_track*neighbourSign(self.nbr, self.nbr_mask, q_t)*(1/freq)
+                p_track[:,t] = p_t
+                q_track[:,t] = q_t
+            prof.lap("distributed_update")
+
+            # Save CBF functions
+            cbf_cm[:,t] = cbfs.edge(d_cm, 1)[0]
+            cbf_oa[:,t] = cbfs.edge(d_oa, -1)[0]
+            cbf_arena_top[:,t], cbf_arena_right[:,t], cbf_arena_bottom[:,t], cbf_arena_left[:,t] = cbfs.walls(walls)[0].T
+            cbf_extra[:number_robots,t] = cbfs.extra(d_extra)[0]
+
+            # Save Final controller
+            controller[:,t] = u
+
+            # Save Nominal controller
+            nom_controller[:,t] = u_nom.reshape(-1)
+
+            # Save HuIL controller
+            huil_controller[:,t] = u_n[human_robot-1]
+            prof.lap("logging")
+
+        profile = prof.summary() if config.profile else None
+        if config.verbose:
+            for j in range(number_robots):
+                print("For robot "+str(j+1)+", a = 0 has happened "+str(a_counter[j])+" times out of "+str(max_time_size-1)+" iterations")
+            if config.profile:
+                print(profileReport(profile))
+
+        return SimulationResults(config,
+            edges=edges, edges_col=self.edges_col, human_robot=human_robot, huil=self.huil,
+            x=x, huil_x=huil_x, y=y, c=c, z1=z1, z2=z2, p_track=p_track, q_track=q_track, a_counter=a_counter,
+            cbf_cm=cbf_cm, cbf_oa=cbf_oa, cbf_arena_top=cbf_arena_top, cbf_arena_right=cbf_arena_right,
+            cbf_arena_bottom=cbf_arena_bottom, cbf_arena_left=cbf_arena_left, cbf_extra=cbf_extra,
+            controller=controller, nom_controller=nom_controller, huil_controller=huil_controller, profile=profile)
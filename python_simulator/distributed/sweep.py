@@ -0,0 +1,162 @@
+#=====================================
+#          Python simulator
+#          mobile 2D robots
+#     Victor Nan Fernandez-Ayala
+#           (vnfa@kth.se)
+#=====================================
+
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+
+import numpy as np
+
+from simulator import SimulationConfig, Simulator
+
+
+## Parameter sets
+
+def parameterGrid(grid):
+    # Every combination of the values of grid, e.g.
+    # parameterGrid({"alpha": [10, 50], "d_oa": [1, 1.5]}) gives four runs
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*[grid[name] for name in names])]
+
+def randomSamples(ranges, samples, seed=None):
+    # Random parameter sets, a (low, high) tuple is sampled uniformly and a list
+    # is sampled from its elements
+    rng = np.random.RandomState(seed)
+    param_list = []
+    for _ in range(samples):
+        params = {}
+        for name in sorted(ranges):
+            values = ranges[name]
+            if isinstance(values, tuple):
+                params[name] = float(rng.uniform(values[0], values[1]))
+            else:
+                params[name] = values[rng.randint(len(values))]
+        param_list.append(params)
+    return param_list
+
+
+## Metrics
+
+def runMetrics(results, formation_tol=0.1):
+    # Summary of a run: the minimum of every CBF family, the time after which the
+    # formation error stays below formation_tol (nan if it never does), the
+    # control effort (integral of |u|^2) and the number of a = 0 cases
+    config = results.config
+    freq = config.freq
+    number_robots = len(config.formation_positions)
+
+    # Largest error of the relative positions over all the edges
+    x = results.x.reshape(number_robots, config.dim, -1)
+    x_d = np.reshape(config.formation_positions, (number_robots, config.dim))
+    edge_idx = np.array(results.edges, dtype=int) - 1
+    rel = x[edge_idx[:, 0]] - x[edge_idx[:, 1]] - (x_d[edge_idx[:, 0]] - x_d[edge_idx[:, 1]])[:, :, None]
+    error = np.sqrt((rel**2).sum(axis=1)).max(axis=0)
+    outside = np.flatnonzero(error > formation_tol)
+    if len(outside) == 0:
+        time_to_formation = 0.
+    elif outside[-1] == len(error) - 1:
+        time_to_formation = np.nan
+    else:
+        time_to_formation = (outside[-1] + 1)/freq
+
+    cbf_arena = np.vstack((results.cbf_arena_top, results.cbf_arena_right, results.cbf_arena_bottom, results.cbf_arena_left))
+    return {
+        "min_h_cm": results.cbf_cm.min() if results.cbf_cm.size else np.nan,
+        "min_h_oa": results.cbf_oa.min() if results.cbf_oa.size else np.nan,
+        "min_h_arena": cbf_arena.min(),
+        "min_h_extra": results.cbf_extra[:number_robots].min(),
+        "time_to_formation": time_to_formation,
+        "final_formation_error": error[-1],
+        "control_effort": (results.controller**2).sum()/freq,
+        "a_counter": int(results.a_counter.sum()),
+    }
+
+
+## Sweep
+
+def runKey(params):
+    # Identifier of a parameter set, used to skip the finished runs on resume
+    return json.dumps(params, sort_keys=True)
+
+def _sweepRun(task):
+    # Worker: one simulation and its metrics (errors are reported, not raised,
+    # so that one bad parameter set does not stop the sweep)
+    key, params, base, formation_tol = task
+    row = {"run": key}
+    try:
+        options = dict(base)
+        options.update(params)
+        options["verbose"] = False
+        with np.errstate(all="ignore"):
+            results = Simulator(SimulationConfig(**options)).run()
+        row.update(runMetrics(results, formation_tol))
+        row["error"] = ""
+    except Exception as e:
+        row["error"] = repr(e)
+    return row
+
+def runSweep(param_list, base=None, output="sweep.csv", processes=None, formation_tol=0.1):
+    # Run every parameter set of param_list (on top of the base parameters) on
+    # a process pool and append one row of metrics per run to the output csv.
+    # Runs already in the file are skipped, so an interrupted sweep continues
+    # where it stopped. Returns the whole table as a pandas dataframe.
+    base = {} if base is None else base
+    fields = ["run", "min_h_cm", "min_h_oa", "min_h_arena", "min_h_extra", "time_to_formation",
+              "final_formation_error", "control_effort", "a_counter", "error"]
+
+    done = set()
+    if os.path.exists(output):
+        with open(output) as f:
+            done = set(row["run"] for row in csv.DictReader(f))
+    tasks = [(runKey(params), params, base, formation_tol) for params in param_list]
+    tasks = [task for task in tasks if task[0] not in done]
+
+    if tasks:
+        new_file = not os.path.exists(output)
+        with open(output, "a") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            if new_file:
+                writer.writeheader()
+            # One run per task so that no core waits for a long chunk
+            pool = multiprocessing.Pool(processes)
+            try:
+                for row in pool.imap_unordered(_sweepRun, tasks, chunksize=1):
+                    writer.writerow(row)
+                    f.flush()
+            finally:
+                pool.close()
+                pool.join()
+
+    import pandas as pd
+
+    table = pd.read_csv(output)
+    params = pd.DataFrame([json.loads(key) for key in table["run"]])
+    return pd.concat([params, table], axis=1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parameter sweep of the distributed CBF simulator")
+    parser.add_argument("--output", default="sweep.csv", help="csv file with one row per run")
+    parser.add_argument("--processes", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--max_T", type=float, default=30, help="simulated time of every run")
+    args = parser.parse_args()
+
+    # Example grid over the CBF gains and safety distances
+    grid = {
+        "alpha": [10, 50, 100],
+        "p": [0.5, 1],
+        "k0": [0.5, 1],
+        "d_oa": [1, 1.5],
+        "filter_param": [1, 5],
+        "neighbours": [[[2, 4], [1, 3, 4, 5], [2, 5], [1, 2, 5], [2, 3, 4]],
+                       [[2, 4], [1, 3, 4, 5], [2, 5], [1, 2], [2, 3]]],
+    }
+    table = runSweep(parameterGrid(grid), base={"max_T": args.max_T}, output=args.output, processes=args.processes)
+    print(table.to_string())
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from dynamics import makeDynamics, integrate, adaptiveStep
+
+
+## Integrator tests
+
+def test_adaptive_batch_matches_single():
+    # Every state of a batch takes its own substeps, so stepping the batch is
+    # the same as stepping each state alone (even with very different scales)
+    model = makeDynamics("unicycle", 5, 2)
+    rng = np.random.RandomState(0)
+    X = rng.randn(4, 15)
+    X[0] *= 100
+    U = rng.randn(4, 10)
+    U[2] *= 50
+    X_next = integrate(model, X, U, 0.02, "adaptive")
+    for k in range(len(X)):
+        assert np.array_equal(integrate(model, X[k], U[k], 0.02, "adaptive"), X_next[k])
+
+def test_adaptive_max_substeps():
+    model = makeDynamics("unicycle", 5, 2)
+    x = np.zeros(15)
+    u = 1e4*np.ones(10)
+    with pytest.raises(RuntimeError):
+        adaptiveStep(lambda s: model.f(s, u), x, 0.02, max_substeps=3)
@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+
+from network import NetworkSimulator
+from simulator import SimulationConfig, Simulator
+
+
+## Message passing simulator tests
+
+@pytest.mark.parametrize("params", [dict(), dict(freq=100, freq_sol=25), dict(freq=200, freq_sol=50, extra=0)])
+def test_ideal_links_match_simulator(params):
+    # Without latency, jitter, losses or bandwidth limit every message arrives
+    # in the same step, so the run is the one of Simulator.run (also between
+    # the control updates when freq_sol < freq)
+    config = SimulationConfig(max_T=5, verbose=False, **params)
+    expected = Simulator(config).run()
+    result = NetworkSimulator(config).run()
+    for name in ("x", "huil_x", "y", "c", "controller"):
+        assert np.array_equal(getattr(result, name), getattr(expected, name)), name
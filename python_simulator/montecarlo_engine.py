@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+#=====================================
+#          Python simulator
+#          mobile 2D robots
+#     Victor Nan Fernandez-Ayala
+#           (vnfa@kth.se)
+#=====================================
+
+# To force int division to floats (for Python 2.7)
+from __future__ import division
+
+import multiprocessing
+
+import numpy as np
+
+
+## Monte Carlo safety statistics
+
+# Shared by the Monte Carlo studies of the centralized and the distributed
+# simulators (montecarlo.py in each folder). Every simulator gives a run
+# function that simulates the scenario of one seed and returns its row: the
+# seed, whether a CBF was violated ("violation") and the minimum of every
+# active CBF family ("min_h_<family>"). The runs are aggregated in seed order
+# while they finish and the loop stops once the confidence interval of the
+# violation rate is tight enough.
+
+def wilsonInterval(k, n, z=1.96):
+    # Confidence interval of a rate of k successes out of n
+    if n == 0:
+        return 0., 1.
+    rate = k/n
+    center = (rate + z**2/(2*n))/(1 + z**2/n)
+    half = z*np.sqrt(rate*(1 - rate)/n + z**2/(4*n**2))/(1 + z**2/n)
+    return max(0., center - half), min(1., center + half)
+
+def safetyStatistics(rows, z=1.96):
+    # Aggregated statistics of the runs so far
+    n = len(rows)
+    k = sum(row["violation"] for row in rows)
+    low, high = wilsonInterval(k, n, z)
+    stats = {"runs": n, "violations": k, "violation_rate": k/max(n, 1), "violation_ci": (low, high)}
+    families = sorted(set(name for row in rows for name in row if name.startswith("min_h_")))
+    for name in families:
+        values = np.array([row[name] for row in rows if name in row])
+        stats[name] = {
+            "worst": values.min(),
+            "mean": values.mean(),
+            "mean_ci": z*values.std(ddof=1)/np.sqrt(len(values)) if len(values) > 1 else np.inf,
+            "percentiles": np.percentile(values, [1, 5, 50, 95]),
+        }
+    return stats
+
+def reportStatistics(stats):
+    low, high = stats["violation_ci"]
+    print("Runs "+str(stats["runs"])+": violation rate "+str(round(stats["violation_rate"], 4))+
+          " ["+str(round(low, 4))+", "+str(round(high, 4))+"]")
+
+def reportFamilies(stats):
+    for name in sorted(stats):
+        if name.startswith("min_h_"):
+            print(name+": worst "+str(stats[name]["worst"])+", mean "+str(stats[name]["mean"])+
+                  " +- "+str(stats[name]["mean_ci"])+", percentiles (1, 5, 50, 95) "+str(stats[name]["percentiles"]))
+
+def monteCarlo(run, base=None, max_runs=1000, min_runs=30, ci_width=0.05, seed=0, processes=None,
+               tol=1e-6, report_every=10, callback=reportStatistics):
+    # Run the scenarios seed, seed+1, ... with run((seed, base, tol)) (a module
+    # level function, so the workers can unpickle it) on a process pool until
+    # the violation rate confidence interval is narrower than ci_width (after
+    # at least min_runs runs) or max_runs runs are done. callback gets the
+    # statistics every report_every runs. Returns the final statistics and the
+    # rows of every run.
+    base = {} if base is None else base
+    tasks = [(s, base, tol) for s in range(seed, seed + max_runs)]
+    rows = []
+    pool = multiprocessing.Pool(processes)
+    try:
+        for row in pool.imap(run, tasks, chunksize=1):
+            rows.append(row)
+            n = len(rows)
+            if callback is not None and n % report_every == 0:
+                callback(safetyStatistics(rows))
+            low, high = wilsonInterval(sum(r["violation"] for r in rows), n)
+            if n >= min_runs and high - low <= ci_width:
+                break
+    finally:
+        pool.terminate()
+        pool.join()
+
+    return safetyStatistics(rows), rows
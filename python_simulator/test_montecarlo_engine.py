@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+
+# To force int division to floats (for Python 2.7)
+from __future__ import division
+
+import numpy as np
+
+from montecarlo_engine import wilsonInterval, safetyStatistics, monteCarlo
+
+
+## Monte Carlo engine tests
+
+def _fakeRun(task):
+    # Violation every fourth seed, the minimum of h is the seed
+    seed, base, tol = task
+    return {"seed": seed, "violation": seed % 4 == 0, "min_h_cm": float(seed)}
+
+def test_wilson_interval():
+    assert wilsonInterval(0, 0) == (0., 1.)
+    low, high = wilsonInterval(5, 100)
+    assert low < 0.05 < high
+    assert wilsonInterval(0, 1000)[0] == 0.
+
+def test_safety_statistics():
+    stats = safetyStatistics([_fakeRun((s, {}, 0)) for s in range(8)])
+    assert stats["runs"] == 8 and stats["violations"] == 2
+    assert stats["min_h_cm"]["worst"] == 0. and stats["min_h_cm"]["mean"] == 3.5
+
+def test_early_stopping():
+    # The loop stops at the first run count past min_runs with a narrow enough
+    # interval and keeps the rows in seed order
+    stats, rows = monteCarlo(_fakeRun, max_runs=400, min_runs=10, ci_width=0.2, processes=2, callback=None)
+    n = len(rows)
+    assert [row["seed"] for row in rows] == list(range(n))
+    low, high = wilsonInterval(stats["violations"], n)
+    assert n >= 10 and high - low <= 0.2
+    previous = wilsonInterval(sum(row["violation"] for row in rows[:-1]), n-1)
+    assert n == 10 or previous[1] - previous[0] > 0.2
+    assert np.isclose(stats["violation_rate"], stats["violations"]/n)